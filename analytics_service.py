@@ -0,0 +1,206 @@
+"""
+Attendance analytics and at-risk student detection
+
+A class's attendance is loaded into a dense students x dates NumPy matrix
+of int8 status codes (models.STATUS_CODES, 0 where a student has no
+record), with one column per date the class has attendance. Every metric is
+computed over the whole matrix at once instead of cell by cell:
+
+    percentage          Present / class dates, as in the exports
+    rate_7, rate_30     the same over the dates within the last 7 and 30
+                        days up to the class's latest date
+    longest/current     longest run of consecutive Absent dates, and the
+    absence streak      run still open at the latest date
+
+A student is at risk when their percentage or 30-day rate is below the
+threshold (AT_RISK_THRESHOLD, 75% by default), or when their current
+absence streak reaches AT_RISK_ABSENCE_STREAK dates. Requires numpy.
+"""
+import logging
+from datetime import date
+from database import db
+from models import Class, Student, Attendance, NO_RECORD, STATUS_CODES
+from sqlalchemy import select
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    logging.warning("Attendance analytics not available - numpy required")
+    NUMPY_AVAILABLE = False
+
+DEFAULT_AT_RISK_THRESHOLD = 75.0  # percent
+DEFAULT_AT_RISK_ABSENCE_STREAK = 3  # consecutive class dates
+ROLLING_WINDOWS = (7, 30)  # days
+
+def load_status_matrices(teacher_id, class_id=None, start_date=None, end_date=None):
+    """
+    Status matrix of each of a teacher's classes, in three queries
+
+    Returns a list of dictionaries, one per class ordered by name, with the
+    class, its students ordered by name, the sorted dates with attendance
+    and the int8 matrix (students x dates).
+    """
+    class_query = select(Class).where(Class.teacher_id == teacher_id).order_by(Class.name, Class.id)
+    student_query = select(Student.id, Student.class_id, Student.student_id, Student.name, Student.email).join(
+        Class, Class.id == Student.class_id
+    ).where(Class.teacher_id == teacher_id).order_by(Student.name, Student.id)
+    attendance_query = select(Attendance.class_id, Attendance.student_id, Attendance.date, Attendance.status).join(
+        Class, Class.id == Attendance.class_id
+    ).where(Class.teacher_id == teacher_id)
+
+    if class_id:
+        class_query = class_query.where(Class.id == class_id)
+        student_query = student_query.where(Student.class_id == class_id)
+        attendance_query = attendance_query.where(Attendance.class_id == class_id)
+    if start_date:
+        attendance_query = attendance_query.where(Attendance.date >= start_date)
+    if end_date:
+        attendance_query = attendance_query.where(Attendance.date <= end_date)
+
+    classes = db.session.execute(class_query).scalars().all()
+    students_by_class = {class_obj.id: [] for class_obj in classes}
+    for student in db.session.execute(student_query):
+        students_by_class[student.class_id].append(student)
+
+    rows = db.session.execute(attendance_query).all()
+    row_class_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    row_student_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    row_days = np.fromiter((row[2].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    row_codes = np.fromiter((STATUS_CODES.get(row[3], NO_RECORD) for row in rows), dtype=np.int8, count=len(rows))
+
+    matrices = []
+    for class_obj in classes:
+        students = students_by_class[class_obj.id]
+        in_class = row_class_ids == class_obj.id
+        days, day_index = np.unique(row_days[in_class], return_inverse=True)
+
+        matrix = np.full((len(students), len(days)), NO_RECORD, dtype=np.int8)
+        if len(students) and len(days):
+            # Attendance rows find their matrix row through the sorted student ids
+            student_ids = np.array([student.id for student in students], dtype=np.int64)
+            order = np.argsort(student_ids)
+            row_students = row_student_ids[in_class]
+            matrix_rows = order[np.searchsorted(student_ids, row_students, sorter=order).clip(max=len(students) - 1)]
+            known = student_ids[matrix_rows] == row_students
+            matrix[matrix_rows[known], day_index[known]] = row_codes[in_class][known]
+
+        matrices.append({
+            'class': class_obj,
+            'students': students,
+            'days': days,
+            'matrix': matrix
+        })
+    return matrices
+
+def rolling_rates(present, days, window):
+    """
+    Percentage of Present over the dates within `window` days ending at each date
+
+    present is the students x dates boolean matrix and days the dates as
+    ordinals; returns a float matrix of the same shape.
+    """
+    counts = np.concatenate((np.zeros((present.shape[0], 1), dtype=np.int64), np.cumsum(present, axis=1)), axis=1)
+    first = np.searchsorted(days, days - window + 1, side='left')
+    dates_in_window = np.arange(1, len(days) + 1) - first
+    return (counts[:, 1:] - counts[:, first]) * 100.0 / dates_in_window
+
+def absence_streaks(absent):
+    """Length of the absence run ending at each date of a students x dates boolean matrix"""
+    totals = np.cumsum(absent, axis=1)
+    totals_at_last_presence = np.maximum.accumulate(np.where(absent, 0, totals), axis=1)
+    return totals - totals_at_last_presence
+
+def compute_class_metrics(matrix, days):
+    """Per-student metric arrays of one class matrix"""
+    present = matrix == STATUS_CODES['Present']
+    absent = matrix == STATUS_CODES['Absent']
+    late = matrix == STATUS_CODES['Late']
+    dates = len(days)
+
+    metrics = {
+        'present': present.sum(axis=1),
+        'absent': absent.sum(axis=1),
+        'late': late.sum(axis=1),
+        'recorded': (matrix != NO_RECORD).sum(axis=1),
+        'percentage': present.sum(axis=1) * 100.0 / dates if dates else np.full(len(matrix), np.nan)
+    }
+
+    if dates:
+        for window in ROLLING_WINDOWS:
+            metrics[f'rate_{window}'] = rolling_rates(present, days, window)[:, -1]
+        streaks = absence_streaks(absent)
+        metrics['longest_absence_streak'] = streaks.max(axis=1)
+        metrics['current_absence_streak'] = streaks[:, -1]
+    else:
+        for window in ROLLING_WINDOWS:
+            metrics[f'rate_{window}'] = np.full(len(matrix), np.nan)
+        metrics['longest_absence_streak'] = metrics['current_absence_streak'] = np.zeros(len(matrix), dtype=np.int64)
+    return metrics
+
+def find_at_risk(metrics, threshold=DEFAULT_AT_RISK_THRESHOLD, absence_streak=DEFAULT_AT_RISK_ABSENCE_STREAK):
+    """Boolean mask of at-risk students plus the masks of each reason"""
+    rate_30 = metrics['rate_30']
+    reasons = {
+        'low_attendance': ~np.isnan(metrics['percentage']) & (metrics['percentage'] < threshold),
+        'low_recent_attendance': ~np.isnan(rate_30) & (rate_30 < threshold),
+        'absence_streak': metrics['current_absence_streak'] >= absence_streak
+    }
+    return reasons['low_attendance'] | reasons['low_recent_attendance'] | reasons['absence_streak'], reasons
+
+def _rounded(value, digits=1):
+    return None if np.isnan(value) else round(float(value), digits)
+
+def get_at_risk_report(teacher_id, class_id=None, start_date=None, end_date=None,
+                       threshold=DEFAULT_AT_RISK_THRESHOLD, absence_streak=DEFAULT_AT_RISK_ABSENCE_STREAK):
+    """
+    Attendance metrics of every student of a teacher's classes
+
+    Returns a dictionary with the thresholds used, one entry per class
+    (class_id, class_name, dates, first_date, last_date and its students'
+    metrics) and the at-risk students of all classes, lowest percentage
+    first. Each student entry has the student's fields, the counts, the
+    percentage and rates (None without dates in the window), the streaks,
+    at_risk and the list of reasons. A student without dates is never at risk.
+    """
+    report = {'threshold': threshold, 'absence_streak': absence_streak, 'classes': [], 'at_risk': []}
+    for class_matrix in load_status_matrices(teacher_id, class_id, start_date, end_date):
+        class_obj, students, days = class_matrix['class'], class_matrix['students'], class_matrix['days']
+        metrics = compute_class_metrics(class_matrix['matrix'], days)
+        at_risk, reasons = find_at_risk(metrics, threshold, absence_streak)
+
+        entries = []
+        for index, student in enumerate(students):
+            entry = {
+                'id': student.id,
+                'student_id': student.student_id,
+                'name': student.name,
+                'email': student.email,
+                'class_id': class_obj.id,
+                'class_name': class_obj.name,
+                'present': int(metrics['present'][index]),
+                'absent': int(metrics['absent'][index]),
+                'late': int(metrics['late'][index]),
+                'recorded': int(metrics['recorded'][index]),
+                'percentage': _rounded(metrics['percentage'][index], 2),
+                'longest_absence_streak': int(metrics['longest_absence_streak'][index]),
+                'current_absence_streak': int(metrics['current_absence_streak'][index]),
+                'at_risk': bool(at_risk[index]),
+                'reasons': [reason for reason, mask in reasons.items() if mask[index]]
+            }
+            for window in ROLLING_WINDOWS:
+                entry[f'rate_{window}'] = _rounded(metrics[f'rate_{window}'][index])
+            entries.append(entry)
+
+        report['classes'].append({
+            'class_id': class_obj.id,
+            'class_name': class_obj.name,
+            'dates': len(days),
+            'first_date': date.fromordinal(int(days[0])) if len(days) else None,
+            'last_date': date.fromordinal(int(days[-1])) if len(days) else None,
+            'students': entries
+        })
+        report['at_risk'].extend(entry for entry in entries if entry['at_risk'])
+
+    report['at_risk'].sort(key=lambda entry: (entry['percentage'], entry['class_name'], entry['name']))
+    return report
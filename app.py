@@ -6,14 +6,15 @@ from database import db
 # Configure logging for debugging
 logging.basicConfig(level=logging.DEBUG)
 
-def create_app():
+def create_app(config=None):
     # Create Flask app
     app = Flask(__name__)
     
     # Configure app
     app.secret_key = os.environ.get("SESSION_SECRET", "your-secret-key-here")
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///attendance.db"
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///attendance.db")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.update(config or {})
     
     # Initialize extensions with app
     db.init_app(app)
@@ -21,14 +22,25 @@ def create_app():
     # Import models and routes
     from models import Teacher, Class, Student, Attendance
     from routes import main_bp
+    from query_budget import init_query_budget
+    from migrations import run_migrations, init_migrations
+    from summary_service import init_summary_commands
+    from bitmap_service import init_bitmap_commands
     
     # Register blueprints
     app.register_blueprint(main_bp)
     
-    # Create database tables
+    # Per-request SQL query budgets (see query_budget.py)
+    init_query_budget(app)
+    
+    # Create database tables, then bring existing ones up to date
     with app.app_context():
         db.create_all()
         logging.info("Database tables created successfully")
+        run_migrations()
+    init_migrations(app)
+    init_summary_commands(app)
+    init_bitmap_commands(app)
     
     return app
 
@@ -0,0 +1,141 @@
+"""
+Attendance marking service
+
+Marks a whole class for one date with set-based statements instead of one
+query per student: a single INSERT ... ON CONFLICT DO UPDATE against the
+unique_attendance constraint on SQLite and PostgreSQL, and one lookup of
+the existing rows plus bulk insert/update on other databases. The day's
+DailyAttendanceSummary row, the students' AttendanceBitmap calendars and
+the absence emails queued in the EmailOutbox table are written within the
+same transaction.
+"""
+from datetime import datetime
+from database import db
+from models import Attendance, EmailOutbox
+from summary_service import refresh_daily_summaries
+from bitmap_service import sync_attendance_bitmaps
+from sqlalchemy import select, update, insert, literal
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Dialects with INSERT ... ON CONFLICT support
+UPSERT_INSERTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert
+}
+
+# Rows per upsert statement, well below SQLite's bound-parameter limit
+UPSERT_BATCH_SIZE = 500
+
+def upsert_rows(model, rows, index_elements, update_columns):
+    """
+    Insert rows, updating update_columns where index_elements already exist
+
+    Uses the dialect's INSERT ... ON CONFLICT DO UPDATE when available.
+    Returns False without doing anything if the database has no such statement.
+    """
+    dialect_insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is None:
+        return False
+
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = dialect_insert(model).values(rows[start:start + UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: stmt.excluded[column] for column in update_columns}
+        )
+        db.session.execute(stmt)
+    return True
+
+def _merge_rows(class_id, attendance_date, rows):
+    """Fallback upsert: one query for the existing rows, then bulk update and insert"""
+    existing = dict(db.session.execute(
+        select(Attendance.student_id, Attendance.id).where(
+            Attendance.class_id == class_id,
+            Attendance.date == attendance_date
+        )
+    ).all())
+
+    updates = [
+        {'id': existing[row['student_id']], 'status': row['status'], 'marked_at': row['marked_at']}
+        for row in rows if row['student_id'] in existing
+    ]
+    inserts = [row for row in rows if row['student_id'] not in existing]
+
+    if updates:
+        db.session.execute(update(Attendance), updates)
+    if inserts:
+        db.session.execute(insert(Attendance), inserts)
+
+def mark_class_attendance(class_id, attendance_date, statuses):
+    """
+    Record the status of every student of a class for one date
+
+    statuses maps Student.id to "Present", "Absent" or "Late". Existing rows
+    get the new status and marked_at; email_sent is left as it was so a
+    student is only notified once per day. The class's daily summary for the
+    date is recounted and the students' bitmaps updated. Does not commit.
+    """
+    marked_at = datetime.utcnow()
+    rows = [
+        {
+            'student_id': student_id,
+            'class_id': class_id,
+            'date': attendance_date,
+            'status': status,
+            'marked_at': marked_at,
+            'email_sent': False
+        }
+        for student_id, status in statuses.items()
+    ]
+
+    if rows and not upsert_rows(Attendance, rows, ['student_id', 'class_id', 'date'], ['status', 'marked_at']):
+        _merge_rows(class_id, attendance_date, rows)
+    if rows:
+        refresh_daily_summaries(class_id, [attendance_date])
+        sync_attendance_bitmaps(class_id, attendance_date, statuses)
+
+def enqueue_absence_notifications(class_id, attendance_date, teacher_id, send_at=None):
+    """
+    Queue absence emails in the outbox for the class's unnotified absences
+
+    Runs as one INSERT ... SELECT in the caller's transaction, so the outbox
+    rows commit together with the attendance they describe. Absences that
+    already have a pending message are skipped. send_at delays delivery, e.g.
+    until the digest cutoff. Returns the number queued.
+    """
+    now = datetime.utcnow()
+    already_pending = select(EmailOutbox.id).where(
+        EmailOutbox.attendance_id == Attendance.id,
+        EmailOutbox.status == 'pending'
+    ).exists()
+
+    pending_absences = select(
+        Attendance.id,
+        literal(teacher_id),
+        literal('pending'),
+        literal(0),
+        literal(send_at or now),
+        literal(now)
+    ).where(
+        Attendance.class_id == class_id,
+        Attendance.date == attendance_date,
+        Attendance.status == 'Absent',
+        Attendance.email_sent.is_not(True),
+        ~already_pending
+    )
+
+    result = db.session.execute(
+        insert(EmailOutbox).from_select(
+            ['attendance_id', 'teacher_id', 'status', 'attempts', 'next_attempt_at', 'created_at'],
+            pending_absences
+        )
+    )
+    return result.rowcount
+
+def mark_emails_sent(attendance_ids):
+    """Flag absence emails as sent for the given attendance rows in one statement"""
+    if attendance_ids:
+        db.session.execute(
+            update(Attendance).where(Attendance.id.in_(attendance_ids)).values(email_sent=True)
+        )
@@ -0,0 +1,270 @@
+"""
+Email throughput benchmark
+
+Runs entirely offline: starts a local SMTP sink, generates synthetic
+absences and pushes them through the notification paths.
+
+    per_message  one SMTP connection, login and quit per email (the old path)
+    pooled       one pooled session per teacher, sent sequentially
+    concurrent   notification_service.NotificationSender
+    dispatcher   the outbox dispatcher, retrying failures until drained
+    digest       the dispatcher in EMAIL_DIGEST_MODE
+
+For each it reports messages/sec, p50/p99 per-message latency and how many
+messages failed, were retried or were dead-lettered:
+
+    python benchmarks/email_benchmark.py --teachers 5 --students 30 --message-latency 0.005 --failure-rate 0.02
+"""
+import os
+import sys
+import json
+import time
+import logging
+import smtplib
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+from models import Class, Attendance, EmailOutbox
+from sqlalchemy.orm import joinedload
+from email_service import SMTPConnectionPool, build_absence_message, get_smtp_settings, get_smtp_pool
+from notification_service import NotificationSender
+from outbox_dispatcher import dispatch_due_messages
+from smtp_sink import SMTPSink, plain_smtp_connection
+from synthetic_data import create_benchmark_app, generate_absences, requeue_absences
+
+SCENARIOS = ('per_message', 'pooled', 'concurrent', 'dispatcher', 'digest')
+
+class LatencyRecorder:
+    """Thread-safe list of per-message delivery times in seconds"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+def timed_connect(recorder):
+    """Connect factory for the sink whose sessions record each message's MAIL to DATA duration"""
+    class TimedSMTP(smtplib.SMTP):
+        def mail(self, *args, **kwargs):
+            self.message_started = time.perf_counter()
+            return super().mail(*args, **kwargs)
+
+        def data(self, *args, **kwargs):
+            try:
+                return super().data(*args, **kwargs)
+            finally:
+                recorder.add(time.perf_counter() - self.message_started)
+
+    def connect(settings):
+        server = TimedSMTP(settings.server, settings.port, timeout=30)
+        try:
+            server.login(settings.username, settings.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    return connect
+
+def load_notifications():
+    """Every absence grouped by teacher as (teacher, [(student, [class_obj], date)])"""
+    records = Attendance.query.options(
+        joinedload(Attendance.student),
+        joinedload(Attendance.class_ref).joinedload(Class.teacher)
+    ).filter(Attendance.status == 'Absent').order_by(Attendance.id).all()
+
+    batches = {}
+    for record in records:
+        batches.setdefault(record.class_ref.teacher, []).append((record.student, [record.class_ref], record.date))
+    return list(batches.items())
+
+def summarize(name, messages, failures, seconds, recorder):
+    sent = messages - failures
+    return {
+        'scenario': name,
+        'messages': messages,
+        'sent': sent,
+        'failed': failures,
+        'seconds': round(seconds, 3),
+        'msgs_per_sec': round(sent / seconds, 1) if seconds else None,
+        'p50_ms': round(recorder.percentile(50) * 1000, 2) if recorder.samples else None,
+        'p99_ms': round(recorder.percentile(99) * 1000, 2) if recorder.samples else None
+    }
+
+def run_per_message(batches):
+    recorder = LatencyRecorder()
+    messages = failures = 0
+    started = time.perf_counter()
+
+    for teacher, notifications in batches:
+        settings = get_smtp_settings(teacher)
+        for student, classes, attendance_date in notifications:
+            msg = build_absence_message(student, classes[0], attendance_date, teacher)
+            messages += 1
+            message_started = time.perf_counter()
+            try:
+                server = plain_smtp_connection(settings)
+                try:
+                    server.sendmail(settings.username, msg['To'], msg.as_string())
+                    server.quit()
+                finally:
+                    server.close()
+            except Exception:
+                failures += 1
+            recorder.add(time.perf_counter() - message_started)
+
+    return summarize('per_message', messages, failures, time.perf_counter() - started, recorder)
+
+def run_pooled(batches):
+    recorder = LatencyRecorder()
+    pool = SMTPConnectionPool(connect=timed_connect(recorder))
+    messages = failures = 0
+    started = time.perf_counter()
+
+    for teacher, notifications in batches:
+        settings = get_smtp_settings(teacher)
+        outgoing = [build_absence_message(student, classes[0], attendance_date, teacher)
+                    for student, classes, attendance_date in notifications]
+        outcomes = pool.send_messages(settings, outgoing)
+        messages += len(outcomes)
+        failures += sum(1 for error in outcomes if error)
+
+    pool.close_all()
+    return summarize('pooled', messages, failures, time.perf_counter() - started, recorder)
+
+def run_concurrent(batches, args):
+    recorder = LatencyRecorder()
+    pool = SMTPConnectionPool(connect=timed_connect(recorder))
+    sender = NotificationSender(pool=pool, max_workers=args.workers, teacher_rate=args.teacher_rate or None,
+                                teacher_connections=args.teacher_connections,
+                                server_connections=args.server_connections)
+    started = time.perf_counter()
+    outcome_lists = sender.send_absence_notifications(batches)
+    seconds = time.perf_counter() - started
+
+    sender.shutdown()
+    pool.close_all()
+    outcomes = [error for outcomes in outcome_lists for error in outcomes]
+    return summarize('concurrent', len(outcomes), sum(1 for error in outcomes if error), seconds, recorder)
+
+def run_dispatcher(app, name, digest_mode):
+    """Drain the outbox, jumping the clock past each backoff so retries run immediately"""
+    app.config['EMAIL_DIGEST_MODE'] = digest_mode
+    queued = requeue_absences()
+
+    # The dispatcher sends through the process-wide pool; time its sessions for this run only
+    recorder = LatencyRecorder()
+    pool = get_smtp_pool()
+    original_connect = pool.connect
+    pool.close_all()
+    pool.connect = timed_connect(recorder)
+
+    totals = {'sent': 0, 'retried': 0, 'dead': 0}
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    try:
+        while True:
+            results = dispatch_due_messages(app, now=now)
+            for key in totals:
+                totals[key] += results[key]
+            if not results['claimed']:
+                if not EmailOutbox.query.filter_by(status='pending').count():
+                    break
+                now += timedelta(seconds=app.config['OUTBOX_MAX_BACKOFF_SECONDS'])
+        seconds = time.perf_counter() - started
+    finally:
+        pool.close_all()
+        pool.connect = original_connect
+
+    # Emails attempted, and absences whose notification got through
+    result = summarize(name, len(recorder.samples), 0, seconds, recorder)
+    delivered = Attendance.query.filter_by(email_sent=True).count()
+    result.update(sent=None, failed=None, queued=queued, delivered=delivered, retried=totals['retried'], dead=totals['dead'],
+                  msgs_per_sec=round(delivered / seconds, 1) if seconds else None)
+    return result
+
+def print_table(results):
+    columns = ['scenario', 'messages', 'sent', 'failed', 'retried', 'dead', 'delivered', 'seconds',
+               'msgs_per_sec', 'p50_ms', 'p99_ms']
+    print(' '.join(f'{column:>12}' for column in columns))
+    for result in results:
+        print(' '.join(f"{'-' if result.get(column) is None else result.get(column):>12}" for column in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline email throughput benchmark")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma-separated subset of " + ', '.join(SCENARIOS))
+    parser.add_argument('--teachers', type=int, default=5)
+    parser.add_argument('--classes', type=int, default=4, help="classes per teacher")
+    parser.add_argument('--students', type=int, default=30, help="students per class")
+    parser.add_argument('--absence-rate', type=float, default=0.3)
+    parser.add_argument('--connect-latency', type=float, default=0.02, help="seconds before the greeting")
+    parser.add_argument('--message-latency', type=float, default=0.005, help="seconds to accept a message")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of messages answered 451")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="share of messages whose connection drops")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--teacher-rate', type=float, default=0, help="messages/sec per teacher, 0 for no limit")
+    parser.add_argument('--teacher-connections', type=int, default=2)
+    parser.add_argument('--server-connections', type=int, default=8)
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger().setLevel(logging.ERROR)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    app = create_benchmark_app(
+        OUTBOX_BATCH_SIZE=200,
+        OUTBOX_MAX_ATTEMPTS=5,
+        OUTBOX_MAX_BACKOFF_SECONDS=3600,
+        EMAIL_SEND_WORKERS=args.workers,
+        EMAIL_TEACHER_RATE=args.teacher_rate or None,
+        EMAIL_TEACHER_CONNECTIONS=args.teacher_connections,
+        EMAIL_SERVER_CONNECTIONS=args.server_connections
+    )
+
+    sink = SMTPSink(connect_latency=args.connect_latency, message_latency=args.message_latency,
+                    failure_rate=args.failure_rate, drop_rate=args.drop_rate, seed=1)
+    results = []
+    with sink, app.app_context():
+        counts = generate_absences(sink.address, args.teachers, args.classes, args.students, args.absence_rate)
+        batches = load_notifications()
+
+        for name in scenarios:
+            sink.reset_stats()
+            if name == 'per_message':
+                result = run_per_message(batches)
+            elif name == 'pooled':
+                result = run_pooled(batches)
+            elif name == 'concurrent':
+                result = run_concurrent(batches, args)
+            else:
+                result = run_dispatcher(app, name, digest_mode=(name == 'digest'))
+            result['sink'] = dict(sink.stats)
+            results.append(result)
+
+        db.session.remove()
+
+    if args.json:
+        print(json.dumps({'data': counts, 'results': results}, indent=2))
+    else:
+        print(f"{counts['teachers']} teachers, {counts['classes']} classes, {counts['students']} students, "
+              f"{counts['absences']} absences")
+        print_table(results)
+
+if __name__ == "__main__":
+    main()
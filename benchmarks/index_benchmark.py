@@ -0,0 +1,144 @@
+"""
+Query plan benchmark for the hot attendance queries
+
+Fills a scratch SQLite database with synthetic attendance, drops the indexes
+added by migration 1, then times the queries behind the attendance page, the
+dashboard and bulk import and prints their query plans before and after
+running the migrations:
+
+    python benchmarks/index_benchmark.py --teachers 10 --classes 5 --students 40 --days 120
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+from models import Teacher, Class, Student, Attendance
+from migrations import run_migrations, schema_migrations
+from sqlalchemy import select, insert, text, desc
+from synthetic_data import create_benchmark_app
+from dashboard_service import recent_attendance_query
+
+INDEXES = ('ix_attendance_class_date', 'ix_attendance_class_marked_at', 'ix_student_class_student_id')
+
+def generate_attendance(teachers, classes_per_teacher, students_per_class, days, seed=1):
+    """Bulk insert the synthetic rows; returns the number of attendance rows"""
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=days)
+    attendance_rows = 0
+
+    for teacher_number in range(teachers):
+        teacher = Teacher(name=f'Teacher {teacher_number}', email=f'teacher{teacher_number}@example.com')
+        teacher.set_password('benchmark')
+        db.session.add(teacher)
+        db.session.flush()
+
+        for class_number in range(classes_per_teacher):
+            class_obj = Class(name=f'Session {teacher_number}-{class_number}', subject='Benchmarking',
+                              teacher_id=teacher.id)
+            db.session.add(class_obj)
+            db.session.flush()
+
+            student_ids = [
+                db.session.execute(insert(Student).values(
+                    name=f'Student {student_number}', class_id=class_obj.id,
+                    student_id=f'T{teacher_number}C{class_number}S{student_number:04d}',
+                    email=f'student{student_number}@example.com'
+                )).inserted_primary_key[0]
+                for student_number in range(students_per_class)
+            ]
+
+            rows = []
+            for day_number in range(days):
+                attendance_date = first_day + timedelta(days=day_number)
+                marked_at = datetime.combine(attendance_date, datetime.min.time()) + timedelta(hours=9)
+                for student_id in student_ids:
+                    rows.append({
+                        'student_id': student_id,
+                        'class_id': class_obj.id,
+                        'date': attendance_date,
+                        'status': rng.choices(('Present', 'Absent', 'Late'), (85, 10, 5))[0],
+                        'marked_at': marked_at + timedelta(seconds=rng.randrange(3600)),
+                        'email_sent': False
+                    })
+            db.session.execute(insert(Attendance), rows)
+            attendance_rows += len(rows)
+
+    db.session.commit()
+    return attendance_rows
+
+def hot_queries():
+    """(name, statement) for the queries the new indexes are meant to serve"""
+    class_obj = Class.query.order_by(desc(Class.id)).first()
+    latest_date = db.session.scalar(select(Attendance.date).where(Attendance.class_id == class_obj.id)
+                                    .order_by(Attendance.date.desc()).limit(1))
+    last_student = Student.query.filter_by(class_id=class_obj.id).order_by(desc(Student.id)).first()
+    teacher_class_ids = db.session.scalars(select(Class.id).where(Class.teacher_id == class_obj.teacher_id)).all()
+
+    return [
+        ('attendance page', select(Attendance.student_id, Attendance.status)
+            .where(Attendance.class_id == class_obj.id, Attendance.date == latest_date)),
+        ('class dates', select(Attendance.date).where(Attendance.class_id == class_obj.id)
+            .distinct().order_by(Attendance.date.desc())),
+        ('dashboard recent', recent_attendance_query(teacher_class_ids)),
+        ('student lookup', select(Student.id)
+            .where(Student.class_id == class_obj.id, Student.student_id == last_student.student_id))
+    ]
+
+def measure(repeat):
+    """Plan and mean milliseconds per hot query"""
+    results = []
+    with db.engine.connect() as connection:
+        for name, statement in hot_queries():
+            compiled = statement.compile(connection, compile_kwargs={'literal_binds': True})
+            plan = [row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(statement).all()
+            results.append((name, plan, (time.perf_counter() - started) * 1000 / repeat))
+    return results
+
+def drop_new_indexes():
+    """Put the database back into its pre-migration state"""
+    with db.engine.begin() as connection:
+        for name in INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        schema_migrations.drop(connection, checkfirst=True)
+        connection.execute(text('ANALYZE'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance index benchmark")
+    parser.add_argument('--teachers', type=int, default=10)
+    parser.add_argument('--classes', type=int, default=5, help="classes per teacher")
+    parser.add_argument('--students', type=int, default=40, help="students per class")
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=50, help="runs per query")
+    args = parser.parse_args()
+
+    app = create_benchmark_app()
+    with app.app_context():
+        rows = generate_attendance(args.teachers, args.classes, args.students, args.days)
+        print(f"{rows} attendance rows")
+
+        drop_new_indexes()
+        before = measure(args.repeat)
+        run_migrations()
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        after = measure(args.repeat)
+
+        for (name, old_plan, old_ms), (_, new_plan, new_ms) in zip(before, after):
+            print(f"\n{name}: {old_ms:.3f} ms -> {new_ms:.3f} ms")
+            print(f"  before: {'; '.join(old_plan)}")
+            print(f"  after:  {'; '.join(new_plan)}")
+
+        db.session.remove()
+
+if __name__ == "__main__":
+    main()
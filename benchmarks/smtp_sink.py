@@ -0,0 +1,219 @@
+"""
+Local SMTP sink for offline email benchmarks
+
+A small threaded SMTP server built on the standard library. It accepts
+EHLO/HELO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, NOOP, RSET and QUIT, counts
+what it receives and throws the messages away. Latency and failures can be
+injected to see how the notification paths behave against a slow or flaky
+provider. STARTTLS is not offered; connect to it with plain_smtp_connection.
+
+Run on its own:
+
+    python benchmarks/smtp_sink.py --port 2525 --message-latency 0.01
+"""
+import time
+import base64
+import random
+import smtplib
+import argparse
+import threading
+import socketserver
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """One SMTP session"""
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def read_line(self):
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("client closed the connection")
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        sink.wait(sink.connect_latency)
+        sink.record('connections')
+        self.reply('220 smtp-sink ESMTP ready')
+
+        try:
+            while True:
+                command = self.read_line()
+                verb = command.split(' ', 1)[0].upper()
+                sink.wait(sink.command_latency)
+
+                if verb == 'EHLO':
+                    self.reply('250-smtp-sink')
+                    self.reply('250-AUTH PLAIN LOGIN')
+                    self.reply('250 8BITMIME')
+                elif verb == 'HELO':
+                    self.reply('250 smtp-sink')
+                elif verb == 'AUTH':
+                    self.handle_auth(command)
+                elif verb in ('MAIL', 'RSET', 'NOOP'):
+                    self.reply('250 OK')
+                elif verb == 'RCPT':
+                    if sink.should('rcpt_failure_rate'):
+                        sink.record('rejected')
+                        self.reply('550 Mailbox unavailable')
+                    else:
+                        self.reply('250 OK')
+                elif verb == 'DATA':
+                    if not self.handle_data():
+                        return
+                elif verb == 'QUIT':
+                    self.reply('221 Bye')
+                    return
+                else:
+                    self.reply('502 Command not implemented')
+        except ConnectionError:
+            return
+
+    def handle_auth(self, command):
+        parts = command.split()
+        mechanism = parts[1].upper() if len(parts) > 1 else ''
+
+        if mechanism == 'PLAIN':
+            response = parts[2] if len(parts) > 2 else None
+            if response is None:
+                self.reply('334 ')
+                response = self.read_line()
+            credentials = base64.b64decode(response).split(b'\0')
+            username, password = credentials[-2].decode(), credentials[-1].decode()
+        elif mechanism == 'LOGIN':
+            self.reply('334 ' + base64.b64encode(b'Username:').decode())
+            username = base64.b64decode(self.read_line()).decode()
+            self.reply('334 ' + base64.b64encode(b'Password:').decode())
+            password = base64.b64decode(self.read_line()).decode()
+        else:
+            self.reply('504 Unrecognized authentication type')
+            return
+
+        if self.server.sink.authenticate(username, password):
+            self.reply('235 Authentication successful')
+        else:
+            self.server.sink.record('auth_failures')
+            self.reply('535 Authentication credentials invalid')
+
+    def handle_data(self):
+        """Read one message; returns False when the connection is dropped"""
+        sink = self.server.sink
+        self.reply('354 End data with <CR><LF>.<CR><LF>')
+        while self.read_line() != '.':
+            pass
+
+        sink.wait(sink.message_latency)
+        if sink.should('drop_rate'):
+            sink.record('dropped')
+            return False
+        if sink.should('failure_rate'):
+            sink.record('failed')
+            self.reply('451 Temporary local problem, try again later')
+        else:
+            sink.record('messages')
+            self.reply('250 OK: queued')
+        return True
+
+class _ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SMTPSink:
+    """
+    Threaded SMTP sink with latency and failure injection
+
+    Latencies are in seconds. failure_rate answers DATA with 451,
+    rcpt_failure_rate answers RCPT with 550 and drop_rate closes the
+    connection after DATA without replying. With credentials set, only that
+    username and password are accepted.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, connect_latency=0.0, command_latency=0.0,
+                 message_latency=0.0, failure_rate=0.0, rcpt_failure_rate=0.0, drop_rate=0.0,
+                 credentials=None, seed=None):
+        self.connect_latency = connect_latency
+        self.command_latency = command_latency
+        self.message_latency = message_latency
+        self.failure_rate = failure_rate
+        self.rcpt_failure_rate = rcpt_failure_rate
+        self.drop_rate = drop_rate
+        self.credentials = credentials
+        self.stats = {'connections': 0, 'messages': 0, 'failed': 0, 'rejected': 0, 'dropped': 0, 'auth_failures': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _ThreadingSMTPServer((host, port), SMTPSinkHandler)
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def wait(self, seconds):
+        if seconds:
+            time.sleep(seconds)
+
+    def should(self, rate_name):
+        """Roll the dice for one injected failure"""
+        rate = getattr(self, rate_name)
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def record(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def authenticate(self, username, password):
+        return self.credentials is None or (username, password) == self.credentials
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {key: 0 for key in self.stats}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def plain_smtp_connection(settings):
+    """SMTPConnectionPool connect factory for the sink: login without STARTTLS"""
+    server = smtplib.SMTP(settings.server, settings.port, timeout=30)
+    try:
+        server.login(settings.username, settings.password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local SMTP sink")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--message-latency', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, message_latency=args.message_latency,
+                    failure_rate=args.failure_rate, drop_rate=args.drop_rate)
+    sink.start()
+    print(f"SMTP sink listening on {sink.address[0]}:{sink.address[1]}")
+    try:
+        while True:
+            time.sleep(10)
+            print(sink.stats)
+    except KeyboardInterrupt:
+        sink.stop()
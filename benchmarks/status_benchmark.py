@@ -0,0 +1,186 @@
+"""
+Storage and query benchmark for the integer-coded attendance status
+
+Builds a scratch SQLite database whose attendance table still has the old
+VARCHAR status column, fills it with synthetic attendance, and measures the
+size of the table and its indexes and the time of the status-heavy queries.
+It then runs migrations 4 and 5 (the batched status_code backfill, and the
+column swap, which on SQLite rebuilds the table with the NOT NULL and check
+constraints on status), reporting how long each step held the database, and
+measures again:
+
+    python benchmarks/status_benchmark.py --teachers 10 --classes 5 --students 40 --days 120
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+from models import Teacher, Class, Student, STATUS_CODES
+from migrations import (run_migrations, backfill_attendance_status_codes, swap_attendance_status_column,
+                        STATUS_BACKFILL_BATCH_SIZE)
+from sqlalchemy import insert, text, table, column
+from synthetic_data import create_benchmark_app
+
+LEGACY_ATTENDANCE_TABLE = """
+CREATE TABLE attendance (
+    id INTEGER NOT NULL PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES student (id),
+    class_id INTEGER NOT NULL REFERENCES class (id),
+    date DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    marked_at DATETIME,
+    email_sent BOOLEAN,
+    CONSTRAINT unique_attendance UNIQUE (student_id, class_id, date)
+)
+"""
+
+# Untyped view of the table, so statuses are inserted as the text the old schema holds
+legacy_attendance = table('attendance', column('student_id'), column('class_id'), column('date'),
+                          column('status'), column('marked_at'), column('email_sent'))
+
+# name -> (SQL, whether it takes the status as a parameter)
+QUERIES = {
+    'class status counts': ("SELECT status, COUNT(*) FROM attendance WHERE class_id = :class_id GROUP BY status", False),
+    'absences on a date': ("SELECT id FROM attendance WHERE class_id = :class_id AND date = :date AND status = :status", True),
+    'all status counts': ("SELECT status, COUNT(*) FROM attendance GROUP BY status", False),
+    'absences overall': ("SELECT COUNT(*) FROM attendance WHERE status = :status", True),
+    'daily summaries': ("SELECT class_id, date, SUM(CASE WHEN status = :status THEN 1 ELSE 0 END), COUNT(*) "
+                        "FROM attendance GROUP BY class_id, date", True)
+}
+
+def create_legacy_attendance():
+    """Replace the attendance table with the pre-migration VARCHAR status version"""
+    with db.engine.begin() as connection:
+        connection.execute(text("DROP TABLE attendance"))
+        connection.execute(text(LEGACY_ATTENDANCE_TABLE))
+        connection.execute(text("CREATE INDEX ix_attendance_class_date ON attendance (class_id, date)"))
+        connection.execute(text("CREATE INDEX ix_attendance_class_marked_at ON attendance (class_id, marked_at)"))
+
+def generate_attendance(teachers, classes_per_teacher, students_per_class, days, seed=1):
+    """Bulk insert synthetic rows with text statuses; returns the number of attendance rows"""
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=days)
+    attendance_rows = 0
+
+    for teacher_number in range(teachers):
+        teacher = Teacher(name=f'Teacher {teacher_number}', email=f'teacher{teacher_number}@example.com')
+        teacher.set_password('benchmark')
+        db.session.add(teacher)
+        db.session.flush()
+
+        for class_number in range(classes_per_teacher):
+            class_obj = Class(name=f'Session {teacher_number}-{class_number}', subject='Benchmarking',
+                              teacher_id=teacher.id)
+            db.session.add(class_obj)
+            db.session.flush()
+
+            student_ids = [
+                db.session.execute(insert(Student).values(
+                    name=f'Student {student_number}', class_id=class_obj.id,
+                    student_id=f'T{teacher_number}C{class_number}S{student_number:04d}',
+                    email=f'student{student_number}@example.com'
+                )).inserted_primary_key[0]
+                for student_number in range(students_per_class)
+            ]
+
+            rows = []
+            for day_number in range(days):
+                attendance_date = first_day + timedelta(days=day_number)
+                marked_at = datetime.combine(attendance_date, datetime.min.time()) + timedelta(hours=9)
+                for student_id in student_ids:
+                    rows.append({
+                        'student_id': student_id,
+                        'class_id': class_obj.id,
+                        'date': attendance_date,
+                        'status': rng.choices(list(STATUS_CODES), (85, 10, 5))[0],
+                        'marked_at': marked_at,
+                        'email_sent': False
+                    })
+            db.session.execute(insert(legacy_attendance), rows)
+            attendance_rows += len(rows)
+
+    db.session.commit()
+    return attendance_rows
+
+def measure_storage():
+    """Bytes used by the attendance table and by its indexes, after a VACUUM"""
+    with db.engine.connect() as connection:
+        connection.execute(text("VACUUM"))
+        connection.execute(text("ANALYZE"))
+        table_bytes = connection.scalar(text("SELECT SUM(pgsize) FROM dbstat WHERE name = 'attendance'"))
+        index_bytes = connection.scalar(text(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'attendance')"
+        ))
+    return table_bytes, index_bytes
+
+def measure_queries(status_value, repeat):
+    """Mean milliseconds per query, with the Absent status given as status_value"""
+    with db.engine.connect() as connection:
+        class_id, latest_date = connection.execute(
+            text("SELECT class_id, MAX(date) FROM attendance GROUP BY class_id ORDER BY class_id DESC LIMIT 1")
+        ).one()
+        timings = {}
+        for name, (sql, takes_status) in QUERIES.items():
+            parameters = {'class_id': class_id, 'date': latest_date}
+            if takes_status:
+                parameters['status'] = status_value
+            started = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(text(sql), parameters).all()
+            timings[name] = (time.perf_counter() - started) * 1000 / repeat
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance status storage and query benchmark")
+    parser.add_argument('--teachers', type=int, default=10)
+    parser.add_argument('--classes', type=int, default=5, help="classes per teacher")
+    parser.add_argument('--students', type=int, default=40, help="students per class")
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=20, help="runs per query")
+    args = parser.parse_args()
+
+    app = create_benchmark_app()
+    with app.app_context():
+        create_legacy_attendance()
+        rows = generate_attendance(args.teachers, args.classes, args.students, args.days)
+        print(f"{rows} attendance rows")
+
+        before_storage = measure_storage()
+        before_queries = measure_queries('Absent', args.repeat)
+
+        started = time.perf_counter()
+        backfill_attendance_status_codes(db.engine)
+        backfill_seconds = time.perf_counter() - started
+        batches = -(-rows // STATUS_BACKFILL_BATCH_SIZE)
+
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            swap_attendance_status_column(connection)
+        swap_seconds = time.perf_counter() - started
+        run_migrations()
+
+        after_storage = measure_storage()
+        after_queries = measure_queries(STATUS_CODES['Absent'], args.repeat)
+        db.session.remove()
+
+    print(f"\nbackfill: {backfill_seconds:.2f} s in {batches} batches of {STATUS_BACKFILL_BATCH_SIZE} "
+          f"(about {backfill_seconds * 1000 / batches:.1f} ms per transaction)")
+    print(f"swap:     {swap_seconds:.2f} s in one transaction, including the summary and bitmap recount")
+
+    print(f"\n{'':24}{'before':>12}{'after':>12}")
+    for label, before, after in (('table bytes', before_storage[0], after_storage[0]),
+                                 ('index bytes', before_storage[1], after_storage[1])):
+        print(f"{label:24}{before:>12}{after:>12}   {(after - before) * 100 / before:+.1f}%")
+    for name in QUERIES:
+        before, after = before_queries[name], after_queries[name]
+        print(f"{name + ' (ms)':24}{before:>12.3f}{after:>12.3f}   {(after - before) * 100 / before:+.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Synthetic teachers, classes, students and absences for benchmarks
+
+Builds a throwaway Flask app on its own database, creates teachers whose
+SMTP settings point at a local sink, and marks one day of attendance with
+the regular attendance_service functions, queueing the absence emails in
+the outbox just like mark_attendance does.
+"""
+import os
+import sys
+import random
+import tempfile
+from datetime import date
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db
+from models import Teacher, Class, Student, Attendance, EmailOutbox
+from attendance_service import mark_class_attendance, enqueue_absence_notifications
+from sqlalchemy import update
+
+SINK_PASSWORD = 'benchmark'
+
+def create_benchmark_app(database_uri=None, **config):
+    """Flask app on a scratch SQLite database (or database_uri) with the tables created"""
+    instance_path = tempfile.mkdtemp(prefix='attendance-benchmark-')
+    app = Flask(__name__, instance_path=instance_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri or f"sqlite:///{os.path.join(instance_path, 'benchmark.db')}"
+    app.config.update(config)
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+def generate_absences(sink_address, teachers=5, classes_per_teacher=4, students_per_class=30,
+                      absence_rate=0.3, attendance_date=None, seed=1):
+    """
+    Create the synthetic data and queue the absence emails; call inside an app context
+
+    A teacher's classes share their students' email addresses, so a student
+    absent from several classes is one digest recipient. Returns a
+    dictionary with the counts created.
+    """
+    rng = random.Random(seed)
+    attendance_date = attendance_date or date.today()
+    host, port = sink_address
+    counts = {'teachers': 0, 'classes': 0, 'students': 0, 'absences': 0}
+
+    for teacher_number in range(teachers):
+        teacher = Teacher(name=f'Teacher {teacher_number}', email=f'teacher{teacher_number}@example.com',
+                          smtp_email=f'teacher{teacher_number}@example.com', smtp_server=host, smtp_port=port)
+        teacher.set_password('benchmark')
+        teacher.set_smtp_password(SINK_PASSWORD)
+        db.session.add(teacher)
+        db.session.flush()
+        counts['teachers'] += 1
+
+        for class_number in range(classes_per_teacher):
+            class_obj = Class(name=f'Session {teacher_number}-{class_number}', subject='Benchmarking',
+                              teacher_id=teacher.id)
+            db.session.add(class_obj)
+            db.session.flush()
+            counts['classes'] += 1
+
+            students = [
+                Student(name=f'Student {student_number}', class_id=class_obj.id,
+                        student_id=f'T{teacher_number}S{student_number:04d}',
+                        email=f'student{student_number}.t{teacher_number}@example.com')
+                for student_number in range(students_per_class)
+            ]
+            db.session.add_all(students)
+            db.session.flush()
+            counts['students'] += len(students)
+
+            statuses = {
+                student.id: 'Absent' if rng.random() < absence_rate else 'Present'
+                for student in students
+            }
+            mark_class_attendance(class_obj.id, attendance_date, statuses)
+            counts['absences'] += enqueue_absence_notifications(class_obj.id, attendance_date, teacher.id)
+
+    db.session.commit()
+    return counts
+
+def requeue_absences():
+    """Reset every absence to unnotified with a fresh pending outbox message; returns the count"""
+    db.session.execute(update(Attendance).values(email_sent=False))
+    db.session.query(EmailOutbox).delete()
+    queued = 0
+    for class_obj in Class.query.all():
+        dates = {record.date for record in Attendance.query.filter_by(class_id=class_obj.id, status='Absent')}
+        for attendance_date in dates:
+            queued += enqueue_absence_notifications(class_obj.id, attendance_date, class_obj.teacher_id)
+    db.session.commit()
+    return queued
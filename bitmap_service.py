@@ -0,0 +1,260 @@
+"""
+Packed per-student attendance calendars
+
+Next to the Attendance rows, each student of a class has one
+AttendanceBitmap: the student's status on every day from the bitmap's
+origin, as 2-bit models.STATUS_CODES packed four days per byte (0 where
+there is no record). A term of 120 days is 30 bytes instead of 120 rows, a
+day is found by its offset from the origin, and the status counts of a
+range are read a byte at a time from lookup tables.
+
+mark_class_attendance updates the bitmaps of the class in the same
+transaction as the attendance rows. Origins are always a whole number of
+bytes after BITMAP_EPOCH, so marking a day before a bitmap's origin
+prepends zero bytes without repacking. The bitmaps can be regenerated
+from Attendance with:
+
+    flask --app app bitmaps rebuild
+"""
+import logging
+from datetime import date, datetime, timedelta
+from itertools import groupby
+import click
+from database import db
+from models import Attendance, AttendanceBitmap, NO_RECORD, STATUS_CODES, STATUS_NAMES
+from sqlalchemy import select, delete, insert
+
+DAYS_PER_BYTE = 4
+BITMAP_EPOCH = date(2000, 1, 1)
+
+DEFAULT_HEATMAP_DAYS = 84  # twelve weeks
+MAX_HEATMAP_DAYS = 366
+
+# Attendance can be marked from BITMAP_EPOCH to this many days ahead, which
+# bounds how far a single mark can grow a bitmap
+MAX_MARK_DAYS_AHEAD = 366
+
+# Number of days with each code (0-3) in every possible byte
+BYTE_CODE_COUNTS = [
+    tuple(sum(1 for slot in range(DAYS_PER_BYTE) if (byte >> (2 * slot)) & 3 == code) for code in range(4))
+    for byte in range(256)
+]
+
+def aligned_origin(day):
+    """Latest byte-aligned origin on or before day"""
+    return day - timedelta(days=(day - BITMAP_EPOCH).days % DAYS_PER_BYTE)
+
+def markable_date_range(today=None):
+    """(first, last) day attendance can be marked for"""
+    today = today or date.today()
+    return BITMAP_EPOCH, today + timedelta(days=MAX_MARK_DAYS_AHEAD)
+
+class StatusBitmap:
+    """Mutable packed status calendar starting at a byte-aligned origin"""
+
+    def __init__(self, origin, bits=b''):
+        self.origin = origin
+        self.bits = bytearray(bits)
+
+    @property
+    def end(self):
+        """Day after the last slot"""
+        return self.origin + timedelta(days=len(self.bits) * DAYS_PER_BYTE)
+
+    def recorded_span(self):
+        """(first, last) day with a status, or None when nothing is recorded"""
+        used = [index for index, byte in enumerate(self.bits) if byte]
+        if not used:
+            return None
+        first_byte, last_byte = self.bits[used[0]], self.bits[used[-1]]
+        first_slot = min(slot for slot in range(DAYS_PER_BYTE) if (first_byte >> (2 * slot)) & 3)
+        last_slot = max(slot for slot in range(DAYS_PER_BYTE) if (last_byte >> (2 * slot)) & 3)
+        return (self.origin + timedelta(days=used[0] * DAYS_PER_BYTE + first_slot),
+                self.origin + timedelta(days=used[-1] * DAYS_PER_BYTE + last_slot))
+
+    def get(self, day):
+        """Status code of a day, NO_RECORD outside the bitmap"""
+        offset = (day - self.origin).days
+        if offset < 0 or offset >= len(self.bits) * DAYS_PER_BYTE:
+            return NO_RECORD
+        return (self.bits[offset // DAYS_PER_BYTE] >> (2 * (offset % DAYS_PER_BYTE))) & 3
+
+    def set(self, day, code):
+        """Store a status code, growing the bitmap at either end as needed"""
+        if day < self.origin:
+            new_origin = aligned_origin(day)
+            self.bits[:0] = bytes((self.origin - new_origin).days // DAYS_PER_BYTE)
+            self.origin = new_origin
+
+        offset = (day - self.origin).days
+        index, shift = offset // DAYS_PER_BYTE, 2 * (offset % DAYS_PER_BYTE)
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index + 1 - len(self.bits)))
+        self.bits[index] = (self.bits[index] & ~(3 << shift)) | (code << shift)
+
+    def codes(self, start, end):
+        """Status code of every day from start to end inclusive"""
+        return [self.get(start + timedelta(days=offset)) for offset in range((end - start).days + 1)]
+
+    def count(self, start=None, end=None):
+        """{code: number of days} from start to end inclusive, whole bytes via BYTE_CODE_COUNTS"""
+        start = max(start or self.origin, self.origin)
+        end = min(end or self.end - timedelta(days=1), self.end - timedelta(days=1))
+        counts = [0, 0, 0, 0]
+        if end < start:
+            return dict(enumerate(counts))
+
+        first, last = (start - self.origin).days, (end - self.origin).days
+        first_byte = -(-first // DAYS_PER_BYTE)
+        last_byte = (last + 1) // DAYS_PER_BYTE
+        if first_byte >= last_byte:
+            # Range within a single byte
+            for offset in range(first, last + 1):
+                counts[self.get(self.origin + timedelta(days=offset))] += 1
+            return dict(enumerate(counts))
+
+        for byte in self.bits[first_byte:last_byte]:
+            for code, byte_count in enumerate(BYTE_CODE_COUNTS[byte]):
+                counts[code] += byte_count
+        for offset in list(range(first, first_byte * DAYS_PER_BYTE)) + list(range(last_byte * DAYS_PER_BYTE, last + 1)):
+            counts[self.get(self.origin + timedelta(days=offset))] += 1
+        return dict(enumerate(counts))
+
+def sync_attendance_bitmaps(class_id, attendance_date, statuses):
+    """
+    Write one date's statuses into the bitmaps of a class's students
+
+    statuses maps Student.id to a status name, as for mark_class_attendance.
+    Reads the class's bitmaps in one locked query and writes the changed
+    and new ones back in bulk. Does not commit.
+    """
+    if not statuses:
+        return
+    bitmaps = {
+        bitmap.student_id: bitmap
+        for bitmap in db.session.execute(
+            select(AttendanceBitmap).where(AttendanceBitmap.class_id == class_id).with_for_update()
+        ).scalars()
+    }
+
+    now = datetime.utcnow()
+    new_bitmaps = []
+    for student_id, status in statuses.items():
+        code = STATUS_CODES.get(status, NO_RECORD)
+        bitmap = bitmaps.get(student_id)
+        packed = StatusBitmap(bitmap.origin, bitmap.bits) if bitmap else StatusBitmap(aligned_origin(attendance_date))
+        if bitmap and packed.get(attendance_date) == code:
+            continue
+        packed.set(attendance_date, code)
+
+        if bitmap:
+            bitmap.origin, bitmap.bits, bitmap.updated_at = packed.origin, bytes(packed.bits), now
+        else:
+            new_bitmaps.append({'student_id': student_id, 'class_id': class_id, 'origin': packed.origin,
+                                'bits': bytes(packed.bits), 'updated_at': now})
+
+    if new_bitmaps:
+        db.session.execute(insert(AttendanceBitmap), new_bitmaps)
+
+def rebuild_attendance_bitmaps(class_id=None, connection=None):
+    """
+    Regenerate the bitmaps from Attendance, for one class or every class
+
+    Reads the attendance once, ordered by class and student, and inserts
+    the bitmaps in bulk. Does not commit when using db.session. Returns
+    the number of bitmaps written.
+    """
+    executor = connection or db.session
+    clear = delete(AttendanceBitmap)
+    query = select(Attendance.class_id, Attendance.student_id, Attendance.date, Attendance.status)
+    if class_id:
+        clear = clear.where(AttendanceBitmap.class_id == class_id)
+        query = query.where(Attendance.class_id == class_id)
+    executor.execute(clear)
+
+    rows = executor.execute(query.order_by(Attendance.class_id, Attendance.student_id, Attendance.date))
+    now = datetime.utcnow()
+    bitmaps = []
+    for (row_class_id, student_id), records in groupby(rows, key=lambda row: (row[0], row[1])):
+        packed = None
+        for _, _, day, status in records:
+            packed = packed or StatusBitmap(aligned_origin(day))
+            packed.set(day, STATUS_CODES.get(status, NO_RECORD))
+        bitmaps.append({'student_id': student_id, 'class_id': row_class_id, 'origin': packed.origin,
+                        'bits': bytes(packed.bits), 'updated_at': now})
+
+    if bitmaps:
+        executor.execute(insert(AttendanceBitmap), bitmaps)
+    return len(bitmaps)
+
+def load_bitmap(student_id, class_id):
+    """StatusBitmap of a student in a class, or None when nothing has been marked"""
+    bitmap = db.session.execute(
+        select(AttendanceBitmap.origin, AttendanceBitmap.bits).where(
+            AttendanceBitmap.student_id == student_id, AttendanceBitmap.class_id == class_id
+        )
+    ).first()
+    return StatusBitmap(bitmap.origin, bitmap.bits) if bitmap else None
+
+def get_student_calendar(student_id, class_id, start_date=None, end_date=None):
+    """
+    A student's daily statuses and counts for a date range
+
+    The range defaults to the first and last recorded days; only the part
+    of it that overlaps them is read. Returns a dictionary with start, end,
+    the status name of each recorded day ({date: status}), the counts per
+    status and the share of recorded days that are Present.
+    """
+    packed = load_bitmap(student_id, class_id)
+    span = packed.recorded_span() if packed else None
+    if span is None:
+        return {'start': start_date, 'end': end_date, 'days': {}, 'counts': dict.fromkeys(STATUS_CODES, 0),
+                'present_percentage': None}
+
+    start = start_date or span[0]
+    end = end_date or span[1]
+    first, last = max(start, span[0]), min(end, span[1])
+    days = {
+        first + timedelta(days=offset): STATUS_NAMES[code]
+        for offset, code in enumerate(packed.codes(first, last)) if code != NO_RECORD
+    }
+    counts = packed.count(first, last)
+    recorded = sum(counts[code] for code in STATUS_NAMES)
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'counts': {status: counts[code] for status, code in STATUS_CODES.items()},
+        'present_percentage': round(counts[STATUS_CODES['Present']] * 100 / recorded, 1) if recorded else None
+    }
+
+def get_class_heatmap(class_id, start_date, end_date):
+    """
+    Status codes of every student of a class for each day of a range
+
+    Returns {student_id: "0121..."} with one digit per day from start_date
+    to end_date (models.STATUS_CODES, 0 for no record), from one query.
+    """
+    rows = db.session.execute(
+        select(AttendanceBitmap.student_id, AttendanceBitmap.origin, AttendanceBitmap.bits)
+        .where(AttendanceBitmap.class_id == class_id)
+    )
+    return {
+        student_id: ''.join(str(code) for code in StatusBitmap(origin, bits).codes(start_date, end_date))
+        for student_id, origin, bits in rows
+    }
+
+def init_bitmap_commands(app):
+    """Register the `flask bitmaps` commands"""
+    @app.cli.group('bitmaps')
+    def bitmaps_cli():
+        """Packed attendance calendars"""
+
+    @bitmaps_cli.command('rebuild')
+    @click.option('--class-id', type=int, default=None, help="Only rebuild this class")
+    def rebuild(class_id):
+        """Regenerate the bitmaps from the attendance records"""
+        count = rebuild_attendance_bitmaps(class_id)
+        db.session.commit()
+        logging.info(f"Rebuilt {count} attendance bitmaps")
+        click.echo(f"Rebuilt {count} attendance bitmaps")
@@ -3,11 +3,14 @@ Bulk import service for reading Excel and CSV files to import students
 """
 import pandas as pd
 import os
+import codecs
 import logging
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterator, Optional, Callable
+from openpyxl import load_workbook
 from werkzeug.utils import secure_filename
 from models import Student
 from database import db
+from sqlalchemy import insert, select
 from email_validator import validate_email, EmailNotValidError
 
 def allowed_file(filename):
@@ -15,22 +18,35 @@ def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+CSV_ENCODINGS = ['utf-8', 'latin-1', 'cp1252']
+ENCODING_SAMPLE_SIZE = 1024 * 1024
+DEFAULT_IMPORT_BATCH_SIZE = 5000
+
+def detect_encoding(file_path: str, sample_size: int = ENCODING_SAMPLE_SIZE) -> str:
+    """Pick the first supported encoding that decodes a sample of the file"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size)
+        is_complete = not f.read(1)
+    
+    for encoding in CSV_ENCODINGS:
+        # Incremental decoding tolerates a multi-byte character cut off at the end of the sample
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            decoder.decode(sample, final=is_complete)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    
+    raise ValueError("Could not read CSV file with any supported encoding")
+
 def read_file_data(file_path: str) -> pd.DataFrame:
-    """Read data from Excel or CSV file"""
+    """Read data from Excel or CSV file, keeping values as text"""
     try:
-        if file_path.endswith('.csv'):
-            # Try different encodings for CSV files
-            for encoding in ['utf-8', 'latin-1', 'cp1252']:
-                try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Could not read CSV file with any supported encoding")
+        if file_path.lower().endswith('.csv'):
+            df = pd.read_csv(file_path, encoding=detect_encoding(file_path), dtype=str)
         else:
             # Read Excel file
-            df = pd.read_excel(file_path, engine='openpyxl')
+            df = pd.read_excel(file_path, engine='openpyxl', dtype=str)
         
         return df
     
@@ -38,6 +54,63 @@ def read_file_data(file_path: str) -> pd.DataFrame:
         logging.error(f"Error reading file {file_path}: {str(e)}")
         raise ValueError(f"Could not read file: {str(e)}")
 
+def _iter_xlsx_chunks(file_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Read an .xlsx sheet row by row with openpyxl's read-only mode"""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f"Unnamed: {idx}" if name is None else name for idx, name in enumerate(header)]
+        
+        # Index = file row number - 2, matching pandas' default index for the same file.
+        # Blank rows are held back until a later row has data, so trailing
+        # blank rows are dropped as pandas does.
+        batch, index, blank_rows = [], [], []
+        for index_value, row in enumerate(rows):
+            if all(value is None for value in row):
+                blank_rows.append(index_value)
+                continue
+            for blank_index in blank_rows:
+                batch.append((None,) * len(columns))
+                index.append(blank_index)
+            blank_rows = []
+            batch.append(row[:len(columns)])
+            index.append(index_value)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame.from_records(batch, columns=columns, index=index)
+                batch, index = [], []
+        
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns, index=index)
+    finally:
+        wb.close()
+
+def iter_file_chunks(file_path: str, chunk_size: int = DEFAULT_IMPORT_BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Read an uploaded file as DataFrames of at most chunk_size rows
+    
+    CSV files are decoded with an encoding detected once from a sample and read
+    with pandas' chunksize; .xlsx files are streamed with openpyxl. Values are
+    kept as text so every chunk is parsed the same way. Other Excel formats
+    are read whole.
+    """
+    try:
+        lower_path = file_path.lower()
+        if lower_path.endswith('.csv'):
+            yield from pd.read_csv(file_path, encoding=detect_encoding(file_path), dtype=str, chunksize=chunk_size)
+        elif lower_path.endswith('.xlsx'):
+            yield from _iter_xlsx_chunks(file_path, chunk_size)
+        else:
+            yield read_file_data(file_path)
+    
+    except ValueError:
+        raise
+    except Exception as e:
+        logging.error(f"Error reading file {file_path}: {str(e)}")
+        raise ValueError(f"Could not read file: {str(e)}")
+
 def normalize_column_name(column_name: str) -> str:
     """Normalize column names for case-insensitive matching"""
     return str(column_name).lower().strip().replace(' ', '_')
@@ -53,46 +126,136 @@ def find_column(df: pd.DataFrame, possible_names: List[str]) -> str:
     
     return None
 
-def validate_student_data(student_data: Dict) -> Tuple[bool, str]:
-    """Validate individual student data"""
-    # Check required fields
-    if not student_data.get('student_id'):
-        return False, "Student ID is required"
+# Length limits matching the Student columns
+MAX_STUDENT_ID_LENGTH = 50
+MAX_NAME_LENGTH = 100
+MAX_EMAIL_LENGTH = 120
+
+def _email_error(email: str) -> str:
+    """Return the validation error for an email address, or an empty string"""
+    try:
+        validate_email(email)
+        return ""
+    except EmailNotValidError:
+        return f"Invalid email format: {email}"
+
+def _clean_column(df: pd.DataFrame, column: str) -> pd.Series:
+    """Column as stripped strings, with missing values as empty strings"""
+    values = df[column]
+    return values.where(values.notna(), "").astype(str).str.strip()
+
+def get_existing_student_keys(class_id: int, skip_duplicates: bool) -> set:
+    """
+    Student IDs already in the class, as duplicate-check keys
     
-    if not student_data.get('name'):
-        return False, "Name is required"
+    Keys are lower-cased when duplicates are skipped (case-insensitive match)
+    and kept exactly as stored otherwise.
+    """
+    student_ids = db.session.execute(
+        select(Student.student_id).where(Student.class_id == class_id)
+    ).scalars()
+    if skip_duplicates:
+        return {student_id.lower() for student_id in student_ids}
+    return set(student_ids)
+
+def prepare_student_records(df: pd.DataFrame, student_id_col: str, name_col: str, email_col: str,
+                            existing_keys: set, skip_duplicates: bool) -> Tuple[List[Dict], List[str], int]:
+    """
+    Validate a frame of student rows with column operations
     
-    if not student_data.get('email'):
-        return False, "Email is required"
+    Checks required fields, then email format, then length limits, and
+    reports at most one error per row as "Row <n>: <message>" using the file
+    row number (index + 2). Accepted keys are added to existing_keys so later
+    frames see them as duplicates.
     
-    # Validate email format
-    try:
-        validate_email(student_data['email'])
-    except EmailNotValidError:
-        return False, f"Invalid email format: {student_data['email']}"
+    Returns (records to insert, error messages in row order, skipped count).
+    """
+    frame = pd.DataFrame({
+        'student_id': _clean_column(df, student_id_col),
+        'name': _clean_column(df, name_col),
+        'email': _clean_column(df, email_col)
+    })
+    
+    # Skip empty rows
+    frame = frame[(frame != "").any(axis=1)]
+    if frame.empty:
+        return [], [], 0
+    
+    # Required fields
+    checks = [
+        (frame['student_id'] == "", "Student ID is required"),
+        (frame['name'] == "", "Name is required"),
+        (frame['email'] == "", "Email is required"),
+    ]
+    errors = pd.Series("", index=frame.index)
+    for failed, message in checks:
+        errors = errors.mask((errors == "") & failed, message)
     
-    # Check for reasonable length limits
-    if len(student_data['student_id']) > 50:
-        return False, "Student ID too long (max 50 characters)"
+    # Email format, validated once per distinct address
+    needs_email_check = errors == ""
+    email_errors = frame.loc[needs_email_check, 'email']
+    email_errors = email_errors.map({email: _email_error(email) for email in email_errors.unique()})
+    errors.loc[needs_email_check] = email_errors
     
-    if len(student_data['name']) > 100:
-        return False, "Name too long (max 100 characters)"
+    length_checks = [
+        (frame['student_id'].str.len() > MAX_STUDENT_ID_LENGTH,
+         f"Student ID too long (max {MAX_STUDENT_ID_LENGTH} characters)"),
+        (frame['name'].str.len() > MAX_NAME_LENGTH, f"Name too long (max {MAX_NAME_LENGTH} characters)"),
+        (frame['email'].str.len() > MAX_EMAIL_LENGTH, f"Email too long (max {MAX_EMAIL_LENGTH} characters)"),
+    ]
+    for failed, message in length_checks:
+        errors = errors.mask((errors == "") & failed, message)
     
-    if len(student_data['email']) > 120:
-        return False, "Email too long (max 120 characters)"
+    # Duplicates against the database and earlier rows of the file
+    valid = errors == ""
+    keys = frame['student_id'].str.lower() if skip_duplicates else frame['student_id']
+    duplicate = valid & (keys.isin(existing_keys) | (keys.where(valid).duplicated() & valid))
+    suffix = " (skipped)" if skip_duplicates else ""
+    errors = errors.mask(duplicate, "Student ID '" + frame['student_id'] + "' already exists" + suffix)
+    skipped = int(duplicate.sum()) if skip_duplicates else 0
     
-    return True, ""
+    accepted = frame[errors == ""]
+    existing_keys.update(keys[errors == ""])
+    
+    failed_rows = errors[errors != ""]
+    error_messages = [f"Row {index + 2}: {message}" for index, message in failed_rows.items()]
+    
+    return accepted.to_dict('records'), error_messages, skipped
+
+def find_import_columns(df: pd.DataFrame, column_mapping: Dict[str, str]) -> Dict[str, str]:
+    """Locate the Student ID, Name and Email columns, None for any not found"""
+    return {
+        "Student ID": find_column(df, [
+            column_mapping.get('student_id', 'student_id'),
+            'student_id', 'id', 'student_number', 'roll_number'
+        ]),
+        "Name": find_column(df, [
+            column_mapping.get('name', 'name'),
+            'name', 'full_name', 'student_name'
+        ]),
+        "Email": find_column(df, [
+            column_mapping.get('email', 'email'),
+            'email', 'email_address', 'student_email'
+        ])
+    }
 
 def process_bulk_import(file_path: str, class_id: int, column_mapping: Dict[str, str], 
-                       skip_duplicates: bool = True) -> Dict:
+                       skip_duplicates: bool = True, batch_size: int = DEFAULT_IMPORT_BATCH_SIZE,
+                       progress_callback: Optional[Callable[[Dict], None]] = None) -> Dict:
     """
     Process bulk import of students from Excel/CSV file
     
+    The file is read in chunks of batch_size rows. Each chunk is validated
+    and inserted in its own transaction, so memory stays bounded and rows
+    from chunks committed before a failure remain imported.
+    
     Args:
         file_path: Path to the uploaded file
         class_id: ID of the class to add students to
         column_mapping: Dictionary mapping data types to column names
         skip_duplicates: Whether to skip duplicate student IDs
+        batch_size: Number of rows read, validated and committed at a time
+        progress_callback: Called with the running results after each chunk
     
     Returns:
         Dictionary with import results
@@ -107,123 +270,54 @@ def process_bulk_import(file_path: str, class_id: int, column_mapping: Dict[str,
     }
     
     try:
-        # Read the file
-        df = read_file_data(file_path)
-        results['total_rows'] = len(df)
-        
-        if df.empty:
-            results['errors'].append("File is empty or has no data rows")
-            return results
-        
-        # Find columns based on mapping
-        student_id_col = find_column(df, [
-            column_mapping.get('student_id', 'student_id'),
-            'student_id', 'id', 'student_number', 'roll_number'
-        ])
-        
-        name_col = find_column(df, [
-            column_mapping.get('name', 'name'),
-            'name', 'full_name', 'student_name'
-        ])
+        columns = None
+        existing_keys = None
         
-        email_col = find_column(df, [
-            column_mapping.get('email', 'email'),
-            'email', 'email_address', 'student_email'
-        ])
-        
-        # Check if required columns were found
-        missing_columns = []
-        if not student_id_col:
-            missing_columns.append("Student ID")
-        if not name_col:
-            missing_columns.append("Name")
-        if not email_col:
-            missing_columns.append("Email")
+        for chunk in iter_file_chunks(file_path, batch_size):
+            results['total_rows'] += len(chunk)
+            
+            if columns is None:
+                # Find columns based on mapping
+                columns = find_import_columns(chunk, column_mapping)
+                missing_columns = [label for label, column in columns.items() if not column]
+                if missing_columns:
+                    results['errors'].append(f"Could not find columns: {', '.join(missing_columns)}")
+                    return results
+                
+                # Existing student IDs in this class, fetched once for duplicate checks
+                existing_keys = get_existing_student_keys(class_id, skip_duplicates)
+            
+            # Validate the chunk at once and insert its valid rows in one statement
+            records, row_errors, skipped = prepare_student_records(
+                chunk, columns['Student ID'], columns['Name'], columns['Email'], existing_keys, skip_duplicates
+            )
+            results['errors'].extend(row_errors)
+            results['skipped'] += skipped
+            
+            if records:
+                db.session.execute(insert(Student), [dict(record, class_id=class_id) for record in records])
+                db.session.commit()
+                results['imported'] += len(records)
+                results['imported_students'].extend(records)
+            
+            if progress_callback:
+                progress_callback(results)
         
-        if missing_columns:
-            results['errors'].append(f"Could not find columns: {', '.join(missing_columns)}")
+        if results['total_rows'] == 0:
+            results['errors'].append("File is empty or has no data rows")
             return results
         
-        # Get existing student IDs in this class to check for duplicates
-        existing_student_ids = set()
-        if skip_duplicates:
-            existing_students = Student.query.filter_by(class_id=class_id).all()
-            existing_student_ids = {s.student_id.lower() for s in existing_students}
-        
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                # Extract data from row
-                student_data = {
-                    'student_id': str(row[student_id_col]).strip() if pd.notna(row[student_id_col]) else "",
-                    'name': str(row[name_col]).strip() if pd.notna(row[name_col]) else "",
-                    'email': str(row[email_col]).strip() if pd.notna(row[email_col]) else ""
-                }
-                
-                # Skip empty rows
-                if not any(student_data.values()):
-                    continue
-                
-                # Validate student data
-                is_valid, error_msg = validate_student_data(student_data)
-                if not is_valid:
-                    results['errors'].append(f"Row {index + 2}: {error_msg}")
-                    continue
-                
-                # Check for duplicates
-                if skip_duplicates and student_data['student_id'].lower() in existing_student_ids:
-                    results['skipped'] += 1
-                    results['errors'].append(f"Row {index + 2}: Student ID '{student_data['student_id']}' already exists (skipped)")
-                    continue
-                
-                # Check if student with same ID already exists in database
-                existing_student = Student.query.filter_by(
-                    class_id=class_id, 
-                    student_id=student_data['student_id']
-                ).first()
-                
-                if existing_student:
-                    if skip_duplicates:
-                        results['skipped'] += 1
-                        results['errors'].append(f"Row {index + 2}: Student ID '{student_data['student_id']}' already exists (skipped)")
-                        continue
-                    else:
-                        results['errors'].append(f"Row {index + 2}: Student ID '{student_data['student_id']}' already exists")
-                        continue
-                
-                # Create new student
-                new_student = Student(
-                    student_id=student_data['student_id'],
-                    name=student_data['name'],
-                    email=student_data['email'],
-                    class_id=class_id
-                )
-                
-                db.session.add(new_student)
-                results['imported'] += 1
-                results['imported_students'].append(student_data)
-                
-                # Add to existing IDs set to prevent duplicates within the same import
-                existing_student_ids.add(student_data['student_id'].lower())
-                
-            except Exception as e:
-                results['errors'].append(f"Row {index + 2}: {str(e)}")
-                continue
-        
-        # Commit all changes
         if results['imported'] > 0:
-            db.session.commit()
             results['success'] = True
             logging.info(f"Successfully imported {results['imported']} students to class {class_id}")
-        else:
-            db.session.rollback()
-            if not results['errors']:
-                results['errors'].append("No valid student data found to import")
+        elif not results['errors']:
+            results['errors'].append("No valid student data found to import")
     
     except Exception as e:
         db.session.rollback()
         logging.error(f"Bulk import failed: {str(e)}")
         results['errors'].append(f"Import failed: {str(e)}")
+        results['success'] = results['imported'] > 0
     
     finally:
         # Clean up the uploaded file
@@ -233,4 +327,4 @@ def process_bulk_import(file_path: str, class_id: int, column_mapping: Dict[str,
         except Exception as e:
             logging.warning(f"Could not delete uploaded file {file_path}: {str(e)}")
     
-    return results
\ No newline at end of file
+    return results
@@ -0,0 +1,180 @@
+"""
+Teacher-wide export of every class as a single ZIP archive
+
+Each class is rendered by a separate process from a shared process pool.
+Results are written into the archive as they complete and the archive is
+streamed to the client while it is being built. A manifest.json inside the
+ZIP lists every class with its file name or the error that stopped it; a
+class whose file broke off while being copied is listed as incomplete with
+the name of the partial member.
+"""
+import os
+import json
+import logging
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from flask import Flask
+from werkzeug.utils import secure_filename
+from database import db
+from models import Class
+from export_service import export_to_excel, export_to_csv
+from export_cache_service import get_data_version, get_cache_key, get_cached_export, store_export
+
+# Export format -> (file extension, export function)
+BUNDLE_FORMATS = {
+    'excel': ('.xlsx', export_to_excel),
+    'csv': ('.csv', export_to_csv)
+}
+
+# Configuration passed on to worker processes
+WORKER_CONFIG_KEYS = ('SQLALCHEMY_DATABASE_URI', 'SQLALCHEMY_ENGINE_OPTIONS', 'EXPORT_CACHE_MAX_BYTES')
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+# Flask app of a worker process, created by _init_export_worker
+_worker_app = None
+
+def get_process_pool(app):
+    """Return the shared export process pool, creating it on first use"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            worker_config = {key: app.config[key] for key in WORKER_CONFIG_KEYS if key in app.config}
+            _process_pool = ProcessPoolExecutor(
+                max_workers=app.config.get('EXPORT_PROCESS_WORKERS') or os.cpu_count(),
+                initializer=_init_export_worker,
+                initargs=(worker_config, app.instance_path)
+            )
+        return _process_pool
+
+def _init_export_worker(worker_config, instance_path):
+    """Give a worker process its own app and database connections"""
+    global _worker_app
+    _worker_app = Flask(__name__, instance_path=instance_path)
+    _worker_app.config.update(worker_config)
+    db.init_app(_worker_app)
+
+def _render_class_export(class_id, export_format, start_date, end_date):
+    """
+    Worker task: export one class, going through the export cache
+
+    Returns a dictionary with the class details and either the path of the
+    rendered file or the error message.
+    """
+    result = {'class_id': class_id, 'class_name': None, 'file_path': None, 'error': None}
+
+    with _worker_app.app_context():
+        try:
+            class_obj = db.session.get(Class, class_id)
+            if class_obj is None:
+                raise ValueError("Class no longer exists")
+            result['class_name'] = class_obj.name
+
+            extension, export_function = BUNDLE_FORMATS[export_format]
+            cache_key = get_cache_key(class_obj, start_date, end_date, export_format,
+                                      get_data_version(class_obj, start_date, end_date))
+            file_path = get_cached_export(_worker_app, cache_key, extension)
+            if not file_path:
+                file_path = store_export(_worker_app, cache_key, extension,
+                                         export_function(class_obj, start_date, end_date))
+            result['file_path'] = file_path
+
+        except Exception as e:
+            logging.error(f"Export of class {class_id} failed: {str(e)}")
+            result['error'] = str(e)
+
+        finally:
+            db.session.remove()
+
+    return result
+
+class _ZipStream:
+    """Write-only file object collecting the bytes zipfile produces"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_teacher_export_zip(app, teacher_id, export_format, start_date=None, end_date=None):
+    """
+    Yield a ZIP archive with one export per class of the teacher
+
+    Raises ValueError for an unsupported format before anything is yielded.
+    """
+    if export_format not in BUNDLE_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    extension = BUNDLE_FORMATS[export_format][0]
+
+    classes = Class.query.filter_by(teacher_id=teacher_id).order_by(Class.name).all()
+    class_names = {class_obj.id: class_obj.name for class_obj in classes}
+
+    return _generate_zip(app, class_names, export_format, extension, start_date, end_date)
+
+def _generate_zip(app, class_names, export_format, extension, start_date, end_date):
+    pool = get_process_pool(app)
+    futures = {
+        pool.submit(_render_class_export, class_id, export_format, start_date, end_date): class_id
+        for class_id in class_names
+    }
+
+    stream = _ZipStream()
+    manifest = []
+
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for future in as_completed(futures):
+            class_id = futures[future]
+            entry = {'class_id': class_id, 'class_name': class_names[class_id], 'file': None, 'status': 'failed', 'error': None}
+
+            try:
+                result = future.result()
+                if result['error']:
+                    raise RuntimeError(result['error'])
+
+                file_name = secure_filename(f"{class_names[class_id]}_{class_id}_attendance") + extension
+                with open(result['file_path'], 'rb') as source:
+                    with archive.open(file_name, 'w') as target:
+                        # From here on the member is in the archive, even if incomplete
+                        entry['file'] = file_name
+                        while True:
+                            data = source.read(ZIP_CHUNK_SIZE)
+                            if not data:
+                                break
+                            target.write(data)
+                            yield stream.drain()
+                entry['status'] = 'ok'
+
+            except Exception as e:
+                logging.error(f"Could not add class {class_id} to export bundle: {str(e)}")
+                if entry['file']:
+                    entry['status'] = 'incomplete'
+                entry['error'] = str(e)
+
+            manifest.append(entry)
+            yield stream.drain()
+
+        manifest.sort(key=lambda item: item['class_name'])
+        archive.writestr('manifest.json', json.dumps({
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'format': export_format,
+            'start_date': str(start_date) if start_date else None,
+            'end_date': str(end_date) if end_date else None,
+            'classes': manifest
+        }, indent=2))
+
+    yield stream.drain()
@@ -0,0 +1,129 @@
+"""
+Key-value cache for data shown on frequently visited pages
+
+By default entries live in an in-process LRU with a per-entry TTL, so each
+worker process has its own copy and invalidations reach only the process
+that made them; the TTL bounds how stale another process can be. Setting
+CACHE_REDIS_URL (and installing redis) switches to a shared Redis cache that
+every process reads and invalidates. Any object with the same get/set/delete
+methods can be passed as CACHE_BACKEND instead, e.g. an LRUCache standing in
+for the shared cache in development.
+"""
+import time
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+DEFAULT_CACHE_TTL = 60  # seconds
+
+class LRUCache:
+    """Thread-safe in-process cache evicting the least recently used entry when full"""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=DEFAULT_CACHE_TTL):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RedisCache:
+    """Cache shared between processes on a Redis server; values are pickled"""
+
+    def __init__(self, client, prefix='attendance:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except Exception as e:
+            logging.warning(f"Cache read of {key} failed: {str(e)}")
+            return None
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=DEFAULT_CACHE_TTL):
+        try:
+            self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            logging.warning(f"Cache write of {key} failed: {str(e)}")
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self.client.delete(*(self.prefix + key for key in keys))
+        except Exception as e:
+            # A failed invalidation leaves the old value until its TTL runs out
+            logging.error(f"Cache invalidation of {', '.join(keys)} failed: {str(e)}")
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+def create_cache(config):
+    """Cache backend for an app's config: CACHE_BACKEND, Redis at CACHE_REDIS_URL, or an LRUCache"""
+    if config.get('CACHE_BACKEND') is not None:
+        return config['CACHE_BACKEND']
+
+    redis_url = config.get('CACHE_REDIS_URL')
+    if redis_url:
+        try:
+            import redis
+            return RedisCache(redis.Redis.from_url(redis_url), config.get('CACHE_KEY_PREFIX', 'attendance:'))
+        except ImportError:
+            logging.warning("CACHE_REDIS_URL is set but redis is not installed - using the in-process cache")
+
+    return LRUCache(config.get('CACHE_MAX_ENTRIES', DEFAULT_CACHE_MAX_ENTRIES))
+
+_cache_lock = threading.Lock()
+
+def get_cache(app):
+    """Return the app's cache, created from its config on first use and kept in app.extensions"""
+    with _cache_lock:
+        if 'cache' not in app.extensions:
+            app.extensions['cache'] = create_cache(app.config)
+        return app.extensions['cache']
+
+def cached(app, key, loader, ttl=None):
+    """Value of key from the cache, calling loader() and caching its result on a miss"""
+    cache = get_cache(app)
+    value = cache.get(key)
+    if value is None:
+        value = loader()
+        cache.set(key, value, ttl if ttl is not None else app.config.get('CACHE_TTL', DEFAULT_CACHE_TTL))
+    return value
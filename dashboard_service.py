@@ -0,0 +1,73 @@
+"""
+Per-teacher dashboard statistics
+
+The dashboard is the landing page after login and after most redirects, so
+its figures (class and student counts, recent activity and the 30-day
+attendance rate) are cached per teacher for DASHBOARD_CACHE_TTL seconds.
+Views that add classes, students or attendance call invalidate_dashboard
+after committing, so the next visit reloads them.
+"""
+from datetime import date, timedelta
+from database import db
+from models import Class, Student, Attendance
+from sqlalchemy import select, func
+from cache_service import get_cache, cached
+from summary_service import get_attendance_rate
+
+DEFAULT_DASHBOARD_CACHE_TTL = 60  # seconds
+RECENT_ACTIVITY_LIMIT = 5
+
+def dashboard_cache_key(teacher_id):
+    return f'dashboard:{teacher_id}'
+
+def recent_attendance_query(class_ids, limit=RECENT_ACTIVITY_LIMIT):
+    """
+    Latest marked attendance across the given classes, newest first
+
+    Each class contributes its own latest rows, read backwards from the
+    (class_id, marked_at) index, so only those few rows are sorted instead
+    of every attendance record of the classes.
+    """
+    latest_in_class = select(Attendance.id).where(Attendance.class_id == Class.id).order_by(
+        Attendance.marked_at.desc()
+    ).limit(limit).correlate(Class).scalar_subquery()
+
+    return select(
+        Student.name.label('student_name'),
+        Class.name.label('class_name'),
+        Attendance.date,
+        Attendance.status,
+        Attendance.marked_at
+    ).select_from(Class).join(Attendance, Attendance.id.in_(latest_in_class)).join(
+        Student, Student.id == Attendance.student_id
+    ).where(Class.id.in_(class_ids)).order_by(Attendance.marked_at.desc()).limit(limit)
+
+def load_dashboard_stats(teacher_id):
+    """
+    Dashboard figures of a teacher, read from the database
+
+    Recent activity is a list of plain dictionaries (student_name,
+    class_name, date, status, marked_at) so the result can be cached.
+    """
+    class_ids = db.session.scalars(select(Class.id).where(Class.teacher_id == teacher_id)).all()
+    total_students = db.session.scalar(
+        select(func.count(Student.id)).join(Class, Class.id == Student.class_id).where(Class.teacher_id == teacher_id)
+    )
+
+    recent_attendance = db.session.execute(recent_attendance_query(class_ids)).mappings().all() if class_ids else []
+
+    return {
+        'total_classes': len(class_ids),
+        'total_students': total_students,
+        'recent_attendance': [dict(record) for record in recent_attendance],
+        'attendance_rate': get_attendance_rate(teacher_id, start_date=date.today() - timedelta(days=30))
+    }
+
+def get_dashboard_stats(app, teacher_id):
+    """Dashboard figures of a teacher, from the cache when fresh"""
+    ttl = app.config.get('DASHBOARD_CACHE_TTL', DEFAULT_DASHBOARD_CACHE_TTL)
+    return cached(app, dashboard_cache_key(teacher_id), lambda: load_dashboard_stats(teacher_id), ttl)
+
+def invalidate_dashboard(app, teacher_id):
+    """Drop a teacher's cached dashboard figures; call after committing a change to them"""
+    get_cache(app).delete(dashboard_cache_key(teacher_id))
@@ -1,43 +1,224 @@
 import os
+import time
+import hashlib
 import smtplib
 import logging
+import threading
+from collections import namedtuple
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
-def send_absence_notification(student, class_obj, attendance_date, teacher):
+SMTP_TIMEOUT = 30  # seconds before a stalled SMTP command fails
+SMTP_NOOP_INTERVAL = 15  # idle seconds after which a pooled session is checked with NOOP
+SMTP_IDLE_TIMEOUT = 120  # idle seconds after which a pooled session is closed
+SMTP_MAX_IDLE_PER_KEY = 2  # idle sessions kept per (server, port, user)
+
+# Errors after which a session is dropped; the message is retried on a fresh
+# one only if the error came before its data was sent
+SMTP_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+SMTPSettings = namedtuple('SMTPSettings', ['server', 'port', 'username', 'password'])
+
+def get_smtp_settings(teacher):
+    """SMTP settings of a teacher, with the same defaults the settings page shows"""
+    return SMTPSettings(
+        teacher.smtp_server or 'smtp.gmail.com',
+        teacher.smtp_port or 587,
+        teacher.smtp_email,
+        teacher.get_smtp_password()
+    )
+
+def open_smtp_connection(settings):
+    """Open an SMTP session and authenticate with STARTTLS"""
+    server = smtplib.SMTP(settings.server, settings.port, timeout=SMTP_TIMEOUT)
+    try:
+        server.starttls()
+        server.login(settings.username, settings.password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def send_envelope(server, sender, recipient):
     """
-    Send email notification to absent student with improved content
+    MAIL FROM and RCPT TO for one message, as sendmail() sends them
+
+    A refused sender or recipient resets the session, so it can be reused,
+    and raises the same exception as sendmail().
     """
-    try:
-        # Check if teacher has email notifications enabled and configured
-        if not teacher.email_notifications_enabled or not teacher.has_email_config():
-            logging.warning(f"Email notifications not configured for teacher {teacher.email}")
-            return False
-        
-        # SMTP configuration from teacher's settings
-        smtp_server = teacher.smtp_server or 'smtp.gmail.com'
-        smtp_port = teacher.smtp_port or 587
-        smtp_username = teacher.smtp_email
-        smtp_password = teacher.get_smtp_password()
+    server.ehlo_or_helo_if_needed()
+    code, response = server.mail(sender)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, response, sender)
+    code, response = server.rcpt(recipient)
+    if code not in (250, 251):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused({recipient: (code, response)})
+
+class SMTPConnectionPool:
+    """
+    Authenticated SMTP sessions kept open per (server, port, user)
+    
+    Idle sessions are checked with NOOP before reuse and replaced when the
+    server has dropped them. A session whose credentials no longer match the
+    teacher's settings is closed instead of reused. `connect` opens a new
+    authenticated session from SMTPSettings.
+    """
+    
+    def __init__(self, connect=open_smtp_connection, noop_interval=SMTP_NOOP_INTERVAL,
+                 idle_timeout=SMTP_IDLE_TIMEOUT, max_idle=SMTP_MAX_IDLE_PER_KEY):
+        self.connect = connect
+        self.noop_interval = noop_interval
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self._idle = {}  # key -> [(server, credentials, last_used)]
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(settings):
+        return (settings.server, settings.port, settings.username)
+    
+    @staticmethod
+    def _credentials(settings):
+        return hashlib.sha256((settings.password or '').encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+    
+    def acquire(self, settings):
+        """Return a healthy session for the settings, reusing an idle one when possible"""
+        key, credentials = self._key(settings), self._credentials(settings)
         
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = smtp_username
-        msg['To'] = student.email
-        msg['Subject'] = f'Absence Notification - {class_obj.name} - {attendance_date.strftime("%B %d, %Y")}'
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                entry = idle.pop() if idle else None
+            if entry is None:
+                return self.connect(settings)
+            
+            server, entry_credentials, last_used = entry
+            idle_for = time.monotonic() - last_used
+            if entry_credentials != credentials or idle_for > self.idle_timeout:
+                self._close(server)
+                continue
+            if idle_for > self.noop_interval:
+                try:
+                    if server.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP failed")
+                except Exception:
+                    server.close()
+                    continue
+            return server
+    
+    def release(self, settings, server):
+        """Return a session to the pool, closing it if the pool is full"""
+        key = self._key(settings)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((server, self._credentials(settings), time.monotonic()))
+                return
+        self._close(server)
+    
+    def send_messages(self, settings, messages, before_send=None):
+        """
+        Send a batch of messages over one session
         
-        # Enhanced email body
-        body = f"""
-Dear {student.name},
+        A session dropped before a message's data was sent is replaced and
+        the message retried once. A drop after that fails the message instead,
+        since the server may already have accepted it; the outbox retries it
+        later. The optional before_send callable runs before each message,
+        e.g. to wait for a rate limiter. Returns one entry per message: None
+        when it was sent, otherwise the exception.
+        """
+        outcomes = []
+        server = None
+        try:
+            for msg in messages:
+                if before_send:
+                    before_send()
+                for attempt in range(2):
+                    if server is None:
+                        server = self.acquire(settings)
+                    data_sent = False
+                    try:
+                        send_envelope(server, settings.username, msg['To'])
+                        data_sent = True
+                        code, response = server.data(msg.as_string())
+                        if code != 250:
+                            server.rset()
+                            raise smtplib.SMTPDataError(code, response)
+                        error = None
+                    except SMTP_CONNECTION_ERRORS as e:
+                        error = e
+                        server.close()
+                        server = None
+                        if not data_sent:
+                            continue
+                    except Exception as e:
+                        error = e
+                    break
+                outcomes.append(error)
+        except Exception as e:
+            # No session could be opened: the rest of the batch fails with the same error
+            outcomes.extend([e] * (len(messages) - len(outcomes)))
+        finally:
+            if server is not None:
+                self.release(settings, server)
+        return outcomes
+    
+    def invalidate(self, settings):
+        """Close the idle sessions of one (server, port, user)"""
+        with self._lock:
+            idle = self._idle.pop(self._key(settings), [])
+        for server, _, _ in idle:
+            self._close(server)
+    
+    def prune(self):
+        """Close sessions that have been idle longer than idle_timeout"""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                expired.extend(server for server, _, last_used in idle if now - last_used > self.idle_timeout)
+                idle[:] = [entry for entry in idle if now - entry[2] <= self.idle_timeout]
+        for server in expired:
+            self._close(server)
+    
+    def close_all(self):
+        """Close every idle session"""
+        with self._lock:
+            idle = [entry for entries in self._idle.values() for entry in entries]
+            self._idle.clear()
+        for server, _, _ in idle:
+            self._close(server)
 
-This is an automated notification to inform you that you were marked absent in the following class:
+_smtp_pool = SMTPConnectionPool()
 
-📚 Intership Details:
-   • Session: {class_obj.name}
-   • Domain: {class_obj.subject}
-   • Date: {attendance_date.strftime('%A, %B %d, %Y')}
-   • Team Lead: {teacher.name}
+def get_smtp_pool():
+    """The process-wide SMTP connection pool"""
+    return _smtp_pool
+
+def _build_absence_email(student, teacher, subject, details):
+    """
+    Absence email to a student: the class details, then the action, note and signature
+    """
+    # Create message
+    msg = MIMEMultipart()
+    msg['From'] = teacher.smtp_email
+    msg['To'] = student.email
+    msg['Subject'] = subject
+    
+    body = f"""
+Dear {student.name},
+
+{details}
 
 📝 Action Required:
 Please provide a reason for your absence by replying to this email.
@@ -54,24 +235,40 @@ Best regards,
 ---
 This is an automated message from the Attendance Management System.
 Please do not reply to this email unless providing absence justification.
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_username, smtp_password)
-        text = msg.as_string()
-        server.sendmail(smtp_username, student.email, text)
-        server.quit()
-        
-        logging.info(f"Absence notification sent to {student.email}")
-        return True
-        
-    except Exception as e:
-        logging.error(f"Failed to send email to {student.email}: {str(e)}")
-        return False
+    """
+    
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+def build_absence_message(student, class_obj, attendance_date, teacher):
+    """
+    Build the absence notification email for one student
+    """
+    details = f"""This is an automated notification to inform you that you were marked absent in the following class:
+
+📚 Internship Details:
+   • Session: {class_obj.name}
+   • Domain: {class_obj.subject}
+   • Date: {attendance_date.strftime('%A, %B %d, %Y')}
+   • Team Lead: {teacher.name}"""
+    
+    subject = f'Absence Notification - {class_obj.name} - {attendance_date.strftime("%B %d, %Y")}'
+    return _build_absence_email(student, teacher, subject, details)
+
+def build_absence_digest_message(student, classes, attendance_date, teacher):
+    """
+    Build one email covering a student's absences in several classes on one date
+    """
+    session_lines = '\n'.join(f'   • {class_obj.name} ({class_obj.subject})' for class_obj in classes)
+    details = f"""This is an automated notification to inform you that you were marked absent in the following sessions on {attendance_date.strftime('%A, %B %d, %Y')}:
+
+📚 Internship Sessions:
+{session_lines}
+
+👤 Team Lead: {teacher.name}"""
+    
+    subject = f'Absence Notification - {len(classes)} sessions - {attendance_date.strftime("%B %d, %Y")}'
+    return _build_absence_email(student, teacher, subject, details)
 
 def send_test_email(recipient_email, teacher):
     """
@@ -83,10 +280,8 @@ def send_test_email(recipient_email, teacher):
             return False, "Email settings not configured. Please configure your SMTP settings in your profile."
         
         # SMTP configuration from teacher's settings
-        smtp_server = teacher.smtp_server or 'smtp.gmail.com'
-        smtp_port = teacher.smtp_port or 587
-        smtp_username = teacher.smtp_email
-        smtp_password = teacher.get_smtp_password()
+        settings = get_smtp_settings(teacher)
+        smtp_server, smtp_port, smtp_username = settings.server, settings.port, settings.username
         
         # Create message
         msg = MIMEMultipart()
@@ -116,13 +311,10 @@ Attendance Management System
         
         msg.attach(MIMEText(body, 'plain'))
         
-        # Send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_username, smtp_password)
-        text = msg.as_string()
-        server.sendmail(smtp_username, recipient_email, text)
-        server.quit()
+        # Send email over a pooled connection
+        error = get_smtp_pool().send_messages(settings, [msg])[0]
+        if error:
+            raise error
         
         logging.info(f"Test email sent successfully to {recipient_email}")
         return True, "Test email sent successfully!"
@@ -0,0 +1,128 @@
+"""
+On-disk cache for generated export files
+
+Exports are stored under instance/export_cache, keyed by a hash of the class,
+date range, format and a data version that changes whenever the class's
+students or in-range attendance change. Total cache size is bounded; the
+least recently used files are evicted first.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from database import db
+from models import Student, Attendance
+from sqlalchemy import func, select
+
+DEFAULT_EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+_eviction_lock = threading.Lock()
+
+def get_cache_dir(app):
+    """Directory holding cached export files"""
+    cache_dir = os.path.join(app.instance_path, 'export_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def get_data_version(class_obj, start_date=None, end_date=None):
+    """
+    Fingerprint of the data an export of this class and range depends on
+
+    One query: latest marked_at and row count of the in-range attendance,
+    plus the count and highest id of the class's students.
+    """
+    attendance_filter = [Attendance.class_id == class_obj.id]
+    if start_date:
+        attendance_filter.append(Attendance.date >= start_date)
+    if end_date:
+        attendance_filter.append(Attendance.date <= end_date)
+
+    latest_mark = select(func.max(Attendance.marked_at)).where(*attendance_filter).scalar_subquery()
+    attendance_count = select(func.count(Attendance.id)).where(*attendance_filter).scalar_subquery()
+    student_count = select(func.count(Student.id)).where(Student.class_id == class_obj.id).scalar_subquery()
+    last_student = select(func.max(Student.id)).where(Student.class_id == class_obj.id).scalar_subquery()
+
+    row = db.session.execute(select(latest_mark, attendance_count, student_count, last_student)).one()
+    return '|'.join(str(value) for value in row)
+
+def get_cache_key(class_obj, start_date, end_date, export_format, data_version):
+    """Content address of one export"""
+    parts = [
+        str(class_obj.id),
+        class_obj.name,
+        class_obj.subject,
+        class_obj.teacher.name,
+        str(start_date or ''),
+        str(end_date or ''),
+        export_format,
+        data_version
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+def _cache_path(app, key, extension):
+    return os.path.join(get_cache_dir(app), key + extension)
+
+def get_cached_export(app, key, extension):
+    """Return the cached file for a key and mark it recently used, or None"""
+    file_path = _cache_path(app, key, extension)
+    try:
+        os.utime(file_path)
+    except OSError:
+        return None
+    return file_path
+
+def store_export(app, key, extension, source_path):
+    """Move a freshly generated export into the cache and return its cached path"""
+    file_path = _cache_path(app, key, extension)
+    os.replace(source_path, file_path)
+    evict_exports(app)
+    return file_path
+
+def tee_to_cache(app, key, extension, chunks):
+    """
+    Pass text chunks through while writing them to the cache
+
+    The cache entry is only published once every chunk has been produced, so
+    an interrupted download never leaves a truncated file behind.
+    """
+    fd, partial_path = tempfile.mkstemp(dir=get_cache_dir(app), suffix='.partial')
+    completed = False
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as partial_file:
+            for chunk in chunks:
+                partial_file.write(chunk)
+                yield chunk
+        store_export(app, key, extension, partial_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(partial_path):
+            os.remove(partial_path)
+
+def evict_exports(app):
+    """Delete least recently used files until the cache fits its size limit"""
+    max_bytes = app.config.get('EXPORT_CACHE_MAX_BYTES', DEFAULT_EXPORT_CACHE_MAX_BYTES)
+    cache_dir = get_cache_dir(app)
+
+    with _eviction_lock:
+        entries = []
+        total_size = 0
+        for entry in os.scandir(cache_dir):
+            if not entry.is_file() or entry.name.endswith('.partial'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, file_path in entries:
+            if total_size <= max_bytes:
+                break
+            try:
+                os.remove(file_path)
+                total_size -= size
+            except OSError as e:
+                logging.warning(f"Could not evict cached export {file_path}: {str(e)}")
@@ -1,45 +1,164 @@
 import os
+import io
 import csv
 import tempfile
 from datetime import datetime, date
+from itertools import groupby
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
-from models import Student, Attendance
+from models import Student, Attendance, DailyAttendanceSummary
 from database import db
-from sqlalchemy import func
+from sqlalchemy import and_, func
 
-def export_to_excel(class_obj, start_date=None, end_date=None):
+ATTENDANCE_STATUSES = ("Present", "Absent", "Late")
+
+def summarize_statuses(statuses, attendance_dates):
     """
-    Export attendance data to Excel format with students as rows and dates as columns
+    Count Present/Absent/Late for one student's {date: status} mapping
     """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"{class_obj.name} Attendance"
+    totals = {status: 0 for status in ATTENDANCE_STATUSES}
+    for date_obj in attendance_dates:
+        status = statuses.get(date_obj)
+        if status in totals:
+            totals[status] += 1
+    
+    if attendance_dates:
+        totals['percentage'] = round((totals['Present'] / len(attendance_dates)) * 100, 2)
+    else:
+        totals['percentage'] = 0
+    
+    return totals
+
+def get_attendance_dates(class_obj, start_date=None, end_date=None):
+    """
+    Sorted distinct dates that have attendance for a class within the range
+    
+    Read from the daily summaries, which hold exactly one row per such date.
+    """
+    query = db.session.query(DailyAttendanceSummary.date).filter_by(class_id=class_obj.id)
+    if start_date:
+        query = query.filter(DailyAttendanceSummary.date >= start_date)
+    if end_date:
+        query = query.filter(DailyAttendanceSummary.date <= end_date)
     
-    # Get all students in the class
-    students = Student.query.filter_by(class_id=class_obj.id).order_by(Student.name).all()
+    return [date_tuple[0] for date_tuple in query.order_by(DailyAttendanceSummary.date)]
+
+def iter_student_attendance(class_obj, start_date=None, end_date=None, batch_size=500):
+    """
+    Yield (student, {date: status}) for each student of a class, ordered by name
     
-    # Get all unique dates with attendance records
-    query = db.session.query(Attendance.date).filter_by(class_id=class_obj.id)
+    Students are outer-joined to their in-range attendance and read from a
+    server-side cursor with yield_per, so only one student's cells are held
+    in memory at a time.
+    """
+    join_condition = and_(Attendance.student_id == Student.id, Attendance.class_id == class_obj.id)
     if start_date:
-        query = query.filter(Attendance.date >= start_date)
+        join_condition = and_(join_condition, Attendance.date >= start_date)
     if end_date:
-        query = query.filter(Attendance.date <= end_date)
+        join_condition = and_(join_condition, Attendance.date <= end_date)
+    
+    rows = db.session.query(
+        Student.id, Student.student_id, Student.name, Student.email, Attendance.date, Attendance.status
+    ).outerjoin(Attendance, join_condition).filter(
+        Student.class_id == class_obj.id
+    ).order_by(Student.name, Student.id).yield_per(batch_size)
     
-    attendance_dates = query.distinct().order_by(Attendance.date).all()
-    attendance_dates = [date_tuple[0] for date_tuple in attendance_dates]
+    for _, student_rows in groupby(rows, key=lambda row: row.id):
+        statuses = {}
+        student = None
+        for row in student_rows:
+            student = row
+            if row.date is not None:
+                statuses[row.date] = row.status
+        yield student, statuses
+
+# Fill colours shared by the attendance cells, percentage cells and legend
+PRESENT_COLOR = "90EE90"  # Light green
+ABSENT_COLOR = "FFB6C1"  # Light red
+LATE_COLOR = "FFFFE0"  # Light yellow
+
+MAX_COLUMN_WIDTH = 15
+
+def _solid_fill(color):
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+def create_export_styles(wb):
+    """
+    Register the named styles used by the Excel export on a workbook
     
-    # Styling
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
+    Every cell references one of these by name, so the workbook carries a
+    handful of shared styles instead of one fill/alignment object per cell.
+    """
     border = Border(
         left=Side(style='thin'),
         right=Side(style='thin'),
         top=Side(style='thin'),
         bottom=Side(style='thin')
     )
+    center = Alignment(horizontal="center")
+    
+    styles = [
+        NamedStyle(
+            name="attendance_header",
+            font=Font(bold=True, color="FFFFFF", size=12),
+            fill=_solid_fill("366092"),
+            alignment=Alignment(horizontal="center", vertical="center"),
+            border=border
+        ),
+        NamedStyle(name="attendance_empty", border=border, alignment=center),
+        NamedStyle(name="attendance_present", border=border, alignment=center, fill=_solid_fill(PRESENT_COLOR)),
+        NamedStyle(name="attendance_absent", border=border, alignment=center, fill=_solid_fill(ABSENT_COLOR)),
+        NamedStyle(name="attendance_late", border=border, alignment=center, fill=_solid_fill(LATE_COLOR)),
+        NamedStyle(name="attendance_total", border=border),
+        NamedStyle(name="percentage_good", border=border, fill=_solid_fill(PRESENT_COLOR)),
+        NamedStyle(name="percentage_fair", border=border, fill=_solid_fill(LATE_COLOR)),
+        NamedStyle(name="percentage_poor", border=border, fill=_solid_fill(ABSENT_COLOR)),
+        NamedStyle(name="legend_title", font=Font(bold=True)),
+        NamedStyle(name="legend_present", fill=_solid_fill(PRESENT_COLOR)),
+        NamedStyle(name="legend_absent", fill=_solid_fill(ABSENT_COLOR)),
+        NamedStyle(name="legend_late", fill=_solid_fill(LATE_COLOR)),
+    ]
+    for style in styles:
+        wb.add_named_style(style)
+
+STATUS_STYLES = {
+    "Present": "attendance_present",
+    "Absent": "attendance_absent",
+    "Late": "attendance_late",
+}
+
+def _styled_cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+def _track_widths(widths, values):
+    """Grow the per-column content lengths with one row of values"""
+    for col_idx, value in enumerate(values):
+        if value is None:
+            continue
+        length = len(str(value))
+        if col_idx >= len(widths):
+            widths.extend([0] * (col_idx + 1 - len(widths)))
+        if length > widths[col_idx]:
+            widths[col_idx] = length
+
+def export_to_excel(class_obj, start_date=None, end_date=None, progress_callback=None):
+    """
+    Export attendance data to Excel format with students as rows and dates as columns
+    
+    The workbook is written with openpyxl's write-only worksheet: student rows
+    are streamed from iter_student_attendance() straight into the file, so
+    memory does not grow with the size of the class or the date range.
+    progress_callback, if given, is called with the number of students written.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=f"{class_obj.name} Attendance")
+    create_export_styles(wb)
+    
+    attendance_dates = get_attendance_dates(class_obj, start_date, end_date)
     
     # Create headers
     headers = ["S.No", "Student ID", "Student Name", "Email"]
@@ -49,205 +168,173 @@ def export_to_excel(class_obj, start_date=None, end_date=None):
     headers.append("Total Late")
     headers.append("Attendance %")
     
+    class_info = [
+        ["Class:", f"{class_obj.name} - {class_obj.subject}"],
+        ["Teacher:", class_obj.teacher.name],
+        ["Export Date:", datetime.now().strftime('%m/%d/%Y %I:%M %p')],
+    ]
+    legend = ["Present", "Absent", "Late"]
+    
+    # Write-only sheets need column widths before the first row is written.
+    # They come from the values going into the non-grid rows, the longest
+    # student fields (one aggregate query) and the fixed set of values the
+    # date and statistics columns can hold.
+    student_count, longest_id, longest_name, longest_email = db.session.query(
+        func.count(Student.id),
+        func.max(func.length(Student.student_id)),
+        func.max(func.length(Student.name)),
+        func.max(func.length(Student.email))
+    ).filter(Student.class_id == class_obj.id).one()
+    
+    widths = []
+    _track_widths(widths, headers)
+    for info_row in class_info:
+        _track_widths(widths, info_row)
+    _track_widths(widths, ["Legend:"])
+    _track_widths(widths, legend)
+    _track_widths(widths, [student_count, "x" * (longest_id or 0), "x" * (longest_name or 0), "x" * (longest_email or 0)])
+    _track_widths(widths, [None] * 4 + [max(ATTENDANCE_STATUSES, key=len)] * len(attendance_dates) + [len(attendance_dates)] * 3 + ["100.0%"])
+    
+    for col_idx, max_length in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = min(max_length + 2, MAX_COLUMN_WIDTH)
+    
     # Write headers with styling
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
+    ws.append([_styled_cell(ws, header, "attendance_header") for header in headers])
     
     # Write class information
-    ws.cell(row=2, column=1, value="Class:")
-    ws.cell(row=2, column=2, value=f"{class_obj.name} - {class_obj.subject}")
-    ws.cell(row=3, column=1, value="Teacher:")
-    ws.cell(row=3, column=2, value=class_obj.teacher.name)
-    ws.cell(row=4, column=1, value="Export Date:")
-    ws.cell(row=4, column=2, value=datetime.now().strftime('%m/%d/%Y %I:%M %p'))
+    for info_row in class_info:
+        ws.append(info_row)
     
-    # Start student data from row 6
-    data_start_row = 6
+    # Student data starts after one empty row
+    ws.append([])
     
     # Write student data
-    for row_idx, student in enumerate(students, data_start_row):
-        # Basic student info
-        ws.cell(row=row_idx, column=1, value=row_idx - data_start_row + 1)  # Serial number
-        ws.cell(row=row_idx, column=2, value=student.student_id)
-        ws.cell(row=row_idx, column=3, value=student.name)
-        ws.cell(row=row_idx, column=4, value=student.email)
-        
-        # Get attendance records for this student
-        attendance_records = {}
-        records = Attendance.query.filter_by(student_id=student.id, class_id=class_obj.id).all()
-        for record in records:
-            attendance_records[record.date] = record.status
+    students = iter_student_attendance(class_obj, start_date, end_date)
+    for serial, (student, attendance_records) in enumerate(students, 1):
+        totals = summarize_statuses(attendance_records, attendance_dates)
         
-        # Statistics
-        present_count = 0
-        absent_count = 0
-        late_count = 0
+        # Basic student info
+        row = [serial, student.student_id, student.name, student.email]
         
-        # Fill attendance data for each date
-        for col_idx, date_obj in enumerate(attendance_dates, 5):
+        # Attendance data for each date, color coded by status
+        for date_obj in attendance_dates:
             status = attendance_records.get(date_obj, "")
-            cell = ws.cell(row=row_idx, column=col_idx, value=status)
-            cell.border = border
-            cell.alignment = Alignment(horizontal="center")
-            
-            # Count attendance and apply color coding
-            if status == "Present":
-                present_count += 1
-                cell.fill = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")  # Light green
-            elif status == "Absent":
-                absent_count += 1
-                cell.fill = PatternFill(start_color="FFB6C1", end_color="FFB6C1", fill_type="solid")  # Light red
-            elif status == "Late":
-                late_count += 1
-                cell.fill = PatternFill(start_color="FFFFE0", end_color="FFFFE0", fill_type="solid")  # Light yellow
+            row.append(_styled_cell(ws, status, STATUS_STYLES.get(status, "attendance_empty")))
         
-        # Add statistics columns
-        total_classes = len(attendance_dates)
-        stats_col = len(attendance_dates) + 5
+        # Statistics columns
+        row.append(_styled_cell(ws, totals['Present'], "attendance_total"))
+        row.append(_styled_cell(ws, totals['Absent'], "attendance_total"))
+        row.append(_styled_cell(ws, totals['Late'], "attendance_total"))
         
-        # Total Present
-        ws.cell(row=row_idx, column=stats_col, value=present_count).border = border
-        # Total Absent
-        ws.cell(row=row_idx, column=stats_col + 1, value=absent_count).border = border
-        # Total Late
-        ws.cell(row=row_idx, column=stats_col + 2, value=late_count).border = border
         # Attendance Percentage
-        if total_classes > 0:
-            attendance_percentage = round((present_count / total_classes) * 100, 2)
-            percentage_cell = ws.cell(row=row_idx, column=stats_col + 3, value=f"{attendance_percentage}%")
-            percentage_cell.border = border
-            
-            # Color code percentage
+        if attendance_dates:
+            attendance_percentage = totals['percentage']
             if attendance_percentage >= 75:
-                percentage_cell.fill = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
+                percentage_style = "percentage_good"
             elif attendance_percentage >= 50:
-                percentage_cell.fill = PatternFill(start_color="FFFFE0", end_color="FFFFE0", fill_type="solid")
+                percentage_style = "percentage_fair"
             else:
-                percentage_cell.fill = PatternFill(start_color="FFB6C1", end_color="FFB6C1", fill_type="solid")
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 15)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Add legend
-    legend_row = len(students) + data_start_row + 2
-    ws.cell(row=legend_row, column=1, value="Legend:").font = Font(bold=True)
-    
-    # Present legend
-    present_cell = ws.cell(row=legend_row + 1, column=1, value="Present")
-    present_cell.fill = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
-    
-    # Absent legend
-    absent_cell = ws.cell(row=legend_row + 1, column=2, value="Absent")
-    absent_cell.fill = PatternFill(start_color="FFB6C1", end_color="FFB6C1", fill_type="solid")
-    
-    # Late legend
-    late_cell = ws.cell(row=legend_row + 1, column=3, value="Late")
-    late_cell.fill = PatternFill(start_color="FFFFE0", end_color="FFFFE0", fill_type="solid")
+                percentage_style = "percentage_poor"
+            row.append(_styled_cell(ws, f"{attendance_percentage}%", percentage_style))
+        
+        ws.append(row)
+        
+        if progress_callback:
+            progress_callback(serial)
+    
+    # Add legend after two empty rows
+    ws.append([])
+    ws.append([])
+    ws.append([_styled_cell(ws, "Legend:", "legend_title")])
+    ws.append([
+        _styled_cell(ws, "Present", "legend_present"),
+        _styled_cell(ws, "Absent", "legend_absent"),
+        _styled_cell(ws, "Late", "legend_late"),
+    ])
     
     # Save to temporary file
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-    wb.save(temp_file.name)
     temp_file.close()
+    wb.save(temp_file.name)
     
     return temp_file.name
 
-def export_to_csv(class_obj, start_date=None, end_date=None):
-    """
-    Export attendance data to CSV format with students as rows and dates as columns
+def iter_csv_rows(class_obj, start_date=None, end_date=None, progress_callback=None):
     """
-    # Get all students in the class
-    students = Student.query.filter_by(class_id=class_obj.id).order_by(Student.name).all()
+    Yield the rows of the CSV attendance report one at a time
     
-    # Get all unique dates with attendance records
-    query = db.session.query(Attendance.date).filter_by(class_id=class_obj.id)
-    if start_date:
-        query = query.filter(Attendance.date >= start_date)
-    if end_date:
-        query = query.filter(Attendance.date <= end_date)
-    
-    attendance_dates = query.distinct().order_by(Attendance.date).all()
-    attendance_dates = [date_tuple[0] for date_tuple in attendance_dates]
-    
-    # Create temporary file
-    temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='')
-    writer = csv.writer(temp_file)
+    progress_callback, if given, is called with the number of students written.
+    """
+    attendance_dates = get_attendance_dates(class_obj, start_date, end_date)
     
-    # Write class information
-    writer.writerow(['Class:', f"{class_obj.name} - {class_obj.subject}"])
-    writer.writerow(['Teacher:', class_obj.teacher.name])
-    writer.writerow(['Export Date:', datetime.now().strftime('%m/%d/%Y %I:%M %p')])
-    writer.writerow([])  # Empty row
+    # Class information
+    yield ['Class:', f"{class_obj.name} - {class_obj.subject}"]
+    yield ['Teacher:', class_obj.teacher.name]
+    yield ['Export Date:', datetime.now().strftime('%m/%d/%Y %I:%M %p')]
+    yield []  # Empty row
     
-    # Create headers
+    # Headers
     headers = ["S.No", "Student ID", "Student Name", "Email"]
     headers.extend([date_obj.strftime('%m/%d/%Y') for date_obj in attendance_dates])
     headers.extend(["Total Present", "Total Absent", "Total Late", "Attendance %"])
+    yield headers
     
-    writer.writerow(headers)
-    
-    # Write student data
-    for idx, student in enumerate(students, 1):
-        # Get attendance records for this student
-        attendance_records = {}
-        records = Attendance.query.filter_by(student_id=student.id, class_id=class_obj.id).all()
-        for record in records:
-            attendance_records[record.date] = record.status
+    # Student data
+    students = iter_student_attendance(class_obj, start_date, end_date)
+    for idx, (student, attendance_records) in enumerate(students, 1):
+        totals = summarize_statuses(attendance_records, attendance_dates)
         
         # Build row data
         row_data = [idx, student.student_id, student.name, student.email]
         
-        # Statistics
-        present_count = 0
-        absent_count = 0
-        late_count = 0
-        
         # Add attendance data for each date
-        for date_obj in attendance_dates:
-            status = attendance_records.get(date_obj, "")
-            row_data.append(status)
-            
-            # Count attendance
-            if status == "Present":
-                present_count += 1
-            elif status == "Absent":
-                absent_count += 1
-            elif status == "Late":
-                late_count += 1
+        row_data.extend(attendance_records.get(date_obj, "") for date_obj in attendance_dates)
         
         # Add statistics
-        total_classes = len(attendance_dates)
-        row_data.extend([present_count, absent_count, late_count])
+        row_data.extend([totals['Present'], totals['Absent'], totals['Late']])
         
         # Add attendance percentage
-        if total_classes > 0:
-            attendance_percentage = round((present_count / total_classes) * 100, 2)
-            row_data.append(f"{attendance_percentage}%")
+        if attendance_dates:
+            row_data.append(f"{totals['percentage']}%")
         else:
             row_data.append("0%")
         
-        writer.writerow(row_data)
+        yield row_data
+        
+        if progress_callback:
+            progress_callback(idx)
     
-    # Add legend
-    writer.writerow([])  # Empty row
-    writer.writerow(['Legend:'])
-    writer.writerow(['Present = Student was present'])
-    writer.writerow(['Absent = Student was absent'])
-    writer.writerow(['Late = Student was late'])
-    writer.writerow(['Empty = No attendance record for that date'])
+    # Legend
+    yield []  # Empty row
+    yield ['Legend:']
+    yield ['Present = Student was present']
+    yield ['Absent = Student was absent']
+    yield ['Late = Student was late']
+    yield ['Empty = No attendance record for that date']
+
+def stream_csv(class_obj, start_date=None, end_date=None, rows_per_chunk=100):
+    """
+    Yield the CSV attendance report as text chunks of a few rows each
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
     
-    temp_file.close()
-    return temp_file.name
\ No newline at end of file
+    for row_count, row in enumerate(iter_csv_rows(class_obj, start_date, end_date), 1):
+        writer.writerow(row)
+        if row_count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_to_csv(class_obj, start_date=None, end_date=None, progress_callback=None):
+    """
+    Export attendance data to CSV format with students as rows and dates as columns
+    """
+    temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='')
+    with temp_file:
+        csv.writer(temp_file).writerows(iter_csv_rows(class_obj, start_date, end_date, progress_callback))
+    
+    return temp_file.name
@@ -0,0 +1,97 @@
+"""
+Raw attendance facts export in columnar formats for analytics
+
+Writes one row per attendance record (student_id, class_id, date, status,
+marked_at) as Parquet or Arrow IPC. Rows are read from a streaming query and
+written one record batch at a time, so the whole dataset is never held in
+memory. Requires pyarrow.
+"""
+import logging
+import tempfile
+from database import db
+from models import Class, Attendance
+from sqlalchemy import select
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    logging.warning("Parquet/Arrow export not available - pyarrow required")
+    PYARROW_AVAILABLE = False
+
+# Format -> file extension
+FACTS_FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow'
+}
+
+DEFAULT_BATCH_SIZE = 65536
+
+def get_facts_schema():
+    """Arrow schema of the attendance facts"""
+    return pa.schema([
+        ('student_id', pa.int64()),
+        ('class_id', pa.int64()),
+        ('date', pa.date32()),
+        ('status', pa.string()),
+        ('marked_at', pa.timestamp('us'))
+    ])
+
+def iter_fact_batches(teacher_id, class_id=None, start_date=None, end_date=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield Arrow record batches of a teacher's attendance facts
+
+    Rows come from a yield_per cursor; each partition of batch_size rows is
+    converted column-wise into one record batch.
+    """
+    schema = get_facts_schema()
+
+    query = select(
+        Attendance.student_id, Attendance.class_id, Attendance.date, Attendance.status, Attendance.marked_at
+    ).join(Class, Class.id == Attendance.class_id).where(Class.teacher_id == teacher_id)
+
+    if class_id:
+        query = query.where(Attendance.class_id == class_id)
+    if start_date:
+        query = query.where(Attendance.date >= start_date)
+    if end_date:
+        query = query.where(Attendance.date <= end_date)
+
+    query = query.order_by(Attendance.class_id, Attendance.date, Attendance.student_id)
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+
+    for partition in result.partitions():
+        columns = list(zip(*partition))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+
+def export_attendance_facts(teacher_id, export_format='parquet', class_id=None, start_date=None,
+                            end_date=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write a teacher's attendance facts to a temporary Parquet or Arrow IPC file
+
+    Returns the path of the file.
+    """
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is required for Parquet/Arrow export")
+    if export_format not in FACTS_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    schema = get_facts_schema()
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=FACTS_FORMATS[export_format])
+    temp_file.close()
+
+    batches = iter_fact_batches(teacher_id, class_id, start_date, end_date, batch_size)
+    if export_format == 'parquet':
+        with pq.ParquetWriter(temp_file.name, schema, compression='snappy') as writer:
+            for batch in batches:
+                writer.write_table(pa.Table.from_batches([batch], schema=schema))
+    else:
+        with pa.OSFile(temp_file.name, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+    return temp_file.name
@@ -0,0 +1,153 @@
+"""
+Attendance history queries
+
+The history page and /api/history read a teacher's attendance one page at a
+time with keyset pagination on (date, marked_at, id), newest first. Only the
+columns the page shows are selected, joined from Student and Class in the
+same query. A page's cursor is the sort key of its last row, base64-encoded.
+Summary statistics are aggregated from the daily summary table over the
+whole filter, so they do not depend on how many rows have been paged in.
+"""
+import json
+import base64
+from datetime import datetime, date
+from database import db
+from models import Class, Student, Attendance, DailyAttendanceSummary
+from summary_service import filter_summaries
+from sqlalchemy import select, func, tuple_
+
+DEFAULT_HISTORY_PAGE_SIZE = 100
+MAX_HISTORY_PAGE_SIZE = 500
+
+# Rows without a marked_at sort after every marked row of their date
+MARKED_AT_FLOOR = datetime(1970, 1, 1)
+
+def _marked_at_key():
+    return func.coalesce(Attendance.marked_at, MARKED_AT_FLOOR)
+
+def encode_cursor(row):
+    """Opaque cursor pointing just after a history row"""
+    marked_at = row.marked_at or MARKED_AT_FLOOR
+    payload = json.dumps([row.date.isoformat(), marked_at.isoformat(), row.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Sort key of a cursor; raises ValueError when it is malformed"""
+    try:
+        day, marked_at, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return date.fromisoformat(day), datetime.fromisoformat(marked_at), int(record_id)
+    except Exception:
+        raise ValueError("Invalid history cursor")
+
+def filter_history(query, teacher_id, class_id=None, start_date=None, end_date=None):
+    """Restrict a query joined to Class to the teacher's attendance within the filters"""
+    query = query.where(Class.teacher_id == teacher_id)
+    if class_id:
+        query = query.where(Attendance.class_id == class_id)
+    if start_date:
+        query = query.where(Attendance.date >= start_date)
+    if end_date:
+        query = query.where(Attendance.date <= end_date)
+    return query
+
+def get_history_page(teacher_id, class_id=None, start_date=None, end_date=None, cursor=None,
+                     page_size=DEFAULT_HISTORY_PAGE_SIZE):
+    """
+    One page of attendance history, newest first
+
+    Returns a dictionary with the rows (named tuples with id, date, status,
+    marked_at, class_name, student_name, student_number and email) and the
+    cursor of the next page, or None on the last page.
+    """
+    marked_at_key = _marked_at_key()
+    query = select(
+        Attendance.id,
+        Attendance.date,
+        Attendance.status,
+        Attendance.marked_at,
+        Class.name.label('class_name'),
+        Student.name.label('student_name'),
+        Student.student_id.label('student_number'),
+        Student.email
+    ).join(Student, Student.id == Attendance.student_id).join(Class, Class.id == Attendance.class_id)
+    query = filter_history(query, teacher_id, class_id, start_date, end_date)
+
+    if cursor:
+        query = query.where(tuple_(Attendance.date, marked_at_key, Attendance.id) < tuple_(*decode_cursor(cursor)))
+
+    query = query.order_by(Attendance.date.desc(), marked_at_key.desc(), Attendance.id.desc()).limit(page_size + 1)
+    rows = db.session.execute(query).all()
+
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return {'records': rows[:page_size], 'next_cursor': next_cursor}
+
+def _status_summary(counts):
+    """Counts per status plus total and percentages, rounded to one decimal"""
+    summary = {status: counts.get(status, 0) for status in ('Present', 'Absent', 'Late')}
+    summary['total'] = sum(summary.values())
+    for status in ('Present', 'Absent', 'Late'):
+        share = summary[status] * 100 / summary['total'] if summary['total'] else 0
+        summary[f'{status.lower()}_percentage'] = round(share, 1)
+    return summary
+
+def get_history_statistics(teacher_id, class_id=None, start_date=None, end_date=None):
+    """
+    Summary statistics of the records matching the history filters
+
+    Read from DailyAttendanceSummary, one row per class and day rather than
+    one per record: counts per class from one GROUP BY class query and the
+    covered dates from one MIN/MAX/COUNT(DISTINCT) query, independent of the
+    page shown. Returns the overall totals, the same figures per class and
+    the first and last date with the number of days that have records.
+    """
+    query = select(
+        DailyAttendanceSummary.class_id,
+        Class.name,
+        func.sum(DailyAttendanceSummary.present),
+        func.sum(DailyAttendanceSummary.absent),
+        func.sum(DailyAttendanceSummary.late)
+    ).join(Class, Class.id == DailyAttendanceSummary.class_id)
+    query = filter_summaries(query, teacher_id, class_id, start_date, end_date)
+    query = query.group_by(DailyAttendanceSummary.class_id, Class.name)
+
+    overall = {}
+    per_class = {}
+    for row_class_id, class_name, present, absent, late in db.session.execute(query):
+        counts = {'Present': present or 0, 'Absent': absent or 0, 'Late': late or 0}
+        for status, count in counts.items():
+            overall[status] = overall.get(status, 0) + count
+        per_class[(class_name, row_class_id)] = counts
+
+    span_query = select(
+        func.min(DailyAttendanceSummary.date),
+        func.max(DailyAttendanceSummary.date),
+        func.count(DailyAttendanceSummary.date.distinct())
+    ).join(Class, Class.id == DailyAttendanceSummary.class_id)
+    span_query = filter_summaries(span_query, teacher_id, class_id, start_date, end_date)
+    first_date, last_date, days = db.session.execute(span_query).one()
+
+    return {
+        'totals': _status_summary(overall),
+        'classes': [
+            dict(_status_summary(counts), class_id=row_class_id, class_name=class_name)
+            for (class_name, row_class_id), counts in sorted(per_class.items())
+        ],
+        'first_date': first_date,
+        'last_date': last_date,
+        'days': days
+    }
+
+def serialize_history_record(row):
+    """JSON form of a history row, with the display strings the page uses"""
+    return {
+        'id': row.id,
+        'date': row.date.isoformat(),
+        'date_display': row.date.strftime('%b %d, %Y'),
+        'class_name': row.class_name,
+        'student_name': row.student_name,
+        'student_id': row.student_number,
+        'email': row.email,
+        'status': row.status,
+        'marked_at': row.marked_at.isoformat() if row.marked_at else None,
+        'marked_at_display': row.marked_at.strftime('%b %d, %Y %I:%M %p') if row.marked_at else ''
+    }
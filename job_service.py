@@ -0,0 +1,286 @@
+"""
+Background job service for long-running exports and bulk imports
+
+Jobs run on a shared thread pool inside the web process and persist their
+status in the database, so any worker process can report on them. Export
+jobs are ExportJob rows whose finished file is written to instance/exports,
+from where the download endpoint serves it until the job expires; their
+progress while running is kept in the shared cache. Import jobs persist
+their status and errors in the ImportJob and ImportJobError tables, updated
+after every chunk of the upload.
+"""
+import os
+import shutil
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from database import db
+from models import Class, Student, ImportJob, ImportJobError, ExportJob
+from sqlalchemy import insert
+from export_service import export_to_excel, export_to_csv
+from dashboard_service import invalidate_dashboard
+from cache_service import get_cache
+
+# Export format -> (file extension, export function)
+EXPORT_FORMATS = {
+    'excel': ('.xlsx', export_to_excel),
+    'csv': ('.csv', export_to_csv)
+}
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_EXPORT_JOB_TTL = 3600  # seconds a finished export stays downloadable
+CLEANUP_INTERVAL = 60  # seconds between sweeps of expired jobs
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_last_cleanup = None
+_cleanup_lock = threading.Lock()
+
+def get_executor(app):
+    """Return the shared worker pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = app.config.get('JOB_WORKERS', DEFAULT_JOB_WORKERS)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        return _executor
+
+def get_export_dir(app):
+    """Directory holding finished export files"""
+    export_dir = os.path.join(app.instance_path, 'exports')
+    os.makedirs(export_dir, exist_ok=True)
+    return export_dir
+
+def _export_ttl(app):
+    return app.config.get('EXPORT_JOB_TTL', DEFAULT_EXPORT_JOB_TTL)
+
+def _progress_key(job_id):
+    return f'export_job_progress:{job_id}'
+
+def _job_snapshot(app, job):
+    """Public fields of an export job, with its progress, safe to hand to a view"""
+    snapshot = job.to_dict()
+    if job.status == 'completed':
+        snapshot['progress'] = 100
+    else:
+        snapshot['progress'] = get_cache(app).get(_progress_key(job.id)) or 0
+    return snapshot
+
+def _update_export_job(job_id, **fields):
+    db.session.query(ExportJob).filter_by(id=job_id).update(fields)
+    db.session.commit()
+
+def submit_export_job(app, teacher_id, class_obj, export_format, start_date=None, end_date=None):
+    """
+    Queue an export of one class and return the new job
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    cleanup_expired_jobs(app)
+
+    extension = EXPORT_FORMATS[export_format][0]
+    download_name = f'{class_obj.name}_attendance'
+    if start_date and end_date:
+        download_name += f'_{start_date}_{end_date}'
+    download_name += extension
+
+    job = ExportJob(id=uuid.uuid4().hex, teacher_id=teacher_id, class_id=class_obj.id, format=export_format,
+                    start_date=start_date, end_date=end_date, download_name=download_name)
+    db.session.add(job)
+    db.session.commit()
+
+    get_executor(app).submit(_run_export_job, app, job.id)
+    logging.info(f"Queued {export_format} export job {job.id} for class {class_obj.id}")
+    return _job_snapshot(app, job)
+
+def get_export_job(app, job_id, teacher_id):
+    """Return a job owned by the teacher, or None"""
+    cleanup_expired_jobs(app)
+
+    job = ExportJob.query.filter_by(id=job_id, teacher_id=teacher_id).first()
+    return _job_snapshot(app, job) if job else None
+
+def get_export_job_file(app, job_id, teacher_id):
+    """Return (file path, download name) of a completed job, or None"""
+    cleanup_expired_jobs(app)
+
+    job = ExportJob.query.filter_by(id=job_id, teacher_id=teacher_id, status='completed').first()
+    if not job or not os.path.exists(job.file_path):
+        return None
+    return job.file_path, job.download_name
+
+def _run_export_job(app, job_id):
+    """Worker entry point: render the export and move it into the export directory"""
+    with app.app_context():
+        try:
+            job = db.session.get(ExportJob, job_id)
+            if job is None:
+                return
+            job.status = 'running'
+            db.session.commit()
+
+            class_obj = db.session.get(Class, job.class_id)
+            if class_obj is None:
+                raise ValueError("Class no longer exists")
+            total_students = Student.query.filter_by(class_id=class_obj.id).count()
+            cache = get_cache(app)
+
+            def report_progress(students_done):
+                # The export is still reading from the session, so progress goes to the cache
+                if total_students:
+                    cache.set(_progress_key(job_id), min(99, int(students_done * 100 / total_students)),
+                              ttl=_export_ttl(app))
+
+            extension, export_function = EXPORT_FORMATS[job.format]
+            temp_path = export_function(class_obj, job.start_date, job.end_date,
+                                        progress_callback=report_progress)
+
+            file_path = os.path.join(get_export_dir(app), job_id + extension)
+            shutil.move(temp_path, file_path)
+
+            finished_at = datetime.utcnow()
+            _update_export_job(job_id, status='completed', finished_at=finished_at,
+                               expires_at=finished_at + timedelta(seconds=_export_ttl(app)), file_path=file_path)
+            logging.info(f"Export job {job_id} completed")
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Export job {job_id} failed: {str(e)}")
+            finished_at = datetime.utcnow()
+            _update_export_job(job_id, status='failed', error=str(e), finished_at=finished_at,
+                               expires_at=finished_at + timedelta(seconds=_export_ttl(app)))
+
+        finally:
+            get_cache(app).delete(_progress_key(job_id))
+            db.session.remove()
+
+def cleanup_expired_jobs(app, now=None):
+    """
+    Delete expired export jobs and their files
+
+    Runs at most once per CLEANUP_INTERVAL in each process. Jobs still
+    unfinished a job TTL after they were queued were lost with the process
+    running them and are deleted too. Files left in the export directory
+    without a job are removed once they are older than the job TTL.
+    """
+    global _last_cleanup
+    now = now or datetime.utcnow()
+
+    with _cleanup_lock:
+        if _last_cleanup and (now - _last_cleanup).total_seconds() < CLEANUP_INTERVAL:
+            return
+        _last_cleanup = now
+
+    ttl = _export_ttl(app)
+    expired = ExportJob.query.filter(db.or_(
+        ExportJob.expires_at <= now,
+        db.and_(ExportJob.finished_at.is_(None), ExportJob.created_at <= now - timedelta(seconds=ttl))
+    )).all()
+    for job in expired:
+        if job.file_path:
+            _remove_file(job.file_path)
+    if expired:
+        ExportJob.query.filter(ExportJob.id.in_([job.id for job in expired])).delete(synchronize_session=False)
+        db.session.commit()
+    known_files = set(db.session.scalars(db.select(ExportJob.file_path).where(ExportJob.file_path.isnot(None))))
+
+    # Orphaned files, e.g. from a process that stopped while moving one into place
+    export_dir = get_export_dir(app)
+    for filename in os.listdir(export_dir):
+        file_path = os.path.join(export_dir, filename)
+        if file_path in known_files:
+            continue
+        try:
+            modified_at = datetime.utcfromtimestamp(os.path.getmtime(file_path))
+        except OSError:
+            continue
+        if (now - modified_at).total_seconds() > ttl:
+            _remove_file(file_path)
+
+def _remove_file(file_path):
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as e:
+        logging.warning(f"Could not delete export file {file_path}: {str(e)}")
+
+def submit_import_job(app, teacher_id, class_obj, file_path, filename, column_mapping,
+                      skip_duplicates=True, batch_size=None):
+    """
+    Queue a bulk import of an uploaded file and return the new ImportJob
+    
+    The worker deletes the uploaded file once the import has finished.
+    """
+    job = ImportJob(id=uuid.uuid4().hex, teacher_id=teacher_id, class_id=class_obj.id, filename=filename)
+    db.session.add(job)
+    db.session.commit()
+
+    get_executor(app).submit(_run_import_job, app, job.id, teacher_id, class_obj.id, file_path, column_mapping,
+                             skip_duplicates, batch_size)
+    logging.info(f"Queued import job {job.id} for class {class_obj.id}")
+    return job
+
+def get_import_job(job_id, teacher_id):
+    """Return an import job owned by the teacher, or None"""
+    return ImportJob.query.filter_by(id=job_id, teacher_id=teacher_id).first()
+
+def _run_import_job(app, job_id, teacher_id, class_id, file_path, column_mapping, skip_duplicates, batch_size):
+    """Worker entry point: run the import, persisting counts and errors after each chunk"""
+    from bulk_import_service import process_bulk_import, DEFAULT_IMPORT_BATCH_SIZE
+
+    with app.app_context():
+        saved_errors = 0
+
+        def save_progress(results, **fields):
+            nonlocal saved_errors
+            new_errors = results['errors'][saved_errors:]
+            if new_errors:
+                db.session.execute(insert(ImportJobError), [
+                    {'job_id': job_id, 'message': message} for message in new_errors
+                ])
+                saved_errors = len(results['errors'])
+
+            db.session.query(ImportJob).filter_by(id=job_id).update(dict(
+                rows_read=results['total_rows'],
+                imported=results['imported'],
+                skipped=results['skipped'],
+                error_count=saved_errors,
+                **fields
+            ))
+            db.session.commit()
+
+            # Each chunk commits new students, which the dashboard counts
+            invalidate_dashboard(app, teacher_id)
+
+            # Only the counts are needed from here on
+            results['imported_students'].clear()
+
+        try:
+            db.session.query(ImportJob).filter_by(id=job_id).update({
+                'status': 'running', 'started_at': datetime.utcnow()
+            })
+            db.session.commit()
+
+            results = process_bulk_import(file_path, class_id, column_mapping,
+                                          skip_duplicates, batch_size or DEFAULT_IMPORT_BATCH_SIZE,
+                                          progress_callback=save_progress)
+
+            save_progress(results, status='completed' if results['success'] else 'failed',
+                          finished_at=datetime.utcnow())
+            logging.info(f"Import job {job_id} finished: {results['imported']} imported, "
+                         f"{results['skipped']} skipped, {len(results['errors'])} errors")
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Import job {job_id} failed: {str(e)}")
+            db.session.query(ImportJob).filter_by(id=job_id).update({
+                'status': 'failed', 'finished_at': datetime.utcnow()
+            })
+            db.session.commit()
+
+        finally:
+            db.session.remove()
@@ -0,0 +1,233 @@
+"""
+Schema migrations for existing databases
+
+db.create_all() creates missing tables but never changes existing ones, so
+indexes and columns added to models.py after a database was created need a
+migration. Migrations are numbered functions that run in order, each in its
+own transaction unless it is a batched backfill; the versions applied are
+recorded in the schema_migrations table. create_app() runs the pending ones at startup, and the same is
+available from the command line:
+
+    flask --app app migrations status
+    flask --app app migrations upgrade
+
+Every migration must be safe on a database that create_all() has just built
+from the current models, where its changes already exist.
+"""
+import logging
+from datetime import datetime
+import click
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, insert, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from database import db
+from models import STATUS_CODES
+
+_migration_metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', _migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+MIGRATIONS = []
+
+def migration(version, description, transactional=True):
+    """
+    Register a migration function
+
+    Transactional migrations take a connection and run in one transaction
+    together with their schema_migrations record. The others take the engine
+    and commit in steps of their own, so a long backfill never holds a lock
+    for its whole duration; they must be safe to rerun after an interruption.
+    """
+    def decorator(function):
+        function.transactional = transactional
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return function
+    return decorator
+
+def create_model_index(connection, table, index_name):
+    """Create an index declared on a model's table unless it already exists"""
+    index = next(index for index in table.indexes if index.name == index_name)
+    connection.execute(CreateIndex(index, if_not_exists=True))
+
+@migration(1, "Attendance (class_id, date) and (class_id, marked_at) indexes, Student (class_id, student_id) index")
+def add_hot_query_indexes(connection):
+    from models import Student, Attendance
+    create_model_index(connection, Attendance.__table__, 'ix_attendance_class_date')
+    create_model_index(connection, Attendance.__table__, 'ix_attendance_class_marked_at')
+    create_model_index(connection, Student.__table__, 'ix_student_class_student_id')
+
+@migration(2, "Daily attendance summary table, backfilled from attendance")
+def add_daily_attendance_summaries(connection):
+    from models import DailyAttendanceSummary
+    from summary_service import rebuild_daily_summaries
+    DailyAttendanceSummary.__table__.create(connection, checkfirst=True)
+    rebuild_daily_summaries(connection=connection)
+
+@migration(3, "Packed attendance bitmap table, backfilled from attendance")
+def add_attendance_bitmaps(connection):
+    from models import AttendanceBitmap
+    from bitmap_service import rebuild_attendance_bitmaps
+    AttendanceBitmap.__table__.create(connection, checkfirst=True)
+    rebuild_attendance_bitmaps(connection=connection)
+
+# Rows converted per transaction by the status_code backfill
+STATUS_BACKFILL_BATCH_SIZE = 5000
+
+# Status code of a legacy text status, NULL for values that are not a known status
+STATUS_CODE_SQL = "CASE lower(trim(status)) {} END".format(
+    ' '.join(f"WHEN '{status.lower()}' THEN {code}" for status, code in STATUS_CODES.items())
+)
+
+def _status_is_text(connection):
+    """Whether attendance.status still holds the status names rather than codes"""
+    columns = {column['name']: column for column in inspect(connection).get_columns('attendance')}
+    return not isinstance(columns['status']['type'], Integer), 'status_code' in columns
+
+@migration(4, "Attendance status_code column, backfilled from the status names in batches", transactional=False)
+def backfill_attendance_status_codes(engine):
+    with engine.begin() as connection:
+        status_is_text, has_status_code = _status_is_text(connection)
+        if not status_is_text:
+            return
+        if not has_status_code:
+            connection.execute(text("ALTER TABLE attendance ADD COLUMN status_code SMALLINT"))
+        last_id = connection.scalar(text("SELECT MAX(id) FROM attendance")) or 0
+
+    # One short transaction per id range, so the application keeps writing in between
+    for start in range(0, last_id + 1, STATUS_BACKFILL_BATCH_SIZE):
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"UPDATE attendance SET status_code = {STATUS_CODE_SQL} "
+                     "WHERE id >= :start AND id < :end AND status_code IS NULL"),
+                {'start': start, 'end': start + STATUS_BACKFILL_BATCH_SIZE}
+            )
+    logging.info(f"Backfilled attendance status codes up to id {last_id}")
+
+def rebuild_sqlite_attendance(connection, status_source):
+    """
+    Recreate the attendance table from models.Attendance and copy the rows over
+
+    SQLite cannot add NOT NULL or CHECK constraints to an existing column,
+    so the table is rebuilt under a new name and renamed into place, which
+    keeps the email_outbox references pointing at it. status_source is the
+    old column the status codes are copied from. Dropping the old table
+    would cascade to the outbox when foreign keys are enforced, which the
+    app never turns on, so that case is refused.
+    """
+    from models import Attendance
+    table = Attendance.__table__
+    old_columns = {column['name'] for column in inspect(connection).get_columns('attendance')}
+    columns = [column.name for column in table.columns if column.name in old_columns]
+    sources = [status_source if name == 'status' else name for name in columns]
+
+    if connection.scalar(text("PRAGMA foreign_keys")):
+        raise RuntimeError("Rebuilding the attendance table needs SQLite foreign key enforcement "
+                           "(PRAGMA foreign_keys) turned off")
+    create_table = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.execute(text(create_table.replace('CREATE TABLE attendance ', 'CREATE TABLE attendance_rebuilt ', 1)))
+    connection.execute(text(f"INSERT INTO attendance_rebuilt ({', '.join(columns)}) "
+                            f"SELECT {', '.join(sources)} FROM attendance"))
+    connection.execute(text("DROP TABLE attendance"))
+    connection.execute(text("ALTER TABLE attendance_rebuilt RENAME TO attendance"))
+    for index in table.indexes:
+        connection.execute(CreateIndex(index))
+
+@migration(5, "Attendance status stored as its status_code")
+def swap_attendance_status_column(connection):
+    from summary_service import rebuild_daily_summaries
+    from bitmap_service import rebuild_attendance_bitmaps
+    status_is_text, has_status_code = _status_is_text(connection)
+    if not status_is_text:
+        return
+    if not has_status_code:
+        connection.execute(text("ALTER TABLE attendance ADD COLUMN status_code SMALLINT"))
+
+    # Catch up with rows written or changed since their batch was backfilled
+    connection.execute(text(
+        f"UPDATE attendance SET status_code = {STATUS_CODE_SQL} "
+        f"WHERE status_code IS NULL OR status_code <> {STATUS_CODE_SQL}"
+    ))
+    unknown = connection.execute(text("SELECT DISTINCT status FROM attendance WHERE status_code IS NULL")).scalars().all()
+    if unknown:
+        raise ValueError(f"Attendance rows have unknown statuses {unknown}; correct them to Present, Absent "
+                         f"or Late and restart to finish the migration")
+
+    if connection.dialect.name == 'sqlite':
+        rebuild_sqlite_attendance(connection, status_source='status_code')
+    else:
+        connection.execute(text("ALTER TABLE attendance RENAME COLUMN status TO status_name"))
+        connection.execute(text("ALTER TABLE attendance RENAME COLUMN status_code TO status"))
+        connection.execute(text("ALTER TABLE attendance DROP COLUMN status_name"))
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text("ALTER TABLE attendance ALTER COLUMN status SET NOT NULL"))
+            connection.execute(text("ALTER TABLE attendance ADD CONSTRAINT ck_attendance_status CHECK (status IN (1, 2, 3))"))
+
+    # Migrations 2 and 3 may have read the text statuses; recount from the codes
+    rebuild_daily_summaries(connection=connection)
+    rebuild_attendance_bitmaps(connection=connection)
+
+def get_applied_versions(connection):
+    _migration_metadata.create_all(connection)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+def get_pending_migrations():
+    """Migrations not yet recorded in schema_migrations; call inside an app context"""
+    with db.engine.begin() as connection:
+        applied = get_applied_versions(connection)
+    return [entry for entry in MIGRATIONS if entry[0] not in applied]
+
+def run_migrations():
+    """
+    Apply pending migrations in version order; call inside an app context
+
+    Returns the versions applied. Another process applying the same version
+    at the same time is tolerated.
+    """
+    applied_now = []
+    for version, description, function in get_pending_migrations():
+        try:
+            if not function.transactional:
+                function(db.engine)
+            with db.engine.begin() as connection:
+                if connection.dialect.name == 'sqlite':
+                    # pysqlite only opens a transaction before DML; open it now so DDL rolls back too
+                    connection.exec_driver_sql("BEGIN")
+                if version in get_applied_versions(connection):
+                    continue
+                if function.transactional:
+                    function(connection)
+                connection.execute(insert(schema_migrations).values(
+                    version=version, description=description, applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            logging.info(f"Migration {version} was applied by another process")
+            continue
+        logging.info(f"Applied migration {version}: {description}")
+        applied_now.append(version)
+    return applied_now
+
+def init_migrations(app):
+    """Register the `flask migrations` commands"""
+    @app.cli.group('migrations')
+    def migrations_cli():
+        """Database schema migrations"""
+
+    @migrations_cli.command('status')
+    def status():
+        """List applied and pending migrations"""
+        with db.engine.begin() as connection:
+            applied = get_applied_versions(connection)
+        for version, description, _ in MIGRATIONS:
+            click.echo(f"{'applied' if version in applied else 'pending':8} {version:4} {description}")
+
+    @migrations_cli.command('upgrade')
+    def upgrade():
+        """Apply pending migrations"""
+        applied = run_migrations()
+        click.echo(f"Applied {len(applied)} migration(s)" if applied else "Database is up to date")
@@ -1,6 +1,7 @@
 from database import db
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.types import TypeDecorator, SmallInteger
 
 class Teacher(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,6 +56,7 @@ class Class(db.Model):
     # Relationships
     students = db.relationship('Student', backref='class_ref', lazy=True, cascade='all, delete-orphan')
     attendance_records = db.relationship('Attendance', backref='class_ref', lazy=True, cascade='all, delete-orphan')
+    daily_summaries = db.relationship('DailyAttendanceSummary', backref='class_ref', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Class {self.name}>'
@@ -69,21 +71,180 @@ class Student(db.Model):
     
     # Relationships
     attendance_records = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan')
+    attendance_bitmaps = db.relationship('AttendanceBitmap', backref='student', lazy=True, cascade='all, delete-orphan')
+    
+    # Roster and duplicate lookups by class and student number
+    __table_args__ = (db.Index('ix_student_class_student_id', 'class_id', 'student_id'),)
     
     def __repr__(self):
         return f'<Student {self.name}>'
 
+# Small-integer codes of the attendance statuses, as stored; 0 means no record
+NO_RECORD = 0
+STATUS_CODES = {'Present': 1, 'Absent': 2, 'Late': 3}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+
+class AttendanceStatus(TypeDecorator):
+    """Attendance status stored as a SmallInteger code and used as its name"""
+    impl = SmallInteger
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value not in STATUS_CODES:
+            raise ValueError(f"Unknown attendance status: {value!r}")
+        return STATUS_CODES[value]
+    
+    def process_result_value(self, value, dialect):
+        # Text left over from before the status_code migration is passed through
+        return STATUS_NAMES.get(value, value)
+
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
-    status = db.Column(db.String(20), nullable=False)  # Present, Absent, Late
+    status = db.Column(AttendanceStatus, nullable=False)  # Present, Absent, Late (STATUS_CODES)
     marked_at = db.Column(db.DateTime, default=datetime.utcnow)
     email_sent = db.Column(db.Boolean, default=False)  # Track if absence email was sent
     
-    # Composite unique constraint to prevent duplicate entries
-    __table_args__ = (db.UniqueConstraint('student_id', 'class_id', 'date', name='unique_attendance'),)
+    # Composite unique constraint to prevent duplicate entries, the allowed status
+    # codes, plus indexes for the per-class/date reads (attendance page, exports)
+    # and recent-first listings
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'class_id', 'date', name='unique_attendance'),
+        db.CheckConstraint('status IN (1, 2, 3)', name='ck_attendance_status'),
+        db.Index('ix_attendance_class_date', 'class_id', 'date'),
+        db.Index('ix_attendance_class_marked_at', 'class_id', 'marked_at'),
+    )
     
     def __repr__(self):
         return f'<Attendance {self.student.name} - {self.date} - {self.status}>'
+
+class DailyAttendanceSummary(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # One row per class and date, kept in step with Attendance by summary_service
+    __table_args__ = (db.UniqueConstraint('class_id', 'date', name='unique_daily_summary'),)
+    
+    @property
+    def total(self):
+        return self.present + self.absent + self.late
+    
+    def __repr__(self):
+        return f'<DailyAttendanceSummary {self.class_id} {self.date}>'
+
+class AttendanceBitmap(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    origin = db.Column(db.Date, nullable=False)  # Date of the first 2-bit slot
+    bits = db.Column(db.LargeBinary, nullable=False, default=b'')  # STATUS_CODES packed four days per byte
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # One calendar per student and class, kept in step with Attendance by bitmap_service
+    __table_args__ = (db.UniqueConstraint('student_id', 'class_id', name='unique_attendance_bitmap'),)
+    
+    def __repr__(self):
+        return f'<AttendanceBitmap {self.student_id} {self.class_id} from {self.origin}>'
+
+class EmailOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    attendance_id = db.Column(db.Integer, db.ForeignKey('attendance.id'), nullable=False, index=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, cancelled, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    attendance = db.relationship('Attendance', backref=db.backref('outbox_messages', cascade='all, delete-orphan'))
+    
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),)
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}>'
+
+class ImportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    rows_read = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    errors = db.relationship('ImportJobError', backref='job', lazy=True, cascade='all, delete-orphan',
+                             order_by='ImportJobError.id')
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'class_id': self.class_id,
+            'filename': self.filename,
+            'status': self.status,
+            'rows_read': self.rows_read,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+
+class ImportJobError(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), db.ForeignKey('import_job.id'), nullable=False, index=True)
+    message = db.Column(db.Text, nullable=False)
+    
+    def __repr__(self):
+        return f'<ImportJobError {self.job_id}: {self.message}>'
+
+class ExportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # excel, csv
+    start_date = db.Column(db.Date, nullable=True)
+    end_date = db.Column(db.Date, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    download_name = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'class_id': self.class_id,
+            'format': self.format,
+            'status': self.status,
+            'download_name': self.download_name,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.status}>'
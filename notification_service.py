@@ -0,0 +1,204 @@
+"""
+Concurrent delivery of absence notifications
+
+Sends the batches of several teachers in parallel on a thread pool. Each
+teacher's messages are spread over at most EMAIL_TEACHER_CONNECTIONS pooled
+SMTP sessions and paced by a per-teacher token bucket, while every SMTP
+server is limited to EMAIL_SERVER_CONNECTIONS concurrent sessions and an
+optional EMAIL_SERVER_RATE, so providers such as Gmail do not throttle us.
+
+With EMAIL_DIGEST_MODE enabled, absence emails are held until
+EMAIL_DIGEST_CUTOFF on the day of the absence and a student absent from
+several of a teacher's classes gets one combined email.
+"""
+import time
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from email_service import build_absence_message, build_absence_digest_message, get_smtp_settings, get_smtp_pool
+
+DEFAULT_SEND_WORKERS = 8
+DEFAULT_TEACHER_RATE = 5.0  # messages per second per teacher
+DEFAULT_TEACHER_BURST = 10
+DEFAULT_TEACHER_CONNECTIONS = 2
+DEFAULT_SERVER_RATE = None  # messages per second per SMTP server, None for no limit
+DEFAULT_SERVER_CONNECTIONS = 4
+DEFAULT_DIGEST_CUTOFF = '17:00'  # local time at which a day's digest emails go out
+
+_sender = None
+_sender_lock = threading.Lock()
+
+class TokenBucket:
+    """Blocking rate limiter allowing `rate` calls per second with bursts of `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class NotificationSender:
+    """
+    Thread pool sending SMTP batches under per-teacher and per-server limits
+
+    Token buckets and connection semaphores live as long as the sender, so
+    the limits hold across successive dispatch batches.
+    """
+
+    def __init__(self, pool=None, max_workers=DEFAULT_SEND_WORKERS, teacher_rate=DEFAULT_TEACHER_RATE,
+                 teacher_burst=DEFAULT_TEACHER_BURST, teacher_connections=DEFAULT_TEACHER_CONNECTIONS,
+                 server_rate=DEFAULT_SERVER_RATE, server_connections=DEFAULT_SERVER_CONNECTIONS):
+        self.pool = pool or get_smtp_pool()
+        self.teacher_rate = teacher_rate
+        self.teacher_burst = teacher_burst
+        self.teacher_connections = max(1, teacher_connections)
+        self.server_rate = server_rate
+        self.server_connections = max(1, server_connections)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='smtp-sender')
+        self._buckets = {}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+        # Keep every lane's session between batches
+        self.pool.max_idle = max(self.pool.max_idle, self.teacher_connections)
+
+    def _limits(self, teacher_id, settings):
+        """Rate limiters and connection semaphore for one teacher's batch"""
+        server = (settings.server, settings.port)
+        with self._lock:
+            if self.teacher_rate and ('teacher', teacher_id) not in self._buckets:
+                self._buckets[('teacher', teacher_id)] = TokenBucket(self.teacher_rate, self.teacher_burst)
+            if self.server_rate and ('server', server) not in self._buckets:
+                self._buckets[('server', server)] = TokenBucket(self.server_rate, self.server_rate)
+            semaphore = self._semaphores.setdefault(server, threading.BoundedSemaphore(self.server_connections))
+            buckets = [bucket for bucket in (self._buckets.get(('teacher', teacher_id)),
+                                             self._buckets.get(('server', server))) if bucket]
+        return buckets, semaphore
+
+    def _send_lane(self, settings, messages, buckets, semaphore):
+        """Worker task: send a share of one teacher's messages over a single session"""
+        def wait_for_rate_limits():
+            for bucket in buckets:
+                bucket.acquire()
+
+        with semaphore:
+            return self.pool.send_messages(settings, messages, before_send=wait_for_rate_limits)
+
+    def send_batches(self, batches):
+        """
+        Send several teachers' message batches concurrently
+
+        batches is a list of (teacher_id, SMTPSettings, [messages]). Returns
+        one outcome list per batch, aligned with its messages: None when the
+        message was sent, otherwise the exception.
+        """
+        outcomes = [[None] * len(messages) for _, _, messages in batches]
+        lanes = []
+
+        for index, (teacher_id, settings, messages) in enumerate(batches):
+            buckets, semaphore = self._limits(teacher_id, settings)
+            lane_count = min(self.teacher_connections, len(messages))
+            for lane in range(lane_count):
+                positions = list(range(lane, len(messages), lane_count))
+                future = self._executor.submit(self._send_lane, settings, [messages[p] for p in positions],
+                                               buckets, semaphore)
+                lanes.append((index, positions, future))
+
+        for index, positions, future in lanes:
+            try:
+                lane_outcomes = future.result()
+            except Exception as e:
+                lane_outcomes = [e] * len(positions)
+            for position, error in zip(positions, lane_outcomes):
+                outcomes[index][position] = error
+
+        return outcomes
+
+    def send_absence_notifications(self, batches):
+        """
+        Send absence notifications of several teachers concurrently
+
+        batches is a list of (teacher, [(student, classes, attendance_date)]);
+        a notification covering more than one class becomes a digest email.
+        Messages are built in the calling thread, so worker threads never touch
+        ORM objects. Returns one outcome list per batch like send_batches.
+        """
+        outcomes = [None] * len(batches)
+        pending = []
+
+        for index, (teacher, notifications) in enumerate(batches):
+            if not teacher.email_notifications_enabled or not teacher.has_email_config():
+                error = RuntimeError(f"Email notifications not configured for teacher {teacher.email}")
+                outcomes[index] = [error] * len(notifications)
+                continue
+
+            messages = [
+                build_absence_message(student, classes[0], attendance_date, teacher) if len(classes) == 1
+                else build_absence_digest_message(student, classes, attendance_date, teacher)
+                for student, classes, attendance_date in notifications
+            ]
+            pending.append((index, (teacher.id, get_smtp_settings(teacher), messages)))
+
+        sent = self.send_batches([batch for _, batch in pending])
+        for (index, _), batch_outcomes in zip(pending, sent):
+            outcomes[index] = batch_outcomes
+        return outcomes
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+def get_notification_sender(app):
+    """Return the process-wide sender configured from the app, creating it on first use"""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = NotificationSender(
+                max_workers=app.config.get('EMAIL_SEND_WORKERS', DEFAULT_SEND_WORKERS),
+                teacher_rate=app.config.get('EMAIL_TEACHER_RATE', DEFAULT_TEACHER_RATE),
+                teacher_burst=app.config.get('EMAIL_TEACHER_BURST', DEFAULT_TEACHER_BURST),
+                teacher_connections=app.config.get('EMAIL_TEACHER_CONNECTIONS', DEFAULT_TEACHER_CONNECTIONS),
+                server_rate=app.config.get('EMAIL_SERVER_RATE', DEFAULT_SERVER_RATE),
+                server_connections=app.config.get('EMAIL_SERVER_CONNECTIONS', DEFAULT_SERVER_CONNECTIONS)
+            )
+        return _sender
+
+def get_digest_send_time(app, attendance_date, now=None):
+    """
+    UTC time at which absence emails for a date should go out
+
+    Returns None when digest mode is off. The cutoff is read as server local
+    time; a cutoff that has already passed means "as soon as possible".
+    """
+    if not app.config.get('EMAIL_DIGEST_MODE', False):
+        return None
+
+    cutoff = datetime.strptime(app.config.get('EMAIL_DIGEST_CUTOFF', DEFAULT_DIGEST_CUTOFF), '%H:%M').time()
+    send_at = datetime.combine(attendance_date, cutoff).astimezone(timezone.utc).replace(tzinfo=None)
+    return max(send_at, now or datetime.utcnow())
+
+def group_digest_notifications(messages):
+    """
+    Group one teacher's outbox messages by recipient email and date
+
+    Returns lists of messages, each to be sent as one email.
+    """
+    groups = {}
+    for message in messages:
+        attendance = message.attendance
+        key = (attendance.student.email.strip().lower(), attendance.date)
+        groups.setdefault(key, []).append(message)
+    return list(groups.values())
@@ -0,0 +1,203 @@
+"""
+Email outbox dispatcher
+
+Delivers the absence notifications that mark_attendance queues in the
+EmailOutbox table. Run it as its own process next to the web server:
+
+    python outbox_dispatcher.py          # keep polling
+    python outbox_dispatcher.py --once   # drain what is due and exit
+
+Each batch is handed to notification_service, which sends the teachers'
+messages concurrently over pooled SMTP sessions within the configured
+per-teacher and per-server limits. In digest mode (EMAIL_DIGEST_MODE) the
+absences of one recipient on one date are combined into a single email, and
+a batch claims every due message of the digests it starts.
+Failed deliveries are retried with exponential backoff. After
+OUTBOX_MAX_ATTEMPTS the message is dead-lettered (status "dead") and kept
+for inspection. Successful deliveries set Attendance.email_sent in one
+UPDATE per batch.
+"""
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from database import db
+from models import Class, Student, Attendance, EmailOutbox
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.orm import joinedload
+from email_service import get_smtp_pool
+from notification_service import get_notification_sender, group_digest_notifications
+from attendance_service import mark_emails_sent
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 30  # delay before the first retry, doubled after each failure
+DEFAULT_MAX_BACKOFF_SECONDS = 3600
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_POLL_INTERVAL = 5  # seconds between polls when the outbox is drained
+
+def get_retry_delay(attempts, base_seconds=DEFAULT_BACKOFF_SECONDS, max_seconds=DEFAULT_MAX_BACKOFF_SECONDS):
+    """Backoff before the next try of a message that has failed `attempts` times"""
+    return timedelta(seconds=min(max_seconds, base_seconds * 2 ** (attempts - 1)))
+
+def _due_messages_query(now):
+    """Pending due messages with their attendance, student, class and teacher loaded"""
+    return select(EmailOutbox).options(
+        joinedload(EmailOutbox.attendance).joinedload(Attendance.student),
+        joinedload(EmailOutbox.attendance).joinedload(Attendance.class_ref).joinedload(Class.teacher)
+    ).where(
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    )
+
+def claim_due_messages(batch_size, now):
+    """
+    Lock and return up to batch_size pending messages that are due
+
+    Attendance, student, class and teacher are loaded in the same query. On
+    PostgreSQL the rows are locked with SKIP LOCKED so several dispatchers
+    can run side by side.
+    """
+    query = _due_messages_query(now).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(batch_size)
+    query = query.with_for_update(skip_locked=True, of=EmailOutbox)
+    return db.session.execute(query).scalars().all()
+
+def claim_digest_groups(messages, now):
+    """
+    Lock and return the other due messages of the digests started by a batch
+
+    A digest covers one teacher's absences for a recipient on a date, and
+    the batch limit can cut through one. Claiming the rest of each group
+    keeps it to a single email instead of one per batch it spans.
+    """
+    if not messages:
+        return []
+    keys = {
+        (message.attendance.class_ref.teacher_id, message.attendance.date,
+         message.attendance.student.email.strip().lower())
+        for message in messages
+    }
+    query = _due_messages_query(now).join(EmailOutbox.attendance).join(Attendance.student).join(
+        Attendance.class_ref
+    ).where(
+        EmailOutbox.id.notin_([message.id for message in messages]),
+        tuple_(Class.teacher_id, Attendance.date, func.lower(func.trim(Student.email))).in_(keys)
+    ).order_by(EmailOutbox.id)
+    query = query.with_for_update(skip_locked=True, of=EmailOutbox)
+    return db.session.execute(query).unique().scalars().all()
+
+def dispatch_due_messages(app, now=None):
+    """
+    Deliver one batch of due outbox messages and commit the outcome
+
+    Returns a dictionary counting the messages sent, retried, dead-lettered
+    and cancelled, plus how many were claimed.
+    """
+    now = now or datetime.utcnow()
+    max_attempts = app.config.get('OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    base_seconds = app.config.get('OUTBOX_BACKOFF_SECONDS', DEFAULT_BACKOFF_SECONDS)
+    max_seconds = app.config.get('OUTBOX_MAX_BACKOFF_SECONDS', DEFAULT_MAX_BACKOFF_SECONDS)
+    results = {'claimed': 0, 'sent': 0, 'retried': 0, 'dead': 0, 'cancelled': 0}
+
+    digest_mode = app.config.get('EMAIL_DIGEST_MODE', False)
+    messages = claim_due_messages(app.config.get('OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE), now)
+    if digest_mode:
+        messages += claim_digest_groups(messages, now)
+    results['claimed'] = len(messages)
+    sent_attendance_ids = []
+
+    # Group deliverable messages by teacher
+    batches = {}
+    for message in messages:
+        attendance = message.attendance
+
+        # The teacher may have corrected the record, or another path sent it already
+        if attendance.status != 'Absent' or attendance.email_sent:
+            message.status = 'cancelled'
+            results['cancelled'] += 1
+            continue
+        batches.setdefault(attendance.class_ref.teacher, []).append(message)
+
+    # One email per message, or per recipient and date in digest mode
+    groups = {
+        teacher: group_digest_notifications(teacher_messages) if digest_mode
+        else [[message] for message in teacher_messages]
+        for teacher, teacher_messages in batches.items()
+    }
+
+    # Teachers are sent concurrently, within the sender's rate and connection limits
+    outcome_lists = get_notification_sender(app).send_absence_notifications([
+        (teacher, [
+            (group[0].attendance.student,
+             sorted((message.attendance.class_ref for message in group), key=lambda class_obj: class_obj.name),
+             group[0].attendance.date)
+            for group in teacher_groups
+        ])
+        for teacher, teacher_groups in groups.items()
+    ])
+
+    for teacher_groups, outcomes in zip(groups.values(), outcome_lists):
+        for group, error in zip(teacher_groups, outcomes):
+            for message in group:
+                message.attempts += 1
+                if error is None:
+                    message.status = 'sent'
+                    message.sent_at = datetime.utcnow()
+                    message.last_error = None
+                    sent_attendance_ids.append(message.attendance_id)
+                    results['sent'] += 1
+                elif message.attempts >= max_attempts:
+                    message.status = 'dead'
+                    message.last_error = str(error)
+                    results['dead'] += 1
+                    logging.error(f"Outbox message {message.id} dead-lettered after {message.attempts} attempts: {str(error)}")
+                else:
+                    message.status = 'pending'
+                    message.last_error = str(error)
+                    message.next_attempt_at = now + get_retry_delay(message.attempts, base_seconds, max_seconds)
+                    results['retried'] += 1
+                    logging.warning(f"Outbox message {message.id} failed, retrying at {message.next_attempt_at}: {str(error)}")
+
+    mark_emails_sent(sent_attendance_ids)
+    db.session.commit()
+    return results
+
+def run_dispatcher(app, once=False):
+    """
+    Drain the outbox, polling every OUTBOX_POLL_INTERVAL seconds once it is empty
+    """
+    poll_interval = app.config.get('OUTBOX_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    batch_size = app.config.get('OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    logging.info("Email outbox dispatcher started")
+
+    with app.app_context():
+        while True:
+            try:
+                results = dispatch_due_messages(app)
+                if results['claimed']:
+                    logging.info(f"Outbox batch: {results['sent']} sent, {results['retried']} retried, "
+                                 f"{results['dead']} dead, {results['cancelled']} cancelled")
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Outbox dispatch failed: {str(e)}")
+                results = {'claimed': 0}
+
+            finally:
+                db.session.remove()
+                get_smtp_pool().prune()
+
+            # Keep going without sleeping while full batches are coming in
+            if results['claimed'] >= batch_size:
+                continue
+            if once:
+                break
+            time.sleep(poll_interval)
+
+    get_smtp_pool().close_all()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deliver queued absence notification emails")
+    parser.add_argument('--once', action='store_true', help="drain the messages that are due and exit")
+    args = parser.parse_args()
+
+    from app import app
+    run_dispatcher(app, once=args.once)
@@ -0,0 +1,62 @@
+"""
+Per-request SQL query budgets
+
+Counts the statements each request sends to the database and compares the
+count with the budget of the view, set with the @query_budget decorator or
+the QUERY_BUDGETS config mapping ({endpoint: max_queries}). Going over
+budget logs a warning; with QUERY_BUDGET_STRICT (on by default when
+TESTING) the request fails with QueryBudgetExceeded instead, so an N+1
+regression breaks the test that renders the page.
+"""
+import logging
+from flask import g, current_app, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class QueryBudgetExceeded(Exception):
+    """A view issued more SQL statements than its budget allows"""
+
+def query_budget(max_queries):
+    """Declare the most SQL statements one request to this view may issue"""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+
+def get_query_count():
+    """Statements issued so far by the current request"""
+    return g.get('query_count', 0)
+
+def get_query_budget(endpoint):
+    """Budget of an endpoint, or None when it has none"""
+    budgets = current_app.config.get('QUERY_BUDGETS', {})
+    if endpoint in budgets:
+        return budgets[endpoint]
+    view = current_app.view_functions.get(endpoint)
+    return getattr(view, 'query_budget', None)
+
+def init_query_budget(app):
+    """Count queries per request and check them against the view budgets"""
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+
+    @app.before_request
+    def start_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def check_query_budget(response):
+        budget = get_query_budget(request.endpoint)
+        count = get_query_count()
+        if budget is None or count <= budget:
+            return response
+
+        message = f"{request.endpoint} issued {count} SQL queries, budget is {budget}"
+        if app.config.get('QUERY_BUDGET_STRICT', app.testing):
+            raise QueryBudgetExceeded(message)
+        logging.warning(message)
+        return response
@@ -1,13 +1,29 @@
 import os
+import io
+import re
+import csv
+import uuid
 import tempfile
-from datetime import datetime, date
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+from datetime import datetime, date, timedelta
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file, Response, stream_with_context, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from database import db
-from models import Teacher, Class, Student, Attendance
-from email_service import send_absence_notification, send_test_email
-from export_service import export_to_excel, export_to_csv
+from models import Teacher, Class, Student, Attendance, ImportJobError, STATUS_CODES
+from sqlalchemy import func
+from query_budget import query_budget
+from email_service import send_test_email, get_smtp_settings, get_smtp_pool
+from attendance_service import mark_class_attendance, enqueue_absence_notifications
+from notification_service import get_digest_send_time
+from dashboard_service import get_dashboard_stats, invalidate_dashboard
+from history_service import get_history_page, get_history_statistics, serialize_history_record, DEFAULT_HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE
+from export_service import export_to_excel, stream_csv
+from export_cache_service import get_data_version, get_cache_key, get_cached_export, store_export, tee_to_cache
+from bundle_export_service import stream_teacher_export_zip
+from analytics_service import get_at_risk_report, NUMPY_AVAILABLE, DEFAULT_AT_RISK_THRESHOLD, DEFAULT_AT_RISK_ABSENCE_STREAK
+from bitmap_service import get_student_calendar, get_class_heatmap, markable_date_range, DEFAULT_HEATMAP_DAYS, MAX_HEATMAP_DAYS
+from facts_export_service import export_attendance_facts, FACTS_FORMATS, PYARROW_AVAILABLE
+from job_service import submit_export_job, get_export_job, get_export_job_file, submit_import_job, get_import_job
 try:
     from bulk_import_service import process_bulk_import, allowed_file
     BULK_IMPORT_AVAILABLE = True
@@ -93,27 +109,18 @@ def logout():
     return redirect(url_for('main.login'))
 
 @main_bp.route('/dashboard')
+@query_budget(5)
 def dashboard():
     if not require_login():
         return redirect(url_for('main.login'))
     
-    teacher_id = session['teacher_id']
-    
-    # Get statistics
-    total_classes = Class.query.filter_by(teacher_id=teacher_id).count()
-    total_students = db.session.query(Student).join(Class).filter(Class.teacher_id == teacher_id).count()
-    
-    # Get recent attendance records
-    recent_attendance = db.session.query(Attendance).join(Student).join(Class).filter(
-        Class.teacher_id == teacher_id
-    ).order_by(Attendance.marked_at.desc()).limit(5).all()
+    # Class and student counts, recent activity and attendance rate, cached per teacher
+    stats = get_dashboard_stats(current_app, session['teacher_id'])
     
-    return render_template('dashboard.html', 
-                         total_classes=total_classes,
-                         total_students=total_students,
-                         recent_attendance=recent_attendance)
+    return render_template('dashboard.html', **stats)
 
 @main_bp.route('/classes')
+@query_budget(4)
 def classes():
     if not require_login():
         return redirect(url_for('main.login'))
@@ -121,7 +128,12 @@ def classes():
     teacher_id = session['teacher_id']
     teacher_classes = Class.query.filter_by(teacher_id=teacher_id).all()
     
-    return render_template('classes.html', classes=teacher_classes)
+    # Student counts from one grouped query instead of loading every class's students
+    student_counts = dict(db.session.query(Student.class_id, func.count(Student.id)).join(Class).filter(
+        Class.teacher_id == teacher_id
+    ).group_by(Student.class_id).all())
+    
+    return render_template('classes.html', classes=teacher_classes, student_counts=student_counts)
 
 @main_bp.route('/classes/add', methods=['POST'])
 def add_class():
@@ -135,11 +147,13 @@ def add_class():
     new_class = Class(name=name, subject=subject, teacher_id=teacher_id)
     db.session.add(new_class)
     db.session.commit()
+    invalidate_dashboard(current_app, teacher_id)
     
     flash('Class added successfully!', 'success')
     return redirect(url_for('main.classes'))
 
 @main_bp.route('/classes/<int:class_id>/students')
+@query_budget(4)
 def students(class_id):
     if not require_login():
         return redirect(url_for('main.login'))
@@ -152,7 +166,13 @@ def students(class_id):
     
     students = Student.query.filter_by(class_id=class_id).all()
     
-    return render_template('students.html', class_obj=class_obj, students=students)
+    # Import job to show progress for, right after a bulk upload
+    import_job = None
+    import_job_id = request.args.get('import_job')
+    if import_job_id:
+        import_job = get_import_job(import_job_id, session['teacher_id'])
+    
+    return render_template('students.html', class_obj=class_obj, students=students, import_job=import_job)
 
 @main_bp.route('/classes/<int:class_id>/students/add', methods=['POST'])
 def add_student(class_id):
@@ -172,6 +192,7 @@ def add_student(class_id):
     new_student = Student(name=name, email=email, student_id=student_id, class_id=class_id)
     db.session.add(new_student)
     db.session.commit()
+    invalidate_dashboard(current_app, session['teacher_id'])
     
     flash('Student added successfully!', 'success')
     return redirect(url_for('main.students', class_id=class_id))
@@ -209,9 +230,9 @@ def bulk_import_students(class_id):
         return redirect(url_for('main.students', class_id=class_id))
     
     try:
-        # Save uploaded file temporarily
+        # Save uploaded file under a unique name; the import job deletes it when done
         filename = secure_filename(file.filename)
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
+        temp_path = os.path.join(tempfile.gettempdir(), f'{uuid.uuid4().hex}_{filename}')
         file.save(temp_path)
         
         # Get column mapping from form
@@ -224,27 +245,13 @@ def bulk_import_students(class_id):
         # Get skip duplicates option
         skip_duplicates = 'skip_duplicates' in request.form
         
-        # Process the import
-        results = process_bulk_import(temp_path, class_id, column_mapping, skip_duplicates)
+        # Run the import in the background and let the page poll its progress
+        batch_size = current_app.config.get('IMPORT_BATCH_SIZE', 5000)
+        job = submit_import_job(current_app._get_current_object(), session['teacher_id'], class_obj,
+                                temp_path, filename, column_mapping, skip_duplicates, batch_size)
         
-        # Generate user feedback
-        if results['success']:
-            success_msg = f"Successfully imported {results['imported']} students!"
-            if results['skipped'] > 0:
-                success_msg += f" ({results['skipped']} duplicates skipped)"
-            flash(success_msg, 'success')
-        else:
-            flash('Import failed. Please check your file format and try again.', 'error')
-        
-        # Show any errors or warnings
-        if results['errors']:
-            for error in results['errors'][:10]:  # Limit to first 10 errors
-                flash(error, 'warning')
-            
-            if len(results['errors']) > 10:
-                flash(f"... and {len(results['errors']) - 10} more errors. Please check your file.", 'warning')
-        
-        logging.info(f"Bulk import completed for class {class_id}: {results['imported']} imported, {results['skipped']} skipped, {len(results['errors'])} errors")
+        flash(f'Import of {filename} started. Progress is shown below.', 'info')
+        return redirect(url_for('main.students', class_id=class_id, import_job=job.id))
         
     except Exception as e:
         logging.error(f"Bulk import failed for class {class_id}: {str(e)}")
@@ -252,7 +259,52 @@ def bulk_import_students(class_id):
     
     return redirect(url_for('main.students', class_id=class_id))
 
+@main_bp.route('/imports/<job_id>')
+def import_job_status(job_id):
+    if not require_login():
+        return jsonify({'error': 'Login required'}), 401
+    
+    job = get_import_job(job_id, session['teacher_id'])
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+    
+    status = job.to_dict()
+    status['recent_errors'] = [error.message for error in ImportJobError.query.filter_by(job_id=job.id)
+                               .order_by(ImportJobError.id).limit(10)]
+    status['errors_url'] = url_for('main.import_job_errors', job_id=job.id)
+    return jsonify(status)
+
+@main_bp.route('/imports/<job_id>/errors.csv')
+def import_job_errors(job_id):
+    if not require_login():
+        return redirect(url_for('main.login'))
+    
+    job = get_import_job(job_id, session['teacher_id'])
+    if not job:
+        flash('Import job not found!', 'error')
+        return redirect(url_for('main.classes'))
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Row', 'Error'])
+        errors = db.session.query(ImportJobError.message).filter_by(job_id=job_id).order_by(ImportJobError.id).yield_per(1000)
+        for (message,) in errors:
+            # Messages look like "Row 12: Name is required"; file-level errors have no row
+            row_match = re.match(r'Row (\d+): (.*)', message, re.DOTALL)
+            writer.writerow([row_match.group(1), row_match.group(2)] if row_match else ['', message])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers.set('Content-Disposition', 'attachment', filename=f'import_errors_{job.id}.csv')
+    return response
+
 @main_bp.route('/classes/<int:class_id>/attendance')
+@query_budget(4)
 def attendance(class_id):
     if not require_login():
         return redirect(url_for('main.login'))
@@ -275,11 +327,10 @@ def attendance(class_id):
     
     students = Student.query.filter_by(class_id=class_id).all()
     
-    # Get existing attendance records for the date
-    existing_attendance = {}
-    attendance_records = Attendance.query.filter_by(class_id=class_id, date=attendance_date).all()
-    for record in attendance_records:
-        existing_attendance[record.student_id] = record.status
+    # Get existing attendance statuses for the date
+    existing_attendance = dict(db.session.query(Attendance.student_id, Attendance.status).filter_by(
+        class_id=class_id, date=attendance_date
+    ).all())
     
     return render_template('attendance.html', 
                          class_obj=class_obj, 
@@ -288,6 +339,7 @@ def attendance(class_id):
                          existing_attendance=existing_attendance)
 
 @main_bp.route('/classes/<int:class_id>/attendance/mark', methods=['POST'])
+@query_budget(10)
 def mark_attendance(class_id):
     if not require_login():
         return redirect(url_for('main.login'))
@@ -298,118 +350,237 @@ def mark_attendance(class_id):
         flash('Class not found or access denied!', 'error')
         return redirect(url_for('main.classes'))
     
-    attendance_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
-    
-    absent_students = []
-    
-    # Process attendance for each student
-    students = Student.query.filter_by(class_id=class_id).all()
-    for student in students:
-        status = request.form.get(f'attendance_{student.id}', 'Absent')
-        
-        # Check if attendance already exists
-        existing_attendance = Attendance.query.filter_by(
-            student_id=student.id, 
-            class_id=class_id, 
-            date=attendance_date
-        ).first()
-        
-        if existing_attendance:
-            existing_attendance.status = status
-            existing_attendance.marked_at = datetime.utcnow()
-            # Reset email_sent flag if status changed to absent and email wasn't sent today
-            if status == 'Absent' and not existing_attendance.email_sent:
-                absent_students.append((student, existing_attendance))
-        else:
-            new_attendance = Attendance(
-                student_id=student.id,
-                class_id=class_id,
-                date=attendance_date,
-                status=status,
-                email_sent=False
-            )
-            db.session.add(new_attendance)
-            
-            # Collect absent students for email notification
-            if status == 'Absent':
-                absent_students.append((student, new_attendance))
-    
-    db.session.commit()
-    
-    # Send email notifications to absent students (only once per day)
-    emails_sent = 0
-    if absent_students:
-        teacher = Teacher.query.get(session['teacher_id'])
-        for student, attendance_record in absent_students:
-            # Only send email if not already sent for this date
-            if not attendance_record.email_sent:
-                try:
-                    email_success = send_absence_notification(student, class_obj, attendance_date, teacher)
-                    if email_success:
-                        attendance_record.email_sent = True
-                        emails_sent += 1
-                        logging.info(f"Absence email sent to {student.email}")
-                    else:
-                        logging.warning(f"Failed to send email to {student.email} - SMTP not configured")
-                except Exception as e:
-                    logging.error(f"Failed to send email to {student.email}: {str(e)}")
+    try:
+        attendance_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date format!', 'error')
+        return redirect(url_for('main.attendance', class_id=class_id))
+    
+    first_day, last_day = markable_date_range()
+    if not first_day <= attendance_date <= last_day:
+        flash(f'Attendance can only be marked for dates from {first_day.strftime("%B %d, %Y")} '
+              f'to {last_day.strftime("%B %d, %Y")}.', 'error')
+        return redirect(url_for('main.attendance', class_id=class_id))
+    
+    # Record every student's status in one set-based upsert
+    student_ids = [student_id for (student_id,) in db.session.query(Student.id).filter_by(class_id=class_id)]
+    statuses = {student_id: request.form.get(f'attendance_{student_id}', 'Absent') for student_id in student_ids}
+    if any(status not in STATUS_CODES for status in statuses.values()):
+        flash('Invalid attendance status submitted!', 'error')
+        return redirect(url_for('main.attendance', class_id=class_id, date=attendance_date.strftime('%Y-%m-%d')))
+    mark_class_attendance(class_id, attendance_date, statuses)
+    
+    # Queue absence emails (only once per day) in the same transaction;
+    # the outbox dispatcher delivers them in the background
+    emails_queued = 0
+    send_at = None
+    teacher = Teacher.query.get(session['teacher_id'])
+    notifications_configured = teacher.email_notifications_enabled and teacher.has_email_config()
+    if notifications_configured:
+        send_at = get_digest_send_time(current_app, attendance_date)
+        emails_queued = enqueue_absence_notifications(class_id, attendance_date, teacher.id, send_at)
     
     db.session.commit()
-    
-    flash(f'Attendance marked successfully for {len(students)} students!', 'success')
-    if emails_sent > 0:
-        flash(f'Email notifications sent to {emails_sent} absent students.', 'info')
-    elif absent_students and emails_sent == 0:
+    invalidate_dashboard(current_app, session['teacher_id'])
+    
+    flash(f'Attendance marked successfully for {len(student_ids)} students!', 'success')
+    if emails_queued > 0 and send_at:
+        flash(f'Email notifications for {emails_queued} absent students will go out in the daily digest.', 'info')
+    elif emails_queued > 0:
+        flash(f'Email notifications queued for {emails_queued} absent students.', 'info')
+    elif not notifications_configured and 'Absent' in statuses.values():
         flash('Attendance marked but emails not sent. Please configure SMTP settings.', 'warning')
     
     return redirect(url_for('main.attendance', class_id=class_id, date=attendance_date.strftime('%Y-%m-%d')))
 
-@main_bp.route('/history')
-def history():
-    if not require_login():
-        return redirect(url_for('main.login'))
-    
-    teacher_id = session['teacher_id']
-    
-    # Get filter parameters
+def _parse_history_filters():
+    """Class and date filters of the history page and API from the query string"""
     class_id = request.args.get('class_id', type=int)
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    # Base query
-    query = db.session.query(Attendance).join(Student).join(Class).filter(Class.teacher_id == teacher_id)
-    
-    # Apply filters
-    if class_id:
-        query = query.filter(Attendance.class_id == class_id)
-    
+    # Dates that do not parse are kept for redisplay but not applied
+    start_filter = end_filter = None
     if start_date:
         try:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Attendance.date >= start_date)
+            start_date = start_filter = datetime.strptime(start_date, '%Y-%m-%d').date()
         except ValueError:
             pass
     
     if end_date:
         try:
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Attendance.date <= end_date)
+            end_date = end_filter = datetime.strptime(end_date, '%Y-%m-%d').date()
         except ValueError:
             pass
     
-    # Get attendance records
-    attendance_records = query.order_by(Attendance.date.desc(), Attendance.marked_at.desc()).all()
+    return class_id, start_date, end_date, start_filter, end_filter
+
+@main_bp.route('/history')
+@query_budget(6)
+def history():
+    if not require_login():
+        return redirect(url_for('main.login'))
+    
+    teacher_id = session['teacher_id']
+    
+    # Get filter parameters
+    class_id, start_date, end_date, start_filter, end_filter = _parse_history_filters()
+    
+    # First page of records; the rest is loaded from /api/history while scrolling
+    page_size = current_app.config.get('HISTORY_PAGE_SIZE', DEFAULT_HISTORY_PAGE_SIZE)
+    page = get_history_page(teacher_id, class_id, start_filter, end_filter, page_size=page_size)
+    statistics = get_history_statistics(teacher_id, class_id, start_filter, end_filter)
     
     # Get teacher's classes for filter dropdown
     teacher_classes = Class.query.filter_by(teacher_id=teacher_id).all()
     
     return render_template('history.html', 
-                         attendance_records=attendance_records,
+                         attendance_records=page['records'],
+                         next_cursor=page['next_cursor'],
+                         statistics=statistics,
+                         totals=statistics['totals'],
+                         teacher_classes=teacher_classes,
+                         current_class_id=class_id,
+                         current_start_date=start_date,
+                         current_end_date=end_date)
+
+@main_bp.route('/api/history')
+@query_budget(3)
+def history_api():
+    if not require_login():
+        return jsonify({'error': 'Login required'}), 401
+    
+    class_id, start_date, end_date, start_filter, end_filter = _parse_history_filters()
+    page_size = request.args.get('limit', type=int) or current_app.config.get('HISTORY_PAGE_SIZE', DEFAULT_HISTORY_PAGE_SIZE)
+    page_size = max(1, min(page_size, MAX_HISTORY_PAGE_SIZE))
+    
+    try:
+        page = get_history_page(session['teacher_id'], class_id, start_filter, end_filter,
+                                cursor=request.args.get('cursor'), page_size=page_size)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'records': [serialize_history_record(row) for row in page['records']],
+        'next_cursor': page['next_cursor']
+    })
+
+def _parse_at_risk_thresholds():
+    """Attendance threshold and absence streak from the query string, else the app config"""
+    threshold = request.args.get('threshold', type=float)
+    if threshold is None or not 0 <= threshold <= 100:
+        threshold = current_app.config.get('AT_RISK_THRESHOLD', DEFAULT_AT_RISK_THRESHOLD)
+    absence_streak = request.args.get('absence_streak', type=int)
+    if absence_streak is None or absence_streak < 1:
+        absence_streak = current_app.config.get('AT_RISK_ABSENCE_STREAK', DEFAULT_AT_RISK_ABSENCE_STREAK)
+    return threshold, absence_streak
+
+@main_bp.route('/analytics/at-risk')
+@query_budget(5)
+def at_risk_report():
+    if not require_login():
+        return redirect(url_for('main.login'))
+    
+    if not NUMPY_AVAILABLE:
+        flash('Attendance analytics are not available. Please install numpy to enable this feature.', 'error')
+        return redirect(url_for('main.dashboard'))
+    
+    teacher_id = session['teacher_id']
+    class_id, start_date, end_date, start_filter, end_filter = _parse_history_filters()
+    threshold, absence_streak = _parse_at_risk_thresholds()
+    
+    report = get_at_risk_report(teacher_id, class_id, start_filter, end_filter, threshold, absence_streak)
+    teacher_classes = Class.query.filter_by(teacher_id=teacher_id).all()
+    
+    return render_template('at_risk.html',
+                         report=report,
                          teacher_classes=teacher_classes,
                          current_class_id=class_id,
                          current_start_date=start_date,
                          current_end_date=end_date)
 
+@main_bp.route('/api/analytics/at-risk')
+@query_budget(4)
+def at_risk_api():
+    if not require_login():
+        return jsonify({'error': 'Login required'}), 401
+    
+    if not NUMPY_AVAILABLE:
+        return jsonify({'error': 'Attendance analytics require numpy'}), 501
+    
+    class_id, start_date, end_date, start_filter, end_filter = _parse_history_filters()
+    threshold, absence_streak = _parse_at_risk_thresholds()
+    report = get_at_risk_report(session['teacher_id'], class_id, start_filter, end_filter, threshold, absence_streak)
+    
+    # Every student's metrics, or only the at-risk ones with ?at_risk_only=1
+    if request.args.get('at_risk_only', type=int):
+        for class_report in report['classes']:
+            class_report['students'] = [entry for entry in class_report['students'] if entry['at_risk']]
+    for class_report in report['classes']:
+        for key in ('first_date', 'last_date'):
+            class_report[key] = class_report[key].isoformat() if class_report[key] else None
+    
+    return jsonify(report)
+
+@main_bp.route('/api/students/<int:student_id>/calendar')
+@query_budget(3)
+def student_calendar_api(student_id):
+    if not require_login():
+        return jsonify({'error': 'Login required'}), 401
+    
+    # Verify the student is in one of the teacher's classes
+    student = db.session.query(Student).join(Class).filter(
+        Student.id == student_id, Class.teacher_id == session['teacher_id']
+    ).first()
+    if not student:
+        return jsonify({'error': 'Student not found'}), 404
+    
+    # Defaults to the recorded days; explicit ranges are capped like the heatmap
+    _, _, _, start_filter, end_filter = _parse_history_filters()
+    if start_filter and end_filter and not 1 <= (end_filter - start_filter).days + 1 <= MAX_HEATMAP_DAYS:
+        return jsonify({'error': f'Date range must cover 1 to {MAX_HEATMAP_DAYS} days'}), 400
+    calendar = get_student_calendar(student.id, student.class_id, start_filter, end_filter)
+    
+    return jsonify({
+        'student_id': student.id,
+        'class_id': student.class_id,
+        'start': calendar['start'].isoformat() if calendar['start'] else None,
+        'end': calendar['end'].isoformat() if calendar['end'] else None,
+        'days': {day.isoformat(): status for day, status in calendar['days'].items()},
+        'counts': calendar['counts'],
+        'present_percentage': calendar['present_percentage']
+    })
+
+@main_bp.route('/api/classes/<int:class_id>/heatmap')
+@query_budget(3)
+def class_heatmap_api(class_id):
+    if not require_login():
+        return jsonify({'error': 'Login required'}), 401
+    
+    # Verify class belongs to logged-in teacher
+    class_obj = Class.query.filter_by(id=class_id, teacher_id=session['teacher_id']).first()
+    if not class_obj:
+        return jsonify({'error': 'Class not found'}), 404
+    
+    # Defaults to the twelve weeks up to today
+    _, _, _, start_filter, end_filter = _parse_history_filters()
+    end_filter = end_filter or date.today()
+    start_filter = start_filter or end_filter - timedelta(days=DEFAULT_HEATMAP_DAYS - 1)
+    days = (end_filter - start_filter).days + 1
+    if days < 1 or days > MAX_HEATMAP_DAYS:
+        return jsonify({'error': f'Date range must cover 1 to {MAX_HEATMAP_DAYS} days'}), 400
+    
+    return jsonify({
+        'class_id': class_obj.id,
+        'start': start_filter.isoformat(),
+        'end': end_filter.isoformat(),
+        'codes': {'0': None, '1': 'Present', '2': 'Absent', '3': 'Late'},
+        'students': {
+            str(student_id): codes
+            for student_id, codes in get_class_heatmap(class_obj.id, start_filter, end_filter).items()
+        }
+    })
+
 @main_bp.route('/export/excel')
 def export_excel():
     if not require_login():
@@ -445,7 +616,14 @@ def export_excel():
         return redirect(url_for('main.history'))
     
     try:
-        file_path = export_to_excel(class_obj, start_date, end_date)
+        # Reuse the cached workbook when the class data has not changed
+        app = current_app._get_current_object()
+        cache_key = get_cache_key(class_obj, start_date, end_date, 'excel',
+                                  get_data_version(class_obj, start_date, end_date))
+        file_path = get_cached_export(app, cache_key, '.xlsx')
+        if not file_path:
+            file_path = store_export(app, cache_key, '.xlsx', export_to_excel(class_obj, start_date, end_date))
+        
         filename = f'{class_obj.name}_attendance'
         if start_date and end_date:
             filename += f'_{start_date}_{end_date}'
@@ -491,17 +669,204 @@ def export_csv():
         return redirect(url_for('main.history'))
     
     try:
-        file_path = export_to_csv(class_obj, start_date, end_date)
         filename = f'{class_obj.name}_attendance'
         if start_date and end_date:
             filename += f'_{start_date}_{end_date}'
         filename += '.csv'
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        
+        # Serve the cached report when the class data has not changed
+        app = current_app._get_current_object()
+        cache_key = get_cache_key(class_obj, start_date, end_date, 'csv',
+                                  get_data_version(class_obj, start_date, end_date))
+        file_path = get_cached_export(app, cache_key, '.csv')
+        if file_path:
+            return send_file(file_path, as_attachment=True, download_name=filename)
+        
+        # Otherwise stream it, saving a copy to the cache as it goes.
+        # Pull the first chunk eagerly so query errors surface before streaming starts
+        chunks = tee_to_cache(app, cache_key, '.csv', stream_csv(class_obj, start_date, end_date))
+        first_chunk = next(chunks, '')
+        
+        def generate():
+            yield first_chunk
+            yield from chunks
+        
+        response = Response(stream_with_context(generate()), mimetype='text/csv')
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+        return response
     except Exception as e:
         logging.error(f"CSV export failed: {str(e)}")
         flash('Export failed. Please try again.', 'error')
         return redirect(url_for('main.history'))
 
+@main_bp.route('/export/all')
+def export_all_classes():
+    if not require_login():
+        return redirect(url_for('main.login'))
+    
+    teacher_id = session['teacher_id']
+    export_format = request.args.get('format', 'excel')
+    
+    # Get date filters from query parameters
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
+    
+    start_date = None
+    end_date = None
+    
+    try:
+        if start_date_str:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        if end_date_str:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date format!', 'error')
+        return redirect(url_for('main.classes'))
+    
+    try:
+        chunks = stream_teacher_export_zip(current_app._get_current_object(), teacher_id,
+                                           export_format, start_date, end_date)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.classes'))
+    
+    filename = 'all_classes_attendance'
+    if start_date and end_date:
+        filename += f'_{start_date}_{end_date}'
+    filename += '.zip'
+    response = Response(stream_with_context(chunks), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    return response
+
+@main_bp.route('/export/facts')
+def export_facts():
+    if not require_login():
+        return redirect(url_for('main.login'))
+    
+    if not PYARROW_AVAILABLE:
+        flash('Parquet/Arrow export is not available. Please install pyarrow to enable this feature.', 'error')
+        return redirect(url_for('main.history'))
+    
+    teacher_id = session['teacher_id']
+    export_format = request.args.get('format', 'parquet')
+    class_id = request.args.get('class_id', type=int)
+    
+    if export_format not in FACTS_FORMATS:
+        flash('Unsupported export format!', 'error')
+        return redirect(url_for('main.history'))
+    
+    # Verify class belongs to teacher when exporting a single class
+    if class_id and not Class.query.filter_by(id=class_id, teacher_id=teacher_id).first():
+        flash('Class not found or access denied!', 'error')
+        return redirect(url_for('main.history'))
+    
+    # Get date filters from query parameters
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
+    
+    start_date = None
+    end_date = None
+    
+    try:
+        if start_date_str:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        if end_date_str:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date format!', 'error')
+        return redirect(url_for('main.history'))
+    
+    try:
+        file_path = export_attendance_facts(teacher_id, export_format, class_id, start_date, end_date)
+        filename = 'attendance_facts'
+        if start_date and end_date:
+            filename += f'_{start_date}_{end_date}'
+        filename += FACTS_FORMATS[export_format]
+        response = send_file(file_path, as_attachment=True, download_name=filename)
+        response.call_on_close(lambda: os.remove(file_path))
+        return response
+    except Exception as e:
+        logging.error(f"Facts export failed: {str(e)}")
+        flash('Export failed. Please try again.', 'error')
+        return redirect(url_for('main.history'))
+
+def _export_job_json(job):
+    """JSON body describing an export job"""
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'format': job['format'],
+        'error': job['error'],
+        'download_name': job['download_name'],
+        'status_url': url_for('main.export_job_status', job_id=job['job_id']),
+        'download_url': url_for('main.export_job_download', job_id=job['job_id']) if job['status'] == 'completed' else None
+    }
+
+@main_bp.route('/export/jobs', methods=['POST'])
+def export_job_submit():
+    if not require_login():
+        return jsonify({'error': 'Login required'}), 401
+    
+    teacher_id = session['teacher_id']
+    class_id = request.form.get('class_id', type=int)
+    export_format = request.form.get('format', 'excel')
+    
+    if not class_id:
+        return jsonify({'error': 'Please select a class to export.'}), 400
+    
+    # Verify class belongs to teacher
+    class_obj = Class.query.filter_by(id=class_id, teacher_id=teacher_id).first()
+    if not class_obj:
+        return jsonify({'error': 'Class not found or access denied!'}), 404
+    
+    start_date_str = request.form.get('start_date')
+    end_date_str = request.form.get('end_date')
+    
+    start_date = None
+    end_date = None
+    
+    try:
+        if start_date_str:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        if end_date_str:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format!'}), 400
+    
+    try:
+        job = submit_export_job(current_app._get_current_object(), teacher_id, class_obj,
+                                export_format, start_date, end_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(_export_job_json(job)), 202
+
+@main_bp.route('/export/jobs/<job_id>')
+def export_job_status(job_id):
+    if not require_login():
+        return jsonify({'error': 'Login required'}), 401
+    
+    job = get_export_job(current_app._get_current_object(), job_id, session['teacher_id'])
+    if not job:
+        return jsonify({'error': 'Export job not found or expired'}), 404
+    
+    return jsonify(_export_job_json(job))
+
+@main_bp.route('/export/jobs/<job_id>/download')
+def export_job_download(job_id):
+    if not require_login():
+        return redirect(url_for('main.login'))
+    
+    app = current_app._get_current_object()
+    job_file = get_export_job_file(app, job_id, session['teacher_id'])
+    if not job_file:
+        flash('Export is not ready or has expired. Please export again.', 'error')
+        return redirect(url_for('main.history'))
+    
+    file_path, download_name = job_file
+    return send_file(file_path, as_attachment=True, download_name=download_name)
+
 @main_bp.route('/test-email', methods=['GET', 'POST'])
 def test_email():
     if not require_login():
@@ -536,6 +901,8 @@ def email_settings():
         return redirect(url_for('main.login'))
     
     if request.method == 'POST':
+        previous_settings = get_smtp_settings(teacher)
+        
         # Update email settings
         teacher.smtp_email = request.form.get('smtp_email', '').strip()
         smtp_password = request.form.get('smtp_password', '').strip()
@@ -549,6 +916,7 @@ def email_settings():
         
         try:
             db.session.commit()
+            get_smtp_pool().invalidate(previous_settings)
             flash('Email settings updated successfully!', 'success')
             
             # Test email connection if configured
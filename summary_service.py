@@ -0,0 +1,155 @@
+"""
+Daily attendance summaries
+
+DailyAttendanceSummary holds the Present/Absent/Late counts of each class
+and date. Whatever writes Attendance refreshes the summaries of the days it
+touched in the same transaction, by regrouping just those days' rows, so
+the table cannot drift from the records it summarizes. Reads that only need
+counts (history statistics, the dashboard rate, export date lists) scan one
+row per class day instead of one per student per day.
+
+The whole table can be regenerated from Attendance with:
+
+    flask --app app summaries rebuild
+"""
+import logging
+from datetime import datetime
+import click
+from database import db
+from models import Class, Attendance, DailyAttendanceSummary
+from sqlalchemy import select, delete, insert, func, case, literal
+
+SUMMARY_COLUMNS = ['class_id', 'date', 'present', 'absent', 'late', 'updated_at']
+
+def _grouped_counts(*conditions):
+    """SELECT of Attendance grouped by class and date, in SUMMARY_COLUMNS order"""
+    def count_status(status):
+        return func.coalesce(func.sum(case((Attendance.status == status, 1), else_=0)), 0)
+
+    return select(
+        Attendance.class_id,
+        Attendance.date,
+        count_status('Present'),
+        count_status('Absent'),
+        count_status('Late'),
+        literal(datetime.utcnow())
+    ).where(*conditions).group_by(Attendance.class_id, Attendance.date)
+
+def refresh_daily_summaries(class_id, dates, connection=None):
+    """
+    Recount the summaries of one class for the given dates
+
+    Runs in the caller's transaction (db.session, or connection when given)
+    so it commits or rolls back with the attendance change. Uses INSERT ...
+    SELECT ... ON CONFLICT DO UPDATE where the database supports it, and a
+    delete and re-insert of those days otherwise.
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return
+    executor = connection or db.session
+    counts = _grouped_counts(Attendance.class_id == class_id, Attendance.date.in_(dates))
+
+    # Days left without any attendance lose their summary
+    remaining = select(Attendance.date).where(Attendance.class_id == class_id, Attendance.date.in_(dates))
+    executor.execute(delete(DailyAttendanceSummary).where(
+        DailyAttendanceSummary.class_id == class_id,
+        DailyAttendanceSummary.date.in_(dates),
+        DailyAttendanceSummary.date.not_in(remaining)
+    ))
+
+    # attendance_service imports this module, so its upsert table is imported here
+    from attendance_service import UPSERT_INSERTS
+    dialect = connection.dialect if connection is not None else db.session.get_bind().dialect
+    dialect_insert = UPSERT_INSERTS.get(dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(DailyAttendanceSummary).from_select(SUMMARY_COLUMNS, counts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['class_id', 'date'],
+            set_={column: stmt.excluded[column] for column in ('present', 'absent', 'late', 'updated_at')}
+        )
+        executor.execute(stmt)
+    else:
+        executor.execute(delete(DailyAttendanceSummary).where(
+            DailyAttendanceSummary.class_id == class_id,
+            DailyAttendanceSummary.date.in_(dates)
+        ))
+        executor.execute(insert(DailyAttendanceSummary).from_select(SUMMARY_COLUMNS, counts))
+
+def rebuild_daily_summaries(class_id=None, connection=None):
+    """
+    Regenerate the summaries from Attendance, for one class or every class
+
+    Does not commit when using db.session. Returns the number of summary rows.
+    """
+    executor = connection or db.session
+    clear = delete(DailyAttendanceSummary)
+    conditions = []
+    if class_id:
+        clear = clear.where(DailyAttendanceSummary.class_id == class_id)
+        conditions.append(Attendance.class_id == class_id)
+
+    executor.execute(clear)
+    result = executor.execute(
+        insert(DailyAttendanceSummary).from_select(SUMMARY_COLUMNS, _grouped_counts(*conditions))
+    )
+    return result.rowcount
+
+def filter_summaries(query, teacher_id, class_id=None, start_date=None, end_date=None):
+    """Restrict a query joined to Class to the teacher's summaries within the filters"""
+    query = query.where(Class.teacher_id == teacher_id)
+    if class_id:
+        query = query.where(DailyAttendanceSummary.class_id == class_id)
+    if start_date:
+        query = query.where(DailyAttendanceSummary.date >= start_date)
+    if end_date:
+        query = query.where(DailyAttendanceSummary.date <= end_date)
+    return query
+
+def get_attendance_rate(teacher_id, start_date=None, end_date=None):
+    """Share of a teacher's records in the range that are Present, or None without records"""
+    query = select(
+        func.sum(DailyAttendanceSummary.present),
+        func.sum(DailyAttendanceSummary.present + DailyAttendanceSummary.absent + DailyAttendanceSummary.late)
+    ).join(Class, Class.id == DailyAttendanceSummary.class_id)
+    present, total = db.session.execute(filter_summaries(query, teacher_id, None, start_date, end_date)).one()
+    return round(present * 100 / total, 1) if total else None
+
+def find_summary_drift(class_id=None):
+    """(class_id, date) keys whose summary does not match a fresh count of Attendance"""
+    conditions = [Attendance.class_id == class_id] if class_id else []
+    expected = {
+        (row[0], row[1]): tuple(row[2:5]) for row in db.session.execute(_grouped_counts(*conditions))
+    }
+    query = select(DailyAttendanceSummary.class_id, DailyAttendanceSummary.date,
+                   DailyAttendanceSummary.present, DailyAttendanceSummary.absent, DailyAttendanceSummary.late)
+    if class_id:
+        query = query.where(DailyAttendanceSummary.class_id == class_id)
+    stored = {(row[0], row[1]): tuple(row[2:5]) for row in db.session.execute(query)}
+
+    keys = set(expected) | set(stored)
+    return sorted(key for key in keys if expected.get(key) != stored.get(key))
+
+def init_summary_commands(app):
+    """Register the `flask summaries` commands"""
+    @app.cli.group('summaries')
+    def summaries_cli():
+        """Daily attendance summaries"""
+
+    @summaries_cli.command('rebuild')
+    @click.option('--class-id', type=int, default=None, help="Only rebuild this class")
+    def rebuild(class_id):
+        """Regenerate the summaries from the attendance records"""
+        count = rebuild_daily_summaries(class_id)
+        db.session.commit()
+        logging.info(f"Rebuilt {count} daily attendance summaries")
+        click.echo(f"Rebuilt {count} daily summaries")
+
+    @summaries_cli.command('check')
+    @click.option('--class-id', type=int, default=None, help="Only check this class")
+    def check(class_id):
+        """Compare the summaries with a fresh count of the attendance records"""
+        drift = find_summary_drift(class_id)
+        for drift_class_id, drift_date in drift:
+            click.echo(f"class {drift_class_id} {drift_date.isoformat()} differs")
+        click.echo(f"{len(drift)} daily summaries differ" if drift else "Daily summaries are up to date")
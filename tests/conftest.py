@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Importing app creates the module-level app; keep it off instance/attendance.db
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='attendance-tests-'), 'app.db')}")
@@ -0,0 +1,53 @@
+import os
+import tempfile
+from datetime import date
+import numpy as np
+import pytest
+from app import create_app
+from database import db
+from models import Teacher, Class, Student, NO_RECORD
+from attendance_service import mark_class_attendance
+from analytics_service import compute_class_metrics, find_at_risk, get_at_risk_report
+
+def test_students_without_dates_are_not_at_risk():
+    metrics = compute_class_metrics(np.full((3, 0), NO_RECORD, dtype=np.int8), np.array([], dtype=np.int64))
+    at_risk, reasons = find_at_risk(metrics)
+
+    assert np.isnan(metrics['percentage']).all()
+    assert not at_risk.any()
+    assert not reasons['low_attendance'].any()
+
+@pytest.fixture
+def app():
+    instance_path = tempfile.mkdtemp(prefix='attendance-analytics-')
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(instance_path, 'analytics.db')}"})
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def test_class_without_attendance_in_report(app):
+    teacher = Teacher(name='Analytics Teacher', email='analytics@example.com')
+    teacher.set_password('analytics')
+    db.session.add(teacher)
+    db.session.flush()
+    marked = Class(name='Marked', subject='Analytics', teacher_id=teacher.id)
+    unmarked = Class(name='Unmarked', subject='Analytics', teacher_id=teacher.id)
+    db.session.add_all([marked, unmarked])
+    db.session.flush()
+    absent_student = Student(name='Absent', student_id='M0001', email='absent@example.com', class_id=marked.id)
+    new_students = [Student(name=f'New {number}', student_id=f'U{number:04d}', email=f'new{number}@example.com',
+                            class_id=unmarked.id) for number in range(2)]
+    db.session.add_all([absent_student] + new_students)
+    db.session.flush()
+    mark_class_attendance(marked.id, date(2026, 3, 2), {absent_student.id: 'Absent'})
+    db.session.commit()
+
+    report = get_at_risk_report(teacher.id)
+
+    unmarked_entry = next(entry for entry in report['classes'] if entry['class_name'] == 'Unmarked')
+    assert unmarked_entry['dates'] == 0
+    assert [student['percentage'] for student in unmarked_entry['students']] == [None, None]
+    assert not any(student['at_risk'] for student in unmarked_entry['students'])
+    assert [student['name'] for student in report['at_risk']] == ['Absent']
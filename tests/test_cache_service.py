@@ -0,0 +1,18 @@
+from flask import Flask
+from cache_service import LRUCache, get_cache, cached
+
+def test_each_app_gets_its_own_backend():
+    default_app, custom_app = Flask('default'), Flask('custom')
+    backend = LRUCache(10)
+    custom_app.config['CACHE_BACKEND'] = backend
+
+    assert get_cache(custom_app) is backend
+    assert isinstance(get_cache(default_app), LRUCache)
+    assert get_cache(default_app) is not backend
+    assert get_cache(default_app) is get_cache(default_app)
+
+def test_cached_values_do_not_leak_between_apps():
+    first, second = Flask('first'), Flask('second')
+    assert cached(first, 'dashboard:1', lambda: 'first') == 'first'
+    assert cached(second, 'dashboard:1', lambda: 'second') == 'second'
+    assert cached(first, 'dashboard:1', lambda: 'reloaded') == 'first'
@@ -0,0 +1,96 @@
+"""
+Offline email delivery checks, driven by the benchmark harness
+
+Starts the local SMTP sink with injected 451 failures, queues a small set of
+synthetic absences and drains the outbox through the dispatcher, then checks
+that every absence ends up either delivered or dead-lettered in line with
+the failure rate.
+"""
+import logging
+import pytest
+from types import SimpleNamespace
+from database import db
+from models import Class, Student, Attendance
+from email_service import get_smtp_pool
+from email_benchmark import load_notifications, run_concurrent, run_dispatcher
+from smtp_sink import SMTPSink
+from synthetic_data import create_benchmark_app, generate_absences
+
+MAX_ATTEMPTS = 3
+
+@pytest.fixture
+def scenario(request):
+    """App, sink and queued absences for one failure rate; yields (app, sink, counts)"""
+    logging.getLogger().setLevel(logging.ERROR)
+    app = create_benchmark_app(OUTBOX_BATCH_SIZE=50, OUTBOX_MAX_ATTEMPTS=MAX_ATTEMPTS,
+                               OUTBOX_MAX_BACKOFF_SECONDS=3600)
+    sink = SMTPSink(failure_rate=request.param, seed=1)
+    with sink, app.app_context():
+        counts = generate_absences(sink.address, teachers=2, classes_per_teacher=2, students_per_class=10,
+                                   absence_rate=0.5)
+        yield app, sink, counts
+        db.session.remove()
+
+@pytest.mark.parametrize('scenario', [0.0], indirect=True)
+def test_dispatcher_delivers_everything_without_failures(scenario):
+    app, sink, counts = scenario
+    result = run_dispatcher(app, 'dispatcher', digest_mode=False)
+
+    assert result['queued'] == counts['absences'] > 0
+    assert result['delivered'] == counts['absences']
+    assert result['retried'] == result['dead'] == 0
+    assert sink.stats['messages'] == counts['absences']
+    assert sink.stats['failed'] == 0
+
+@pytest.mark.parametrize('scenario', [1.0], indirect=True)
+def test_dispatcher_dead_letters_after_max_attempts(scenario):
+    app, sink, counts = scenario
+    result = run_dispatcher(app, 'dispatcher', digest_mode=False)
+
+    assert result['delivered'] == 0
+    assert result['dead'] == counts['absences']
+    assert result['retried'] == counts['absences'] * (MAX_ATTEMPTS - 1)
+    assert sink.stats['failed'] == counts['absences'] * MAX_ATTEMPTS
+
+@pytest.mark.parametrize('scenario', [0.3], indirect=True)
+def test_dispatcher_outcomes_follow_failure_rate(scenario):
+    app, sink, counts = scenario
+    result = run_dispatcher(app, 'dispatcher', digest_mode=False)
+
+    # Every absence is settled, and every 451 was either retried or dead-lettered
+    assert result['delivered'] + result['dead'] == counts['absences']
+    assert sink.stats['messages'] == result['delivered']
+    assert sink.stats['failed'] == result['retried'] + result['dead']
+    attempts = sink.stats['messages'] + sink.stats['failed']
+    assert 0.15 <= sink.stats['failed'] / attempts <= 0.45
+
+@pytest.mark.parametrize('scenario', [0.0], indirect=True)
+def test_digest_spanning_batches_is_sent_once(scenario):
+    app, sink, counts = scenario
+    # A student absent from both of a teacher's classes has messages far apart in the outbox
+    app.config['OUTBOX_BATCH_SIZE'] = 3
+    digests = db.session.query(Class.teacher_id, Student.email, Attendance.date).join(
+        Attendance.student).join(Attendance.class_ref).filter(Attendance.status == 'Absent').distinct().count()
+    result = run_dispatcher(app, 'digest', digest_mode=True)
+
+    assert result['delivered'] == counts['absences']
+    assert digests < counts['absences']
+    assert sink.stats['messages'] == digests
+
+@pytest.mark.parametrize('scenario', [0.3], indirect=True)
+def test_concurrent_sender_reports_each_failure(scenario):
+    app, sink, counts = scenario
+    args = SimpleNamespace(workers=4, teacher_rate=0, teacher_connections=2, server_connections=4)
+    result = run_concurrent(load_notifications(), args)
+
+    assert result['messages'] == counts['absences']
+    assert result['sent'] == sink.stats['messages']
+    assert result['failed'] == sink.stats['failed'] > 0
+
+@pytest.mark.parametrize('scenario', [0.0], indirect=True)
+def test_dispatcher_run_restores_the_shared_pool(scenario):
+    app, _, _ = scenario
+    connect = get_smtp_pool().connect
+    run_dispatcher(app, 'dispatcher', digest_mode=False)
+
+    assert get_smtp_pool().connect is connect
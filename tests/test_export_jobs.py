@@ -0,0 +1,100 @@
+"""
+Export jobs are stored in the database, so every worker process can report
+on them and serve their file. A second app on the same database stands in
+for another worker.
+"""
+import os
+import time
+import tempfile
+from datetime import date, datetime, timedelta
+import pytest
+from app import create_app
+from database import db
+from models import Teacher, Class, Student, ExportJob
+from attendance_service import mark_class_attendance
+import job_service
+
+@pytest.fixture
+def workers():
+    instance_path = tempfile.mkdtemp(prefix='attendance-exports-')
+    config = {'TESTING': True,
+              'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(instance_path, 'exports.db')}"}
+    first, second = create_app(config), create_app(config)
+    with first.app_context():
+        teacher = Teacher(name='Export Teacher', email='export@example.com')
+        teacher.set_password('export')
+        db.session.add(teacher)
+        db.session.flush()
+        class_obj = Class(name='Session', subject='Exports', teacher_id=teacher.id)
+        db.session.add(class_obj)
+        db.session.flush()
+        student = Student(name='Student', student_id='S0001', email='student@example.com', class_id=class_obj.id)
+        db.session.add(student)
+        db.session.flush()
+        mark_class_attendance(class_obj.id, date(2026, 3, 2), {student.id: 'Present'})
+        db.session.commit()
+        ids = {'teacher': teacher.id, 'class': class_obj.id}
+        db.session.remove()
+
+    clients = []
+    for app in (first, second):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['teacher_id'] = ids['teacher']
+        clients.append(client)
+    yield first, second, clients, ids
+
+    for app in (first, second):
+        with app.app_context():
+            db.engine.dispose()
+
+def wait_for_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/export/jobs/{job_id}').get_json()
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Export job {job_id} did not finish")
+
+def test_job_is_visible_to_every_worker(workers):
+    _, _, (first_client, second_client), ids = workers
+
+    response = first_client.post('/export/jobs', data={'class_id': ids['class'], 'format': 'csv'})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    job = wait_for_job(second_client, job_id)
+    assert job['status'] == 'completed'
+    assert job['progress'] == 100
+
+    download = second_client.get(job['download_url'])
+    assert download.status_code == 200
+    assert b'Student' in download.data
+
+def test_expired_and_lost_jobs_are_deleted(workers):
+    first, _, _, ids = workers
+    now = datetime.utcnow()
+    ttl = job_service.DEFAULT_EXPORT_JOB_TTL
+
+    with first.app_context():
+        export_dir = job_service.get_export_dir(first)
+        expired_file = os.path.join(export_dir, 'expired.csv')
+        open(expired_file, 'w').close()
+        db.session.add_all([
+            ExportJob(id='expired', teacher_id=ids['teacher'], class_id=ids['class'], format='csv',
+                      download_name='expired.csv', status='completed', file_path=expired_file,
+                      created_at=now - timedelta(seconds=ttl + 10), finished_at=now - timedelta(seconds=ttl + 5),
+                      expires_at=now - timedelta(seconds=5)),
+            ExportJob(id='lost', teacher_id=ids['teacher'], class_id=ids['class'], format='csv',
+                      download_name='lost.csv', status='running', created_at=now - timedelta(seconds=ttl + 10)),
+            ExportJob(id='running', teacher_id=ids['teacher'], class_id=ids['class'], format='csv',
+                      download_name='running.csv', status='running', created_at=now)
+        ])
+        db.session.commit()
+
+        job_service._last_cleanup = None
+        job_service.cleanup_expired_jobs(first, now=now)
+
+        assert [job.id for job in ExportJob.query.all()] == ['running']
+        assert not os.path.exists(expired_file)
@@ -0,0 +1,92 @@
+"""
+Conversion of the text attendance status to codes (migrations 4 and 5)
+
+Each test starts from a database created from the current models, puts back
+the pre-conversion attendance table and forgets the migrations that changed
+it, then runs the pending migrations the way create_app does at startup.
+"""
+import os
+import tempfile
+from datetime import date
+import pytest
+from sqlalchemy import inspect, text, delete, insert
+from sqlalchemy.exc import IntegrityError
+from app import create_app
+from database import db
+from models import Teacher, Class, Student, EmailOutbox
+from migrations import run_migrations, schema_migrations
+from status_benchmark import LEGACY_ATTENDANCE_TABLE, legacy_attendance
+
+LEGACY_STATUSES = ['Present', ' present', 'Absent', 'LATE', 'Absent']
+
+@pytest.fixture
+def app():
+    instance_path = tempfile.mkdtemp(prefix='attendance-migrations-')
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(instance_path, 'migrations.db')}"})
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def create_legacy_attendance(statuses):
+    """Text-status attendance for one student per status, with an outbox message per absence"""
+    with db.engine.begin() as connection:
+        connection.execute(text("DROP TABLE attendance"))
+        connection.execute(text(LEGACY_ATTENDANCE_TABLE))
+        connection.execute(delete(schema_migrations).where(schema_migrations.c.version.in_([4, 5])))
+
+    teacher = Teacher(name='Migrating Teacher', email='migrating@example.com')
+    teacher.set_password('migrating')
+    db.session.add(teacher)
+    db.session.flush()
+    class_obj = Class(name='Session', subject='Migrations', teacher_id=teacher.id)
+    db.session.add(class_obj)
+    db.session.flush()
+    for number, status in enumerate(statuses):
+        student = Student(name=f'Student {number}', student_id=f'S{number:04d}', email=f's{number}@example.com',
+                          class_id=class_obj.id)
+        db.session.add(student)
+        db.session.flush()
+        attendance_id = db.session.execute(insert(legacy_attendance).values(
+            student_id=student.id, class_id=class_obj.id, date=date(2026, 3, 2), status=status, email_sent=False
+        )).lastrowid
+        if status.strip().lower() == 'absent':
+            db.session.add(EmailOutbox(attendance_id=attendance_id, teacher_id=teacher.id))
+    db.session.commit()
+
+def status_column():
+    return next(column for column in inspect(db.engine).get_columns('attendance') if column['name'] == 'status')
+
+def check_constraints():
+    return {check['name'] for check in inspect(db.engine).get_check_constraints('attendance')}
+
+def test_text_statuses_become_constrained_codes(app):
+    create_legacy_attendance(LEGACY_STATUSES)
+    assert run_migrations() == [4, 5]
+
+    assert not status_column()['nullable']
+    assert 'ck_attendance_status' in check_constraints()
+    assert db.session.execute(text("SELECT status FROM attendance ORDER BY id")).scalars().all() == [1, 1, 2, 3, 2]
+    assert db.session.execute(text(
+        "SELECT COUNT(*) FROM email_outbox JOIN attendance ON attendance.id = email_outbox.attendance_id"
+    )).scalar() == 2
+    assert {index['name'] for index in inspect(db.engine).get_indexes('attendance')} >= {
+        'ix_attendance_class_date', 'ix_attendance_class_marked_at'
+    }
+
+    with pytest.raises(IntegrityError):
+        with db.engine.begin() as connection:
+            connection.execute(text("UPDATE attendance SET status = 7 WHERE id = 1"))
+    assert run_migrations() == []
+
+def test_unknown_status_leaves_the_table_untouched(app):
+    create_legacy_attendance(LEGACY_STATUSES + ['Here'])
+
+    with pytest.raises(ValueError, match='Here'):
+        run_migrations()
+    columns = {column['name'] for column in inspect(db.engine).get_columns('attendance')}
+    assert 'status_code' in columns and 'status_name' not in columns
+    assert 'attendance_rebuilt' not in inspect(db.engine).get_table_names()
+    assert db.session.execute(text("SELECT status FROM attendance ORDER BY id")).scalars().all() == \
+        LEGACY_STATUSES + ['Here']
@@ -0,0 +1,145 @@
+"""
+Per-route query budgets
+
+Renders every view with a @query_budget against a small and a large roster.
+The app runs with TESTING, so a view going over its budget raises
+QueryBudgetExceeded and fails the test. The budgets are a handful of
+statements, so the 300-student roster catches any per-student query.
+"""
+import os
+import logging
+import tempfile
+from datetime import date, timedelta
+import pytest
+from flask import g, request as current_request
+from app import create_app
+from database import db
+from models import Teacher, Class, Student
+from attendance_service import mark_class_attendance
+from query_budget import get_query_budget
+
+ROSTER_SIZES = (5, 300)
+DAYS = 10
+
+@pytest.fixture(scope='module', params=ROSTER_SIZES, ids=lambda size: f'{size}_students')
+def roster(request):
+    """
+    App with one teacher and three classes, two with DAYS days of attendance
+
+    Yields (app, ids, counts) where counts maps each endpoint to the number
+    of statements its last request issued.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    instance_path = tempfile.mkdtemp(prefix='attendance-budget-')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(instance_path, 'budget.db')}"
+    })
+
+    with app.app_context():
+        teacher = Teacher(name='Budget Teacher', email='budget@example.com', smtp_email='budget@example.com',
+                          smtp_server='localhost', smtp_port=2525, email_notifications_enabled=True)
+        teacher.set_password('budget')
+        teacher.set_smtp_password('budget')
+        db.session.add(teacher)
+        db.session.flush()
+
+        class_ids, student_ids = [], []
+        # The last class has no attendance yet, so marking it creates its summaries and bitmaps
+        for class_number in range(3):
+            class_obj = Class(name=f'Session {class_number}', subject='Budgets', teacher_id=teacher.id)
+            db.session.add(class_obj)
+            db.session.flush()
+            students = [
+                Student(name=f'Student {number}', student_id=f'C{class_number}S{number:04d}',
+                        email=f'student{number}@example.com', class_id=class_obj.id)
+                for number in range(request.param)
+            ]
+            db.session.add_all(students)
+            db.session.flush()
+            for day in range(DAYS if class_number < 2 else 0):
+                mark_class_attendance(class_obj.id, date.today() - timedelta(days=DAYS - day), {
+                    student.id: ('Present', 'Absent', 'Late')[(student.id + day) % 3] for student in students
+                })
+            class_ids.append(class_obj.id)
+            student_ids.append(students[0].id)
+
+        # A student who joined after the first class's attendance began has no bitmap yet
+        db.session.add(Student(name='Late Joiner', student_id='C0LATE', email='late@example.com',
+                               class_id=class_ids[0]))
+
+        db.session.commit()
+        ids = {'teacher': teacher.id, 'class': class_ids[0], 'new_class': class_ids[2], 'student': student_ids[0]}
+        db.session.remove()
+
+    counts = {}
+
+    @app.after_request
+    def record_query_count(response):
+        counts[current_request.endpoint] = g.get('query_count', 0)
+        return response
+
+    yield app, ids, counts
+
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def client(roster):
+    app, ids, _ = roster
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['teacher_id'] = ids['teacher']
+        session['teacher_name'] = 'Budget Teacher'
+    return client
+
+# (method, url) of every view with a query budget, formatted with the roster ids
+BUDGETED_REQUESTS = [
+    ('GET', '/dashboard'),
+    ('GET', '/classes'),
+    ('GET', '/classes/{class}/students'),
+    ('GET', '/classes/{class}/attendance'),
+    ('POST', '/classes/{class}/attendance/mark'),
+    ('POST', '/classes/{new_class}/attendance/mark'),
+    ('GET', '/history'),
+    ('GET', '/history?class_id={class}'),
+    ('GET', '/api/history'),
+    ('GET', '/api/history?limit=5'),
+    ('GET', '/analytics/at-risk'),
+    ('GET', '/api/analytics/at-risk'),
+    ('GET', '/api/students/{student}/calendar'),
+    ('GET', '/api/classes/{class}/heatmap')
+]
+
+def match_endpoint(app, method, url):
+    return app.url_map.bind('localhost').match(url.split('?')[0], method=method)[0]
+
+def test_every_budgeted_view_is_covered(roster):
+    app, ids, _ = roster
+    covered = {match_endpoint(app, method, url.format(**ids)) for method, url in BUDGETED_REQUESTS}
+    budgeted = {endpoint for endpoint, view in app.view_functions.items()
+                if getattr(view, 'query_budget', None) is not None}
+    assert budgeted <= covered
+
+@pytest.mark.parametrize('method, url', BUDGETED_REQUESTS, ids=[f'{method} {url}' for method, url in BUDGETED_REQUESTS])
+def test_view_stays_within_budget(roster, client, method, url):
+    app, ids, counts = roster
+    url = url.format(**ids)
+    endpoint = match_endpoint(app, method, url)
+
+    if method == 'POST':
+        class_id = int(url.split('/')[2])
+        with app.app_context():
+            student_ids = [student.id for student in Student.query.filter_by(class_id=class_id)]
+        form = {'date': date.today().strftime('%Y-%m-%d')}
+        form.update({f'attendance_{student_id}': 'Absent' if student_id % 4 == 0 else 'Present'
+                     for student_id in student_ids})
+        response = client.post(url, data=form)
+        assert response.status_code == 302
+        assert '/attendance' in response.headers['Location']
+    else:
+        response = client.get(url)
+        assert response.status_code == 200
+
+    with app.app_context():
+        assert counts[endpoint] <= get_query_budget(endpoint)
@@ -0,0 +1,42 @@
+import smtplib
+from email.mime.text import MIMEText
+import pytest
+from email_service import SMTPConnectionPool, SMTPSettings
+from smtp_sink import SMTPSink, plain_smtp_connection
+
+def make_messages(count):
+    messages = []
+    for number in range(count):
+        msg = MIMEText(f'Message {number}')
+        msg['To'] = f'parent{number}@example.com'
+        messages.append(msg)
+    return messages
+
+@pytest.fixture
+def sink():
+    with SMTPSink(seed=1) as sink:
+        yield sink
+
+@pytest.fixture
+def settings(sink):
+    host, port = sink.address
+    return SMTPSettings(host, port, 'teacher@example.com', 'secret')
+
+def test_drop_after_data_is_not_resent(sink, settings):
+    sink.drop_rate = 1.0
+    pool = SMTPConnectionPool(connect=plain_smtp_connection)
+
+    outcomes = pool.send_messages(settings, make_messages(3))
+
+    assert all(isinstance(error, smtplib.SMTPServerDisconnected) for error in outcomes)
+    assert sink.stats['dropped'] == 3
+
+def test_stale_session_is_replaced_before_data(sink, settings):
+    pool = SMTPConnectionPool(connect=plain_smtp_connection, noop_interval=3600)
+    server = plain_smtp_connection(settings)
+    server.sock.close()
+    pool.release(settings, server)
+
+    assert pool.send_messages(settings, make_messages(1)) == [None]
+    assert sink.stats['messages'] == 1
+    pool.close_all()
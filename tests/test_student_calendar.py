@@ -0,0 +1,91 @@
+import os
+import tempfile
+from datetime import date, timedelta
+import pytest
+from app import create_app
+from database import db
+from models import Teacher, Class, Student
+from attendance_service import mark_class_attendance
+from bitmap_service import StatusBitmap, aligned_origin, MAX_HEATMAP_DAYS
+
+FIRST_DAY = date(2026, 3, 2)
+LAST_DAY = date(2026, 3, 17)
+
+def test_recorded_span_ignores_padding():
+    packed = StatusBitmap(aligned_origin(FIRST_DAY))
+    assert packed.recorded_span() is None
+
+    packed.set(FIRST_DAY, 1)
+    packed.set(LAST_DAY, 2)
+    assert packed.origin < FIRST_DAY or packed.end - timedelta(days=1) > LAST_DAY
+    assert packed.recorded_span() == (FIRST_DAY, LAST_DAY)
+
+    packed.set(LAST_DAY, 0)
+    assert packed.recorded_span() == (FIRST_DAY, FIRST_DAY)
+
+@pytest.fixture
+def client():
+    instance_path = tempfile.mkdtemp(prefix='attendance-calendar-')
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(instance_path, 'calendar.db')}"})
+    with app.app_context():
+        teacher = Teacher(name='Calendar Teacher', email='calendar@example.com')
+        teacher.set_password('calendar')
+        db.session.add(teacher)
+        db.session.flush()
+        class_obj = Class(name='Session', subject='Calendars', teacher_id=teacher.id)
+        db.session.add(class_obj)
+        db.session.flush()
+        student = Student(name='Student', student_id='S0001', email='student@example.com', class_id=class_obj.id)
+        db.session.add(student)
+        db.session.flush()
+        for day, status in ((FIRST_DAY, 'Present'), (FIRST_DAY + timedelta(days=1), 'Absent'), (LAST_DAY, 'Late')):
+            mark_class_attendance(class_obj.id, day, {student.id: status})
+        db.session.commit()
+        teacher_id, class_id, student_id = teacher.id, class_obj.id, student.id
+        db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['teacher_id'] = teacher_id
+    client.class_id, client.student_id = class_id, student_id
+    yield client
+    with app.app_context():
+        db.engine.dispose()
+
+def test_calendar_defaults_to_recorded_days(client):
+    calendar = client.get(f'/api/students/{client.student_id}/calendar').get_json()
+
+    assert calendar['start'] == FIRST_DAY.isoformat()
+    assert calendar['end'] == LAST_DAY.isoformat()
+    assert calendar['counts'] == {'Present': 1, 'Absent': 1, 'Late': 1}
+    assert len(calendar['days']) == 3
+
+def test_calendar_rejects_ranges_over_the_cap(client):
+    response = client.get(f'/api/students/{client.student_id}/calendar?start_date=0001-01-01&end_date=9999-12-31')
+    assert response.status_code == 400
+
+    end = FIRST_DAY + timedelta(days=MAX_HEATMAP_DAYS - 1)
+    response = client.get(f'/api/students/{client.student_id}/calendar?start_date={FIRST_DAY}&end_date={end}')
+    assert response.status_code == 200
+    assert response.get_json()['end'] == end.isoformat()
+
+def test_open_ended_range_only_reads_recorded_days(client):
+    response = client.get(f'/api/students/{client.student_id}/calendar?start_date=0001-01-01')
+    calendar = response.get_json()
+
+    assert response.status_code == 200
+    assert calendar['start'] == '0001-01-01'
+    assert calendar['end'] == LAST_DAY.isoformat()
+    assert calendar['counts'] == {'Present': 1, 'Absent': 1, 'Late': 1}
+
+def test_marking_is_limited_to_the_markable_range(client):
+    for day in ('9999-12-31', '1999-12-31', 'not-a-date'):
+        response = client.post(f'/classes/{client.class_id}/attendance/mark',
+                               data={'date': day, f'attendance_{client.student_id}': 'Absent'})
+        assert response.status_code == 302
+        assert response.headers['Location'].endswith(f'/classes/{client.class_id}/attendance')
+
+    calendar = client.get(f'/api/students/{client.student_id}/calendar').get_json()
+    assert calendar['start'] == FIRST_DAY.isoformat()
+    assert calendar['end'] == LAST_DAY.isoformat()